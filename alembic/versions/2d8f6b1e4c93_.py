@@ -0,0 +1,104 @@
+"""add canonical references for merged patients
+
+Revision ID: 2d8f6b1e4c93
+Revises: 5c2e8a71d3f0
+Create Date: 2026-10-18 12:20:05.662190
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = '2d8f6b1e4c93'
+down_revision = '5c2e8a71d3f0'
+branch_labels = None
+depends_on = None
+
+import datetime
+
+from alembic import op
+import sqlalchemy as sa
+
+
+def get_canonical_references(merges):
+    """ follows the existing merges to the end of their chains
+    """
+    canonical_references = {}
+
+    for gloss_reference_id in merges:
+        seen = set()
+        canonical_reference_id = gloss_reference_id
+
+        while canonical_reference_id in merges:
+            if canonical_reference_id in seen:
+                raise ValueError(
+                    "merges for gloss reference {} form a cycle".format(
+                        gloss_reference_id
+                    )
+                )
+            seen.add(canonical_reference_id)
+            canonical_reference_id = merges[canonical_reference_id]
+
+        canonical_references[gloss_reference_id] = canonical_reference_id
+
+    return canonical_references
+
+
+def upgrade():
+    canonical_reference = op.create_table(
+        'canonicalreference',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('updated', sa.DateTime(), nullable=True),
+        sa.Column('created', sa.DateTime(), nullable=True),
+        sa.Column('gloss_reference_id', sa.Integer(), nullable=False),
+        sa.Column('canonical_reference_id', sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(
+            ['gloss_reference_id'], ['glossolaliareference.id'],
+        ),
+        sa.ForeignKeyConstraint(
+            ['canonical_reference_id'], ['glossolaliareference.id'],
+        ),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(
+        op.f('ix_canonicalreference_gloss_reference_id'),
+        'canonicalreference',
+        ['gloss_reference_id'],
+        unique=True
+    )
+    op.create_index(
+        op.f('ix_canonicalreference_canonical_reference_id'),
+        'canonicalreference',
+        ['canonical_reference_id'],
+        unique=False
+    )
+
+    merges = dict(op.get_bind().execute(sa.text(
+        "SELECT gloss_reference_id, new_reference_id FROM merge "
+        "WHERE gloss_reference_id IS NOT NULL "
+        "AND new_reference_id IS NOT NULL"
+    )).fetchall())
+    now = datetime.datetime.utcnow()
+    rows = [
+        dict(
+            created=now,
+            gloss_reference_id=gloss_reference_id,
+            canonical_reference_id=canonical_reference_id
+        )
+        for gloss_reference_id, canonical_reference_id in get_canonical_references(
+            merges
+        ).items()
+    ]
+
+    if rows:
+        op.bulk_insert(canonical_reference, rows)
+
+
+def downgrade():
+    op.drop_index(
+        op.f('ix_canonicalreference_canonical_reference_id'),
+        table_name='canonicalreference'
+    )
+    op.drop_index(
+        op.f('ix_canonicalreference_gloss_reference_id'),
+        table_name='canonicalreference'
+    )
+    op.drop_table('canonicalreference')
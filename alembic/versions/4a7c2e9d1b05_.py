@@ -0,0 +1,134 @@
+"""move result observations from json into their own table
+
+Revision ID: 4a7c2e9d1b05
+Revises: 8e4b1f6a2c57
+Create Date: 2026-10-18 15:11:47.290318
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = '4a7c2e9d1b05'
+down_revision = '8e4b1f6a2c57'
+branch_labels = None
+depends_on = None
+
+import datetime
+import json
+from collections import defaultdict
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# the keys of an observation in a ResultMessage
+FIELDS = (
+    "value_type",
+    "test_code",
+    "test_name",
+    "observation_value",
+    "units",
+    "reference_range",
+    "result_status",
+    "comments",
+)
+
+# how many results we convert at a time
+BATCH_SIZE = 1000
+
+
+def upgrade():
+    observation = op.create_table(
+        'observation',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('updated', sa.DateTime(), nullable=True),
+        sa.Column('created', sa.DateTime(), nullable=True),
+        sa.Column('result_id', sa.Integer(), nullable=False),
+        sa.Column('gloss_reference_id', sa.Integer(), nullable=True),
+        sa.Column('observation_datetime', sa.DateTime(), nullable=True),
+        sa.Column('position', sa.Integer(), nullable=False),
+        sa.Column('value_type', sa.String(length=250), nullable=True),
+        sa.Column('test_code', sa.String(length=250), nullable=True),
+        sa.Column('test_name', sa.String(length=250), nullable=True),
+        sa.Column('observation_value', sa.Text(), nullable=True),
+        sa.Column('units', sa.String(length=250), nullable=True),
+        sa.Column('reference_range', sa.String(length=250), nullable=True),
+        sa.Column('result_status', sa.String(length=250), nullable=True),
+        sa.Column('comments', sa.Text(), nullable=True),
+        sa.ForeignKeyConstraint(['result_id'], ['result.id'], ),
+        sa.ForeignKeyConstraint(
+            ['gloss_reference_id'], ['glossolaliareference.id'],
+        ),
+        sa.PrimaryKeyConstraint('id')
+    )
+
+    results = op.get_bind().execute(sa.text(
+        "SELECT id, gloss_reference_id, observation_datetime, observations "
+        "FROM result WHERE observations IS NOT NULL"
+    ))
+    now = datetime.datetime.utcnow()
+
+    while True:
+        batch = results.fetchmany(BATCH_SIZE)
+
+        if not batch:
+            break
+
+        rows = []
+
+        for result_id, gloss_reference_id, observation_datetime, observations in batch:
+            for position, i in enumerate(json.loads(observations)):
+                row = dict(
+                    created=now,
+                    result_id=result_id,
+                    gloss_reference_id=gloss_reference_id,
+                    observation_datetime=observation_datetime,
+                    position=position
+                )
+                row.update((field, i.get(field)) for field in FIELDS)
+                rows.append(row)
+
+        if rows:
+            op.bulk_insert(observation, rows)
+
+    op.create_index(
+        op.f('ix_observation_result_id'),
+        'observation',
+        ['result_id'],
+        unique=False
+    )
+    op.create_index(
+        'ix_observation_gloss_reference_id_test_code_observation_datetime',
+        'observation',
+        ['gloss_reference_id', 'test_code', 'observation_datetime'],
+        unique=False
+    )
+    op.drop_column('result', 'observations')
+
+
+def downgrade():
+    op.add_column(
+        'result', sa.Column('observations', sa.Text(), nullable=True)
+    )
+
+    observations = defaultdict(list)
+    rows = op.get_bind().execute(sa.text(
+        "SELECT result_id, {} FROM observation "
+        "ORDER BY result_id, position".format(", ".join(FIELDS))
+    ))
+
+    for row in rows:
+        observations[row[0]].append(dict(zip(FIELDS, row[1:])))
+
+    for result_id, result_observations in observations.items():
+        op.get_bind().execute(
+            sa.text("UPDATE result SET observations = :observations WHERE id = :id"),
+            observations=json.dumps(result_observations),
+            id=result_id
+        )
+
+    op.drop_index(
+        'ix_observation_gloss_reference_id_test_code_observation_datetime',
+        table_name='observation'
+    )
+    op.drop_index(op.f('ix_observation_result_id'), table_name='observation')
+    op.drop_table('observation')
@@ -0,0 +1,57 @@
+"""add the outbox
+
+Revision ID: 5c2e8a71d3f0
+Revises: 9f9d4bda54b0
+Create Date: 2026-10-18 11:02:47.118503
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = '5c2e8a71d3f0'
+down_revision = '9f9d4bda54b0'
+branch_labels = None
+depends_on = None
+
+from alembic import op
+import sqlalchemy as sa
+
+
+def upgrade():
+    op.create_table(
+        'outboxmessage',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('updated', sa.DateTime(), nullable=True),
+        sa.Column('created', sa.DateTime(), nullable=True),
+        sa.Column('end_point', sa.String(length=250), nullable=False),
+        sa.Column('hospital_number', sa.String(length=250), nullable=True),
+        sa.Column('issuing_source', sa.String(length=250), nullable=True),
+        sa.Column('payload', sa.Text(), nullable=False),
+        sa.Column('attempts', sa.Integer(), nullable=False),
+        sa.Column('next_attempt', sa.DateTime(), nullable=True),
+        sa.Column('last_error', sa.Text(), nullable=True),
+        sa.Column('dead', sa.Boolean(), nullable=False),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(
+        'ix_outboxmessage_end_point_dead_id',
+        'outboxmessage',
+        ['end_point', 'dead', 'id'],
+        unique=False
+    )
+    op.create_index(
+        'ix_outboxmessage_issuing_source_hospital_number_id',
+        'outboxmessage',
+        ['issuing_source', 'hospital_number', 'id'],
+        unique=False
+    )
+
+
+def downgrade():
+    op.drop_index(
+        'ix_outboxmessage_issuing_source_hospital_number_id',
+        table_name='outboxmessage'
+    )
+    op.drop_index(
+        'ix_outboxmessage_end_point_dead_id', table_name='outboxmessage'
+    )
+    op.drop_table('outboxmessage')
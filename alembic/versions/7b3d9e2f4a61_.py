@@ -0,0 +1,54 @@
+"""a patient only has one set of demographics
+
+Revision ID: 7b3d9e2f4a61
+Revises: 4a7c2e9d1b05
+Create Date: 2026-10-18 17:40:12.503917
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = '7b3d9e2f4a61'
+down_revision = '4a7c2e9d1b05'
+branch_labels = None
+depends_on = None
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# merges used to move a patient's demographics onto a patient that
+# already had them, we can't tell which were which so keep the ones
+# that were updated last
+DUPLICATE_PATIENTS = """
+DELETE FROM patient WHERE id IN (
+    SELECT id FROM (
+        SELECT id, row_number() OVER (
+            PARTITION BY gloss_reference_id
+            ORDER BY COALESCE(updated, created) DESC NULLS LAST, id DESC
+        ) AS position
+        FROM patient
+    ) AS versions
+    WHERE position > 1
+)
+"""
+
+
+def upgrade():
+    op.get_bind().execute(sa.text(DUPLICATE_PATIENTS))
+    op.drop_index(op.f('ix_patient_gloss_reference_id'), table_name='patient')
+    op.create_index(
+        op.f('ix_patient_gloss_reference_id'),
+        'patient',
+        ['gloss_reference_id'],
+        unique=True
+    )
+
+
+def downgrade():
+    op.drop_index(op.f('ix_patient_gloss_reference_id'), table_name='patient')
+    op.create_index(
+        op.f('ix_patient_gloss_reference_id'),
+        'patient',
+        ['gloss_reference_id'],
+        unique=False
+    )
@@ -0,0 +1,102 @@
+"""one result per lab number and profile, with the superseded versions
+in resulthistory
+
+Revision ID: 8e4b1f6a2c57
+Revises: 2d8f6b1e4c93
+Create Date: 2026-10-18 14:02:31.418730
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = '8e4b1f6a2c57'
+down_revision = '2d8f6b1e4c93'
+branch_labels = None
+depends_on = None
+
+import datetime
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# for every result that's been saved more than once keeps the newest
+# as result_id, and every other copy as a row to move into resulthistory
+DUPLICATE_RESULTS = """
+SELECT id, result_id, last_edited, result_status, observations FROM (
+    SELECT
+        id,
+        first_value(id) OVER latest AS result_id,
+        row_number() OVER latest AS position,
+        last_edited,
+        result_status,
+        observations
+    FROM result
+    WHERE lab_number IS NOT NULL AND profile_code IS NOT NULL
+    WINDOW latest AS (
+        PARTITION BY gloss_reference_id, lab_number, profile_code
+        ORDER BY last_edited DESC NULLS LAST, id DESC
+    )
+) AS versions
+WHERE position > 1
+"""
+
+
+def upgrade():
+    result_history = op.create_table(
+        'resulthistory',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('updated', sa.DateTime(), nullable=True),
+        sa.Column('created', sa.DateTime(), nullable=True),
+        sa.Column('result_id', sa.Integer(), nullable=False),
+        sa.Column('last_edited', sa.DateTime(), nullable=True),
+        sa.Column('result_status', sa.String(length=250), nullable=True),
+        sa.Column('observations', sa.Text(), nullable=True),
+        sa.ForeignKeyConstraint(['result_id'], ['result.id'], ),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(
+        op.f('ix_resulthistory_result_id'),
+        'resulthistory',
+        ['result_id'],
+        unique=False
+    )
+
+    duplicates = op.get_bind().execute(sa.text(DUPLICATE_RESULTS)).fetchall()
+
+    if duplicates:
+        now = datetime.datetime.utcnow()
+        op.bulk_insert(result_history, [
+            dict(
+                created=now,
+                result_id=result_id,
+                last_edited=last_edited,
+                result_status=result_status,
+                observations=observations
+            )
+            for _, result_id, last_edited, result_status, observations
+            in duplicates
+        ])
+
+        # psycopg2 expands a tuple into the IN list
+        op.get_bind().execute(
+            sa.text("DELETE FROM result WHERE id IN :ids"),
+            ids=tuple(i[0] for i in duplicates)
+        )
+
+    op.create_index(
+        'ix_result_gloss_reference_id_lab_number_profile_code',
+        'result',
+        ['gloss_reference_id', 'lab_number', 'profile_code'],
+        unique=True
+    )
+
+
+def downgrade():
+    op.drop_index(
+        'ix_result_gloss_reference_id_lab_number_profile_code',
+        table_name='result'
+    )
+    op.drop_index(
+        op.f('ix_resulthistory_result_id'), table_name='resulthistory'
+    )
+    op.drop_table('resulthistory')
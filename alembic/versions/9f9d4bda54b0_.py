@@ -0,0 +1,240 @@
+"""add indexes and unique constraints for identifier lookups
+
+Revision ID: 9f9d4bda54b0
+Revises: b1af9829fc8d
+Create Date: 2026-10-18 10:12:31.402214
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = '9f9d4bda54b0'
+down_revision = 'b1af9829fc8d'
+branch_labels = None
+depends_on = None
+
+from alembic import op
+import sqlalchemy as sa
+
+
+GLOSS_REFERENCE_TABLES = [
+    'patient', 'inpatientadmission', 'patientidentifier', 'allergy', 'result'
+]
+
+ONE_PER_GLOSS_REFERENCE_TABLES = ['merge', 'subscription']
+
+# before we had the unique constraints we could save the same patient
+# identifier twice, each with its own gloss reference, we keep the first
+DUPLICATE_IDENTIFIERS = """
+SELECT id, gloss_reference_id, kept_reference_id FROM (
+    SELECT
+        id,
+        gloss_reference_id,
+        first_value(gloss_reference_id) OVER identifiers AS kept_reference_id,
+        row_number() OVER identifiers AS position
+    FROM patientidentifier
+    WINDOW identifiers AS (
+        PARTITION BY issuing_source, identifier ORDER BY id
+    )
+) AS versions
+WHERE position > 1
+"""
+
+# a repeated merge message used to save another merge, the latest is the
+# one that counts
+DUPLICATE_MERGES = """
+DELETE FROM merge WHERE id IN (
+    SELECT id FROM (
+        SELECT id, row_number() OVER (
+            PARTITION BY gloss_reference_id ORDER BY id DESC
+        ) AS position
+        FROM merge
+    ) AS versions
+    WHERE position > 1
+)
+"""
+
+# keep the active subscription if there is one, otherwise the latest
+DUPLICATE_SUBSCRIPTIONS = """
+DELETE FROM subscription WHERE id IN (
+    SELECT id FROM (
+        SELECT id, row_number() OVER (
+            PARTITION BY gloss_reference_id ORDER BY active DESC, id DESC
+        ) AS position
+        FROM subscription
+    ) AS versions
+    WHERE position > 1
+)
+"""
+
+# for each admission that's been saved more than once keeps the latest
+DUPLICATE_ADMISSIONS = """
+SELECT id, kept_id FROM (
+    SELECT
+        id,
+        first_value(id) OVER admissions AS kept_id,
+        row_number() OVER admissions AS position
+    FROM inpatientadmission
+    WINDOW admissions AS (
+        PARTITION BY external_identifier ORDER BY id DESC
+    )
+) AS versions
+WHERE position > 1
+"""
+
+# a patient can only be in one place at a time, we don't know when they
+# left the others so say it was when we last heard about them
+DUPLICATE_CURRENT_LOCATIONS = """
+UPDATE inpatientlocation SET datetime_of_transfer = COALESCE(updated, created)
+WHERE id IN (
+    SELECT id FROM (
+        SELECT id, row_number() OVER (
+            PARTITION BY inpatient_admission_id ORDER BY id DESC
+        ) AS position
+        FROM inpatientlocation
+        WHERE datetime_of_transfer IS NULL
+    ) AS versions
+    WHERE position > 1
+)
+"""
+
+
+def repoint_gloss_reference(connection, gloss_reference_id, kept_reference_id):
+    for table in GLOSS_REFERENCE_TABLES + ONE_PER_GLOSS_REFERENCE_TABLES:
+        connection.execute(
+            sa.text(
+                "UPDATE {} SET gloss_reference_id = :kept "
+                "WHERE gloss_reference_id = :duplicate".format(table)
+            ),
+            kept=kept_reference_id,
+            duplicate=gloss_reference_id
+        )
+
+    connection.execute(
+        sa.text(
+            "UPDATE merge SET new_reference_id = :kept "
+            "WHERE new_reference_id = :duplicate"
+        ),
+        kept=kept_reference_id,
+        duplicate=gloss_reference_id
+    )
+
+
+def remove_duplicates(connection):
+    """ the data we saved before these constraints can break them, so
+        collapse the duplicates first
+    """
+    duplicates = connection.execute(sa.text(DUPLICATE_IDENTIFIERS)).fetchall()
+
+    for identifier_id, gloss_reference_id, kept_reference_id in duplicates:
+        connection.execute(
+            sa.text("DELETE FROM patientidentifier WHERE id = :id"),
+            id=identifier_id
+        )
+
+        if gloss_reference_id != kept_reference_id:
+            repoint_gloss_reference(
+                connection, gloss_reference_id, kept_reference_id
+            )
+
+    # repointing can merge a patient into itself
+    connection.execute(sa.text(
+        "DELETE FROM merge WHERE gloss_reference_id = new_reference_id"
+    ))
+    connection.execute(sa.text(DUPLICATE_MERGES))
+    connection.execute(sa.text(DUPLICATE_SUBSCRIPTIONS))
+
+    duplicates = connection.execute(sa.text(DUPLICATE_ADMISSIONS)).fetchall()
+
+    for admission_id, kept_id in duplicates:
+        connection.execute(
+            sa.text(
+                "UPDATE inpatientlocation SET inpatient_admission_id = :kept "
+                "WHERE inpatient_admission_id = :duplicate"
+            ),
+            kept=kept_id,
+            duplicate=admission_id
+        )
+        connection.execute(
+            sa.text("DELETE FROM inpatientadmission WHERE id = :id"),
+            id=admission_id
+        )
+
+    connection.execute(sa.text(DUPLICATE_CURRENT_LOCATIONS))
+
+
+def upgrade():
+    remove_duplicates(op.get_bind())
+
+    for table in GLOSS_REFERENCE_TABLES:
+        op.create_index(
+            op.f('ix_{}_gloss_reference_id'.format(table)),
+            table,
+            ['gloss_reference_id'],
+            unique=False
+        )
+
+    for table in ONE_PER_GLOSS_REFERENCE_TABLES:
+        op.create_index(
+            op.f('ix_{}_gloss_reference_id'.format(table)),
+            table,
+            ['gloss_reference_id'],
+            unique=True
+        )
+
+    # followed by the recursive merge queries
+    op.create_index(
+        op.f('ix_merge_new_reference_id'),
+        'merge',
+        ['new_reference_id'],
+        unique=False
+    )
+    op.create_unique_constraint(
+        'patientidentifier_issuing_source_identifier_key',
+        'patientidentifier',
+        ['issuing_source', 'identifier']
+    )
+    op.create_index(
+        op.f('ix_inpatientadmission_external_identifier'),
+        'inpatientadmission',
+        ['external_identifier'],
+        unique=True
+    )
+    op.create_index(
+        'ix_inpatientlocation_inpatient_admission_id_datetime_of_transfer',
+        'inpatientlocation',
+        ['inpatient_admission_id', 'datetime_of_transfer'],
+        unique=False
+    )
+    op.create_index(
+        'ix_inpatientlocation_current_location',
+        'inpatientlocation',
+        ['inpatient_admission_id'],
+        unique=True,
+        postgresql_where=sa.text('datetime_of_transfer IS NULL')
+    )
+
+
+def downgrade():
+    op.drop_index(
+        'ix_inpatientlocation_current_location',
+        table_name='inpatientlocation'
+    )
+    op.drop_index(
+        'ix_inpatientlocation_inpatient_admission_id_datetime_of_transfer',
+        table_name='inpatientlocation'
+    )
+    op.drop_index(
+        op.f('ix_inpatientadmission_external_identifier'),
+        table_name='inpatientadmission'
+    )
+    op.drop_index(op.f('ix_merge_new_reference_id'), table_name='merge')
+    op.drop_constraint(
+        'patientidentifier_issuing_source_identifier_key',
+        'patientidentifier',
+        type_='unique'
+    )
+
+    for table in GLOSS_REFERENCE_TABLES + ONE_PER_GLOSS_REFERENCE_TABLES:
+        op.drop_index(
+            op.f('ix_{}_gloss_reference_id'.format(table)), table_name=table
+        )
@@ -72,6 +72,47 @@ def result_query(issuing_source, identifier):
     return result.to_dict()
 
 
+@json_api('/api/observations/<identifier>')
+def observation_query(session, issuing_source, identifier):
+    """ Returns the latest observations of each test a patient has had,
+        the tests can be restricted with test_code and how many of each
+        with limit
+    """
+    gloss_reference = models.get_gloss_reference(
+        identifier, session, issuing_source=issuing_source
+    )
+
+    if gloss_reference is None:
+        raise exceptions.APIError(
+            "We can't find any patients with that identifier"
+        )
+
+    test_codes = request.values.getlist("test_code") or None
+
+    try:
+        limit = int(request.values.get("limit", 1))
+    except ValueError:
+        limit = None
+
+    if limit is None or limit < 1:
+        raise exceptions.APIError("limit should be a positive whole number")
+
+    observations = models.Observation.get_latest(
+        gloss_reference.id, session, test_codes=test_codes, limit=limit
+    )
+
+    return dict(
+        hospital_number=identifier,
+        observations={
+            test_code: [
+                dict(i.to_dict(), observation_datetime=i.observation_datetime)
+                for i in test_observations
+            ]
+            for test_code, test_observations in observations.items()
+        }
+    )
+
+
 @json_api('/api/demographics/', methods=['POST'])
 def demographics_create(session, issuing_source):
     raise exceptions.APIError("We've not implemented this yet - sorry")
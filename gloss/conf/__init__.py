@@ -26,11 +26,55 @@ class BaseSetting(object):
     SEND_MLLP_TO_SELF = True
     DEMOGRAPHICS_HOST = "USOAAPT"
     DEMOGRAPHICS_PORT = 8155
+    DEMOGRAPHICS_POOL_SIZE = 4
+    DEMOGRAPHICS_TIMEOUT = 10
+
+    # how many patients upstream doesn't know about we remember, and
+    # for how many seconds
+    NOT_FOUND_CACHE_SIZE = 10000
+    NOT_FOUND_CACHE_TTL = 300
     USE_EXTERNAL_LOOKUP = True
     SEND_MESSAGES_CONSOLE = True
     MOCK_EXTERNAL_API = None
     MOCK_API = None
 
+    # drop incoming messages for patients nobody is subscribed to before
+    # we translate them, see gloss.importers.hl7_importer.HL7Importer
+    FILTER_UNSUBSCRIBED = False
+
+    # how many seconds old the set of subscribed patients can be before
+    # a message for a patient who isn't in it has it reloaded
+    SUBSCRIBED_PATIENTS_TTL = 5
+
+    # keep the versions of a result that have been superseded,
+    # see gloss.models.save_result
+    SAVE_RESULT_HISTORY = False
+
+    # how many patients gloss.models.identity_cache remembers, and for
+    # how many seconds it trusts what it knows about their subscriptions
+    IDENTITY_CACHE_SIZE = 10000
+    IDENTITY_CACHE_TTL = 5
+
+    # how many outgoing message ids each process reserves at a time
+    MESSAGE_ID_BLOCK_SIZE = 100
+
+    # share one session and commit between all the subscribers of a
+    # message, so one subscriber failing rolls back the others too. By
+    # default each subscriber has its own transaction
+    UNIT_OF_WORK = False
+
+    # how we post messages to opal, see gloss.serialisers.opal.OpalSender
+    OPAL_MAX_CONNECTIONS = 4
+    OPAL_TIMEOUT = 10
+    OPAL_RETRIES = 3
+    OPAL_RETRY_BACKOFF = 1
+
+    # how gloss.subscribers.outbox.OutboxDispatcher drains the outbox
+    OUTBOX_BATCH_SIZE = 50
+    OUTBOX_INTERVAL = 5
+    OUTBOX_MAX_ATTEMPTS = 10
+    OUTBOX_MAX_BACKOFF = 600
+
     GLOSS_SERVICE = "gloss.gloss_service.GLOSS_SERVICE"
 
 
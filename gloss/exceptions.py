@@ -13,9 +13,19 @@ class APIError(Error):
         super(APIError, self).__init__(*a, **kw)
 
 
+class UpstreamPatientNotFound(APIError):
+    """ an upstream system has told us it doesn't know about a patient
+    """
+    pass
+
+
 class TranslatorError(Exception):
     pass
 
 
 class PatientNotFound(Error):
     pass
+
+
+class MLLPError(Error):
+    pass
@@ -1,7 +1,5 @@
-from copy import copy
 from datetime import datetime
 
-from hl7 import client
 from hl7.containers import Message
 import hl7
 
@@ -12,6 +10,7 @@ from gloss.message_type import (
     PatientMessage
 )
 from gloss.conf import settings
+from gloss.mllp_client import MLLPConnectionPool
 
 try:
     from flask import current_app
@@ -65,10 +64,24 @@ def generate_demographics_query_message(identifier):
     return query_msg
 
 
+_demographics_pool = None
+
+
+def get_demographics_pool():
+    global _demographics_pool
+
+    if _demographics_pool is None:
+        _demographics_pool = MLLPConnectionPool(
+            settings.DEMOGRAPHICS_HOST,
+            settings.DEMOGRAPHICS_PORT,
+            size=settings.DEMOGRAPHICS_POOL_SIZE,
+            timeout=settings.DEMOGRAPHICS_TIMEOUT
+        )
+    return _demographics_pool
+
+
 def send_message(some_message):
-    with client.MLLPClient(settings.DEMOGRAPHICS_HOST, settings.DEMOGRAPHICS_PORT) as c:
-        response = c.send_message(some_message)
-    return response
+    return get_demographics_pool().send_message(some_message)
 
 
 def post_message_for_identifier(some_identifier):
@@ -83,7 +96,7 @@ def post_message_for_identifier(some_identifier):
     errored = DemographicsErrorResponse(unparsed_message)
 
     if errored.msa.error_code:
-        raise exceptions.APIError(
+        raise exceptions.UpstreamPatientNotFound(
             "We can't find any patients with that identifier"
         )
 
@@ -97,7 +110,7 @@ def save_message(demographics_message, hospital_number, session):
     gloss_ref = models.get_or_create_identifier(
         hospital_number, session, "uclh"
     )
-    kwargs = copy(vars(demographics_message))
+    kwargs = demographics_message.field_values()
     kwargs["gloss_reference"] = gloss_ref
     patient = models.Patient(**kwargs)
     session.add(patient)
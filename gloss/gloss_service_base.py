@@ -1,10 +1,56 @@
+from gloss.conf import settings
+from gloss.models import session_scope
+
+
 class GlossService(object):
-    def __init__(self, receiver, importer, subscribers, issuing_source):
+    """ In unit of work mode all subscribers share a session, and so a
+        single commit, per message container. Otherwise each subscriber
+        manages its own so a failing subscriber doesn't roll back the
+        others. If unit_of_work isn't passed in we use settings.UNIT_OF_WORK
+
+        Workers are like receivers, functions that take the gloss service
+        and return a twisted service that's run alongside the receiver,
+        e.g. gloss.subscribers.outbox.OutboxDispatcher.make_service
+    """
+    def __init__(
+        self, receiver, importer, subscribers, issuing_source,
+        unit_of_work=None, workers=None
+    ):
         self.receiver = receiver
         self.importer = importer
         self.subscribers = subscribers
         self.issuing_source = issuing_source
+        self._unit_of_work = unit_of_work
+        self.workers = workers or []
+
+    @property
+    def unit_of_work(self):
+        if self._unit_of_work is None:
+            return settings.UNIT_OF_WORK
+        return self._unit_of_work
+
+    def make_service(self):
+        """ the receiver's service with our workers added to it
+        """
+        service = self.receiver(self)
+
+        for worker in self.workers:
+            worker(self).setServiceParent(service)
+
+        return service
+
+    def notify_subscribers(self, message_container, session=None):
+        """ if a session is passed in all subscribers share it, otherwise
+            in unit of work mode we open one for them, else they're left
+            to manage their own
+        """
+        if session is None and self.unit_of_work:
+            with session_scope() as session:
+                self.notify_subscribers(message_container, session=session)
+            return
 
-    def notify_subscribers(self, message_container):
         for subscriber in self.subscribers:
-            subscriber(message_container, self)
+            if session is None:
+                subscriber(message_container, self)
+            else:
+                subscriber(message_container, self, session=session)
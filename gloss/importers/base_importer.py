@@ -12,7 +12,15 @@ class AbstractImporter(object):
     def import_message(self, msg, gloss_service):
         raise NotImplementedError("This Must be implemented")
 
+    def skip(self, msg, gloss_service):
+        """ return True for messages that don't need importing
+        """
+        return False
+
     def import_and_notify(self, msg, gloss_service):
+        if self.skip(msg, gloss_service):
+            return
+
         message_container = self.import_message(msg, gloss_service)
 
         if len(message_container.messages):
@@ -30,17 +38,20 @@ class SafelImporter(AbstractImporter):
         try:
             super(SafelImporter, self).import_and_notify(msg, gloss_service)
         except Exception as e:
-            self.log.error("failed to parse")
-            self.log.error(str(msg).replace("\r", "\n"))
-            self.log.error("with %s" % e)
-            try:
-                with session_scope() as session:
-                    err = Error(
-                        error=str(e),
-                        message=str(msg)
-                    )
-                    session.add(err)
-            except Exception as e:
-                self.log.error("failed to save error to database")
-                self.log.error("with %s" % e)
+            self.save_error(msg, e)
             raise
+
+    def save_error(self, msg, e):
+        self.log.error("failed to parse")
+        self.log.error(str(msg).replace("\r", "\n"))
+        self.log.error("with %s" % e)
+        try:
+            with session_scope() as session:
+                err = Error(
+                    error=str(e),
+                    message=str(msg)
+                )
+                session.add(err)
+        except Exception as e:
+            self.log.error("failed to save error to database")
+            self.log.error("with %s" % e)
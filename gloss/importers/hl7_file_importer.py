@@ -0,0 +1,196 @@
+"""
+Replays archived HL7, e.g. dumps of MLLP traffic, through the
+translators and subscribers of a gloss service
+"""
+import os
+import time
+
+from gloss.importers.file_importer import FileType
+from gloss.importers.hl7_importer import HL7Importer, is_ignored
+from gloss.models import session_scope
+from gloss.translators.hl7.header import peek_header
+from gloss.translators.hl7.lazy_message import LazyMessage
+
+# the start and end of block characters used to frame MLLP messages
+MLLP_FRAMING = ("\x0b", "\x1c",)
+
+
+def read_segments(some_file, chunk_size=65536):
+    """ yields the segments in a file a chunk at a time, segments can be
+        separated by carriage returns or new lines and MLLP framing
+        is dropped
+    """
+    remainder = ""
+
+    while True:
+        chunk = some_file.read(chunk_size)
+
+        if not chunk:
+            break
+
+        for framing in MLLP_FRAMING:
+            chunk = chunk.replace(framing, "\r")
+
+        lines = (remainder + chunk).replace("\n", "\r").split("\r")
+        remainder = lines.pop()
+
+        for line in lines:
+            if line.strip():
+                yield line
+
+    if remainder.strip():
+        yield remainder
+
+
+def read_messages(some_file):
+    """ groups the segments of a file into messages, every MSH segment
+        starts a new message, anything before the first MSH is ignored
+    """
+    segments = []
+
+    for segment in read_segments(some_file):
+        if segment.startswith("MSH"):
+            if segments:
+                yield "\r".join(segments)
+            segments = [segment]
+        elif segments:
+            segments.append(segment)
+
+    if segments:
+        yield "\r".join(segments)
+
+
+class HL7FileType(FileType):
+    """
+    Streams a file, or a directory of files, of MLLP framed or new line
+    separated HL7 through a gloss service.
+
+    Subscribers share a transaction per batch of batch_size messages. If
+    anything in a batch fails it's rolled back and replayed a message at
+    a time so that only the broken messages are lost, subscribers with
+    side effects outside the database will see those messages twice
+
+    Like the MLLP receiver, messages we know from their header we won't
+    import and, if FILTER_UNSUBSCRIBED is set, messages for unsubscribed
+    patients are dropped before they're translated. ignored_count and
+    the HL7Importer's skipped_counts are how many have been
+    """
+    codec = "cp1252"
+
+    def __init__(self, path, batch_size=100, report_every=1000):
+        super(HL7FileType, self).__init__(path)
+        self.batch_size = batch_size
+        self.report_every = report_every
+        self.hl7_importer = HL7Importer()
+        self.read_count = 0
+        self.error_count = 0
+        self.ignored_count = 0
+        self.reported_count = 0
+        self.started = None
+
+    def get_file_paths(self):
+        if os.path.isdir(self.path):
+            for root, dirs, files in os.walk(self.path):
+                dirs.sort()
+                for file_name in sorted(files):
+                    yield os.path.join(root, file_name)
+        else:
+            yield self.path
+
+    def read_messages(self):
+        for file_path in self.get_file_paths():
+            with open(file_path, "rb") as some_file:
+                for raw_message in read_messages(some_file):
+                    yield raw_message.decode(self.codec)
+
+    def iter_containers(self, gloss_service):
+        """ yields the raw message and message container for every
+            message we can translate and don't skip
+        """
+        for raw_message in self.read_messages():
+            self.read_count += 1
+
+            if self.read_count - self.reported_count >= self.report_every:
+                self.report()
+
+            header = peek_header(raw_message)
+
+            if header is not None and is_ignored(header):
+                self.ignored_count += 1
+                continue
+
+            msg = LazyMessage(raw_message)
+
+            try:
+                if self.hl7_importer.skip(msg, gloss_service):
+                    continue
+
+                message_container = self.hl7_importer.import_message(
+                    msg, gloss_service
+                )
+            except Exception as e:
+                self.error_count += 1
+                self.save_error(raw_message.encode("utf-8"), e)
+                continue
+
+            if message_container and len(message_container.messages):
+                yield raw_message, message_container
+
+    def notify_batch(self, batch, gloss_service):
+        try:
+            with session_scope() as session:
+                for _, message_container in batch:
+                    gloss_service.notify_subscribers(
+                        message_container, session=session
+                    )
+            return
+        except Exception as e:
+            self.log.error(
+                "failed to save a batch of {0} messages with {1}".format(
+                    len(batch), e
+                )
+            )
+
+        for raw_message, message_container in batch:
+            try:
+                with session_scope() as session:
+                    gloss_service.notify_subscribers(
+                        message_container, session=session
+                    )
+            except Exception as e:
+                self.error_count += 1
+                self.save_error(raw_message.encode("utf-8"), e)
+
+    def report(self):
+        taken = time.time() - self.started
+        rate = self.read_count / taken if taken else 0
+        self.reported_count = self.read_count
+        self.log.info(
+            "replayed {0} messages, {1} ignored, {2} skipped, {3} errors, "
+            "{4:.1f} messages/sec".format(
+                self.read_count,
+                self.ignored_count,
+                sum(self.hl7_importer.skipped_counts.values()),
+                self.error_count,
+                rate
+            )
+        )
+
+    def process(self, gloss_service):
+        self.started = time.time()
+        batch = []
+
+        for raw_message, message_container in self.iter_containers(
+            gloss_service
+        ):
+            batch.append((raw_message, message_container,))
+
+            if len(batch) >= self.batch_size:
+                self.notify_batch(batch, gloss_service)
+                batch = []
+
+        if batch:
+            self.notify_batch(batch, gloss_service)
+
+        self.report()
+        return self.read_count
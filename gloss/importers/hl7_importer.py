@@ -1,12 +1,18 @@
-from collections import defaultdict
+from collections import Counter, defaultdict
+import six
 
-from gloss.utils import itersubclasses
+from gloss.conf import settings
+from gloss.utils import RegistryMeta, get_subclass_registry
 from gloss.importers.base_importer import SafelImporter
-from gloss.translators.hl7 import hl7_translator
+from gloss.models import subscribed_patients
+from gloss.translators.hl7 import hl7_translator, segments
 from gloss import message_type as messages
 
 
-class HL7TranslationToMessage(object):
+class HL7TranslationToMessage(six.with_metaclass(RegistryMeta)):
+    # messages we don't do anything with, see is_ignored
+    ignored = False
+
     def __init__(self, hl7_msg):
         self.hl7_msg = hl7_msg
 
@@ -16,11 +22,25 @@ class HL7TranslationToMessage(object):
     def import_hl7(self):
         raise NotImplementedError("This needs to be implemented")
 
+    @classmethod
+    def get_dispatch_keys(cls):
+        if not hasattr(cls, "hl7Translation"):
+            return []
+        return [cls.hl7Translation]
+
+    @classmethod
+    def get_for_translator(cls, translator):
+        registry = get_subclass_registry(
+            cls, lambda sub: sub.get_dispatch_keys()
+        )
+        return registry.get(translator)
+
     @classmethod
     def get_for_hl7(cls, hl7):
-        for i in itersubclasses(cls):
-            if i.hl7Translation == hl7.__class__:
-                return i(hl7)
+        importer = cls.get_for_translator(hl7.__class__)
+
+        if importer:
+            return importer(hl7)
 
 
 class PatientMergeImporter(HL7TranslationToMessage):
@@ -165,6 +185,7 @@ class AllergyImporter(HL7TranslationToMessage):
 
 class WinPathResultsOrderImporter(HL7TranslationToMessage):
     hl7Translation = hl7_translator.WinPathResultsOrder
+    ignored = True
 
     def import_hl7(self):
         """
@@ -225,7 +246,107 @@ class WinPathResultsImporter(HL7TranslationToMessage):
         return gloss_messages
 
 
+def is_ignored(header):
+    """ True if we know from a message's header that we won't import it,
+        either because we don't have a translator for its type or
+        because we don't do anything with it
+    """
+    translator = hl7_translator.HL7Translator.get_translator(
+        header.message_type, header.trigger_event, header.sending_application
+    )
+
+    if translator is None:
+        return True
+
+    importer = HL7TranslationToMessage.get_for_translator(translator)
+    return importer is None or importer.ignored
+
+
+def get_hospital_numbers(msg):
+    """ the hospital numbers an hl7 message is about, PID-3 and for
+        merges the duplicate in MRG-1, read straight from the parsed
+        message without translating it
+    """
+    hospital_numbers = []
+    fields = [
+        (segments.InpatientPID, "hospital_number"),
+        (segments.MRG, "duplicate_hospital_number"),
+    ]
+
+    for segment_class, field_name in fields:
+        # segments like InpatientPID expect more fields than some
+        # systems send, so read the field without constructing them
+        field = getattr(segment_class, field_name)
+
+        try:
+            hospital_number = field.get_value(
+                msg.segment(segment_class.name())
+            )
+        except (KeyError, IndexError):
+            continue
+
+        if hospital_number:
+            hospital_numbers.append(hospital_number)
+
+    return hospital_numbers
+
+
+def get_header_hospital_numbers(header):
+    """ the hospital numbers a MessageHeader has for its message, the
+        same ones as get_hospital_numbers but from the raw message
+    """
+    return [
+        i for i in (header.hospital_number, header.duplicate_hospital_number)
+        if i
+    ]
+
+
+def any_subscribed(hospital_numbers, issuing_source):
+    """ True if any of a message's hospital numbers are subscribed to,
+        messages we can't find a hospital number for are let through
+    """
+    if not hospital_numbers:
+        return True
+
+    return any(
+        subscribed_patients.contains(issuing_source, i)
+        for i in hospital_numbers
+    )
+
+
 class HL7Importer(SafelImporter):
+    """ if filter_unsubscribed is set, or settings.FILTER_UNSUBSCRIBED if
+        it isn't passed in, messages for patients who aren't subscribed
+        are dropped before they're translated. skipped_counts is how many
+        have been dropped for each message type
+    """
+    def __init__(self, filter_unsubscribed=None):
+        self._filter_unsubscribed = filter_unsubscribed
+        self.skipped_counts = Counter()
+
+    @property
+    def filter_unsubscribed(self):
+        if self._filter_unsubscribed is None:
+            return settings.FILTER_UNSUBSCRIBED
+        return self._filter_unsubscribed
+
+    def is_subscribed(self, msg, gloss_service):
+        return any_subscribed(
+            get_hospital_numbers(msg), gloss_service.issuing_source
+        )
+
+    def skip(self, msg, gloss_service):
+        if self.filter_unsubscribed and not self.is_subscribed(
+            msg, gloss_service
+        ):
+            msh = hl7_translator.HL7Translator.get_msh(msg)
+            self.skipped_counts[
+                u"{0}^{1}".format(msh.message_type, msh.trigger_event)
+            ] += 1
+            return True
+
+        return False
+
     def import_message(self, msg, gloss_service):
         hl7 = hl7_translator.HL7Translator.translate(msg)
         importer = HL7TranslationToMessage.get_for_hl7(hl7)
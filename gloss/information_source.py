@@ -10,6 +10,16 @@ from gloss import message_type
     service
 """
 
+# queries upstream for the same patient share one request and patients
+# upstream doesn't know about aren't asked for again until the ttl expires.
+# Both are per process, the api's sync workers each serve a request in
+# their own process so concurrent queries in different workers still all
+# go upstream, and each worker keeps its own not found answers
+upstream_queries = utils.SingleFlight()
+not_found_cache = utils.TTLCache(
+    settings.NOT_FOUND_CACHE_SIZE, settings.NOT_FOUND_CACHE_TTL
+)
+
 # TODO, we can just inherit this now...
 if getattr(settings, "MOCK_EXTERNAL_API", None):
     post_message_for_identifier = utils.import_from_string(
@@ -39,10 +49,23 @@ class InformationSource(object):
 
         if not patient_already_exists:
             if settings.USE_EXTERNAL_LOOKUP:
-                post_message_for_identifier(identifier)
+                self.fetch_patient(issuing_source, identifier)
                 return True
         return False
 
+    def fetch_patient(self, issuing_source, identifier):
+        key = (issuing_source, identifier,)
+        not_found = not_found_cache.get(key)
+
+        if not_found:
+            raise not_found
+
+        try:
+            upstream_queries.do(key, post_message_for_identifier, identifier)
+        except exceptions.UpstreamPatientNotFound as e:
+            not_found_cache.set(key, e)
+            raise
+
     def result_information(self, issuing_source, identifier):
         with models.session_scope() as session:
             if self.check_or_fetch_patient(
@@ -1,37 +1,186 @@
 from collections import defaultdict
-import six
+import datetime
 import itertools
 
+import six
+
 
 class Field(object):
+    # fields are kept in the order they're declared in
+    counter = itertools.count()
+
     def __init__(self, required=False):
         self.required = required
+        self.creation_counter = next(Field.counter)
+
+
+# values that to_dict can pass straight through
+SCALAR_TYPES = frozenset([
+    str, six.text_type, int, long, float, bool, datetime.date,
+    datetime.datetime,
+])
+
+# the default for a required field in a generated __init__
+_missing = object()
+
+
+def specialisable(method):
+    """ marks a method that GlossMessageMeta can replace with code
+        generated for a class's fields
+    """
+    method.specialisable = True
+    return method
+
+
+def to_dict_or_not_to_dict(some_value):
+    if hasattr(some_value, "to_dict"):
+        return some_value.to_dict()
+    else:
+        return some_value
+
+
+def serialise_value(value):
+    if value is None or type(value) in SCALAR_TYPES:
+        return value
+
+    if isinstance(value, dict):
+        return {
+            i: to_dict_or_not_to_dict(v) for i, v in value.iteritems()
+        }
+    elif hasattr(value, "__iter__"):
+        return [to_dict_or_not_to_dict(i) for i in value]
+    else:
+        return to_dict_or_not_to_dict(value)
+
+
+def raise_missing_fields(required_fields, kwargs):
+    missing_required_fields = set(
+        i for i in required_fields if kwargs.get(i, _missing) is _missing
+    )
+    raise ValueError(
+        "We are missing the fields %s" % missing_required_fields
+    )
+
+
+def compile_method(class_name, source, method_name):
+    namespace = dict(
+        _missing=_missing,
+        _raise_missing_fields=raise_missing_fields,
+        _serialise_value=serialise_value,
+    )
+    code = compile(
+        source, "<{0}.{1}>".format(class_name, method_name), "exec"
+    )
+    six.exec_(code, namespace)
+    method = namespace[method_name]
+    method.specialisable = True
+    method.source = source
+    return method
+
+
+def make_init(class_name, fields, required_fields):
+    """ an __init__ that takes the fields as keyword arguments and
+        ignores anything else it's passed
+    """
+    required = [i for i in fields if i in required_fields]
+    arguments = ", ".join(
+        "{0}={1}".format(i, "_missing" if i in required_fields else "None")
+        for i in fields
+    )
+    lines = ["def __init__(self, {0}, **kwargs):".format(arguments)]
+
+    if required:
+        lines.append("    if {0}:".format(
+            " or ".join("{0} is _missing".format(i) for i in required)
+        ))
+        lines.append("        _raise_missing_fields({0!r}, locals())".format(
+            tuple(required)
+        ))
+
+    lines.extend("    self.{0} = {0}".format(i) for i in fields)
+    return compile_method(class_name, "\n".join(lines), "__init__")
+
+
+def make_to_dict(class_name, fields):
+    lines = ["def _fields_to_dict(self):", "    return {"]
+    lines.extend(
+        "        {0!r}: _serialise_value(self.{0}),".format(i) for i in fields
+    )
+    lines.append("    }")
+    return compile_method(class_name, "\n".join(lines), "_fields_to_dict")
+
+
+def inherits_specialisable(bases, attrs, method_name):
+    """ True if neither the class nor its parents have their own version
+        of method_name
+    """
+    if method_name in attrs:
+        return False
+
+    return getattr(
+        getattr(bases[0], method_name, None), "specialisable", False
+    )
 
 
 class GlossMessageMeta(type):
+    """
+    Collects the Fields declared on a message type and its parents into
+    _message_fields, in the order they were declared.
+
+    Message types with fields are slotted, one slot per field, and are
+    given an __init__ and to_dict generated for their fields unless they
+    or a parent define their own. Message types without fields keep
+    their __dict__ and use the generic MessageType methods.
+    """
     def __new__(cls, name, bases, attrs):
-        omf = set()
-        rmf = set()
+        fields = []
+        required_fields = set()
+
         # get all fields from parent classes
         parents = [b for b in bases if isinstance(b, GlossMessageMeta)]
         for kls in parents:
-            omf.update(kls._optional_message_fields)
-            rmf.update(kls._required_message_fields)
+            for field_name in kls._message_fields:
+                if field_name not in fields:
+                    fields.append(field_name)
+            required_fields.update(kls._required_message_fields)
+
+        inherited_fields = set(fields)
 
         # Get all the fields from this class.
-        for field_name, val in attrs.items():
-            if isinstance(val, Field):
-                if val.required:
-                    omf.discard(field_name)
-                    rmf.add(field_name)
-                else:
-                    rmf.discard(field_name)
-                    omf.add(field_name)
-        attrs["_optional_message_fields"] = omf
-        attrs["_required_message_fields"] = rmf
+        declared = sorted(
+            (i for i in attrs.items() if isinstance(i[1], Field)),
+            key=lambda i: i[1].creation_counter
+        )
 
-        return super(GlossMessageMeta, cls).__new__(cls, name, bases, attrs)
+        for field_name, val in declared:
+            # the field's slot replaces the Field on the class
+            del attrs[field_name]
+
+            if field_name not in fields:
+                fields.append(field_name)
+
+            if val.required:
+                required_fields.add(field_name)
+            else:
+                required_fields.discard(field_name)
 
+        attrs["_message_fields"] = tuple(fields)
+        attrs["_required_message_fields"] = frozenset(required_fields)
+
+        if fields:
+            attrs.setdefault("__slots__", tuple(
+                i for i, _ in declared if i not in inherited_fields
+            ))
+
+            if inherits_specialisable(bases, attrs, "__init__"):
+                attrs["__init__"] = make_init(name, fields, required_fields)
+
+            attrs["_fields_to_dict"] = make_to_dict(name, fields)
+
+            if inherits_specialisable(bases, attrs, "to_dict"):
+                attrs["to_dict"] = attrs["_fields_to_dict"]
+
+        return super(GlossMessageMeta, cls).__new__(cls, name, bases, attrs)
 
 
 """
@@ -43,6 +192,10 @@ class MessageContainer(object):
         self.hospital_number = hospital_number
         self.issuing_source = issuing_source
 
+        # set to False by a subscriber that's found the messages don't
+        # change anything we know, so there's no need to send them on
+        self.changed = True
+
     def to_dict(self):
         serialised_messages = defaultdict(list)
 
@@ -67,8 +220,10 @@ def construct_message_container(
 
 
 class MessageType(six.with_metaclass(GlossMessageMeta)):
+    __slots__ = ()
     message_name = "name me Larry"
 
+    @specialisable
     def __init__(self, **kwargs):
         key_names = kwargs.keys()
         missing_required_fields = self._required_message_fields - set(key_names)
@@ -77,38 +232,31 @@ class MessageType(six.with_metaclass(GlossMessageMeta)):
             raise ValueError(
                 "We are missing the fields %s" % missing_required_fields
             )
-        all_fields = itertools.chain(
-            self._optional_message_fields,
-            self._required_message_fields
-        )
 
-        for field in all_fields:
+        for field in self._message_fields:
             setattr(self, field, kwargs.get(field))
 
-    def to_dict(self):
-        result = {}
+    def field_values(self):
+        """ the message's fields and their values as they are, unlike
+            to_dict nested messages aren't serialised
+        """
+        if self._message_fields:
+            return {i: getattr(self, i) for i in self._message_fields}
 
-        def to_dict_or_not_to_dict(some_value):
-            if hasattr(some_value, "to_dict"):
-                return some_value.to_dict()
-            else:
-                return some_value
+        return dict(vars(self))
+
+    @specialisable
+    def to_dict(self):
+        if self._message_fields:
+            return self._fields_to_dict()
 
         if hasattr(self, "__name__"):
             return self.__name__
 
-        for key, value in vars(self).iteritems():
-            if isinstance(value, dict):
-                result[key] = {
-                    i: to_dict_or_not_to_dict(v) for i, v in value.iteritems()
-                }
-            elif hasattr(value, "__iter__"):
-                result[key] = []
-                result[key] = [to_dict_or_not_to_dict(i) for i in value]
-            else:
-                result[key] = to_dict_or_not_to_dict(value)
-
-        return result
+        return {
+            key: serialise_value(value)
+            for key, value in vars(self).iteritems()
+        }
 
 
 class PatientMessage(MessageType):
@@ -137,24 +285,35 @@ class PatientMergeMessage(MessageType):
 class AllergyMessage(MessageType):
     message_name = "allergies"
 
-    def __init__(
-        self, **kwargs
-    ):
-        # Note a special case, does not call super
-        self.no_allergies = kwargs.pop("no_allergies")
+    no_allergies = Field(required=True)
+    allergy_type_description = Field()
+    certainty_id = Field()
+    certainty_description = Field()
+    allergy_reference_name = Field()
+    allergy_description = Field()
+    allergen_reference_system = Field()
+    allergen_reference = Field()
+    status_id = Field()
+    status_description = Field()
+    diagnosis_datetime = Field()
+    allergy_start_datetime = Field()
+
+    def __init__(self, **kwargs):
+        # the allergy fields are only required if there are allergies
+        super(AllergyMessage, self).__init__(**kwargs)
 
         if not self.no_allergies:
-            self.allergy_type_description = kwargs.pop("allergy_type_description")
-            self.certainty_id = kwargs.pop("certainty_id")
-            self.certainty_description = kwargs.pop("certainty_description")
-            self.allergy_reference_name = kwargs.pop("allergy_reference_name")
-            self.allergy_description = kwargs.pop("allergy_description")
-            self.allergen_reference_system = kwargs.pop("allergen_reference_system")
-            self.allergen_reference = kwargs.pop("allergen_reference")
-            self.status_id = kwargs.pop("status_id")
-            self.status_description = kwargs.pop("status_description")
-            self.diagnosis_datetime = kwargs.pop("diagnosis_datetime")
-            self.allergy_start_datetime = kwargs.pop("allergy_start_datetime")
+            missing = set(self._message_fields) - set(kwargs.keys())
+
+            if missing:
+                raise ValueError("We are missing the fields %s" % missing)
+
+    def to_dict(self):
+        # a patient with no allergies is sent without the allergy fields
+        if self.no_allergies:
+            return {"no_allergies": self.no_allergies}
+
+        return self._fields_to_dict()
 
 
 class ObservationMessage(MessageType):
@@ -0,0 +1,175 @@
+"""
+A pool of long lived MLLP connections for querying upstream systems, e.g.
+the demographics queries made by gloss.external_api
+"""
+import Queue
+import select
+import socket
+import threading
+import time
+
+import hl7
+import six
+
+from gloss.exceptions import MLLPError
+
+# the characters that wrap an MLLP message, start block, end block and
+# a carriage return
+SB = "\x0b"
+EB = "\x1c"
+CR = "\x0d"
+
+
+def get_control_id(message):
+    """ the message control id of an hl7 message (MSH-10)
+    """
+    if not isinstance(message, hl7.Message):
+        message = hl7.parse(message)
+    return six.text_type(message.segment("MSH")[10])
+
+
+def get_acknowledged_id(message):
+    """ the control id of the message a response is acknowledging (MSA-2)
+    """
+    if not isinstance(message, hl7.Message):
+        message = hl7.parse(message)
+    return six.text_type(message.segment("MSA")[2])
+
+
+class MLLPConnection(object):
+    """ a single blocking MLLP connection that can be used for more
+        than one request
+    """
+    def __init__(self, host, port, timeout, encoding="utf-8"):
+        self.socket = socket.create_connection((host, port), timeout)
+        self.encoding = encoding
+        self.buffer = b""
+
+    def is_healthy(self):
+        """ an idle connection shouldn't have anything to read, if it does
+            the other end has either closed it or sent something we
+            weren't waiting for
+        """
+        if self.buffer:
+            return False
+
+        try:
+            readable, _, _ = select.select([self.socket], [], [], 0)
+        except (socket.error, ValueError):
+            return False
+
+        return not readable
+
+    def read_message(self, deadline):
+        while EB not in self.buffer:
+            remaining = deadline - time.time()
+
+            if remaining <= 0:
+                raise socket.timeout("timed out waiting for a response")
+
+            self.socket.settimeout(remaining)
+            data = self.socket.recv(4096)
+
+            if not data:
+                raise MLLPError("the connection was closed")
+
+            self.buffer += data
+
+        frame, self.buffer = self.buffer.split(EB, 1)
+        self.buffer = self.buffer.lstrip(CR)
+        return frame[frame.find(SB) + 1:]
+
+    def send_message(self, message, control_id, deadline):
+        """ sends a message and returns the response that acknowledges
+            control_id, responses to earlier requests that we stopped
+            waiting for are skipped. Raises socket.timeout if there isn't
+            one by deadline
+        """
+        if isinstance(message, hl7.Message):
+            message = six.text_type(message)
+
+        if isinstance(message, six.text_type):
+            message = message.encode(self.encoding)
+
+        self.socket.settimeout(max(deadline - time.time(), 0.001))
+        self.socket.sendall(SB + message + EB + CR)
+
+        while True:
+            response = self.read_message(deadline).decode(self.encoding)
+
+            if get_acknowledged_id(response) == control_id:
+                return response
+
+    def close(self):
+        self.socket.close()
+
+
+class MLLPConnectionPool(object):
+    """
+    Keeps up to size connections open to an MLLP server.
+
+    Connections are health checked before they're reused. If a request
+    fails the connection is thrown away, if it was because the connection
+    broke the request is retried once on a new one. Both attempts share
+    the one timeout, and a request that times out isn't retried.
+    """
+    def __init__(self, host, port, size=4, timeout=10, encoding="utf-8"):
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self.encoding = encoding
+        self.idle = Queue.LifoQueue()
+        self.semaphore = threading.BoundedSemaphore(size)
+
+    def connect(self):
+        return MLLPConnection(
+            self.host, self.port, self.timeout, encoding=self.encoding
+        )
+
+    def get_connection(self):
+        while True:
+            try:
+                connection = self.idle.get_nowait()
+            except Queue.Empty:
+                return self.connect()
+
+            if connection.is_healthy():
+                return connection
+
+            connection.close()
+
+    def send_message(self, message, control_id=None):
+        if control_id is None:
+            control_id = get_control_id(message)
+
+        deadline = time.time() + self.timeout
+
+        with self.semaphore:
+            for attempt in range(2):
+                connection = self.get_connection()
+
+                try:
+                    response = connection.send_message(
+                        message, control_id, deadline
+                    )
+                except Exception as e:
+                    # whatever went wrong we don't know what state the
+                    # connection's been left in
+                    connection.close()
+
+                    can_retry = isinstance(e, (socket.error, MLLPError,)) and (
+                        not isinstance(e, socket.timeout)
+                    )
+
+                    if attempt or not can_retry or time.time() >= deadline:
+                        raise
+                else:
+                    self.idle.put(connection)
+                    return response
+
+    def close(self):
+        while True:
+            try:
+                self.idle.get_nowait().close()
+            except Queue.Empty:
+                break
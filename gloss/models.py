@@ -4,22 +4,38 @@ Models for our Gloss Application
 from contextlib import contextmanager
 import datetime
 import json
+import threading
+import time
+from collections import defaultdict
+from itertools import chain
 
 from sqlalchemy.orm import sessionmaker
-from sqlalchemy import func
+from sqlalchemy.orm import session as orm_session, make_transient_to_detached
+from sqlalchemy import (
+    func, event, text, case, select, literal_column, or_
+)
+from sqlalchemy.exc import IntegrityError
 
 from sqlalchemy import (
     Column, Integer, String, DateTime, Date, Boolean, ForeignKey, Text,
-    BigInteger
+    BigInteger, Index, UniqueConstraint
 )
 from sqlalchemy.ext.declarative import as_declarative, declared_attr
-from sqlalchemy.orm import relationship
+from sqlalchemy.orm import relationship, aliased
 from sqlalchemy import create_engine
 from gloss import message_type
 from gloss.conf import settings
-from gloss.utils import itersubclasses, import_from_string
+from gloss.utils import (
+    itersubclasses, import_from_string, LRUCache, TTLCache
+)
 engine = create_engine(settings.DATABASE_STRING)
 
+# how many merges we'll follow before deciding they form a cycle
+MAX_MERGE_CHAIN = 1000
+
+# a default for arguments where None is a value
+NOT_GIVEN = object()
+
 
 @as_declarative()
 class Base(object):
@@ -36,10 +52,24 @@ class GlossSubrecord(object):
     # e.g. we don't need to know about any upstream merges that happened
     PART_OF_BULK_DOWNLOAD = True
 
+    # whether a patient can only have one of these
+    ONE_PER_GLOSS_REFERENCE = False
+
+    # whether these move to the new patient when a patient is merged,
+    # see repoint_subrecords
+    REPOINT_ON_MERGE = True
+
+    # columns that along with the gloss reference identify one of these
+    NATURAL_KEY = ()
 
     @declared_attr
     def gloss_reference_id(cls):
-        return Column(Integer, ForeignKey('glossolaliareference.id'))
+        return Column(
+            Integer,
+            ForeignKey('glossolaliareference.id'),
+            index=True,
+            unique=cls.ONE_PER_GLOSS_REFERENCE
+        )
 
     @declared_attr
     def gloss_reference(cls):
@@ -68,27 +98,48 @@ class GlossSubrecord(object):
         return self.message_type(**vars(self))
 
     @classmethod
-    def to_messages(cls, identifier, issuing_source, session):
+    def subrecords_to_messages(cls, subrecords, session):
+        """ translates a list of subrecords to messages, override this
+            rather than to_message if it needs to query for each subrecord
+        """
+        return [subrecord.to_message(session) for subrecord in subrecords]
+
+    @classmethod
+    def to_messages(
+        cls, identifier, issuing_source, session, gloss_reference_id=None
+    ):
         """ to messages translates all models about the class into message
             types, it can be overridden with settings.MOCK_API to
             return custom results for a specific class if requested
+
+            if we already know the patient's gloss_reference_id pass it
+            in to save joining on the patient identifier
         """
         if getattr(settings, "MOCK_API", None):
             some_func = import_from_string(settings.MOCK_API)
             return some_func(cls, identifier, issuing_source, session)
         else:
-            return cls._to_messages(identifier, issuing_source, session)
+            return cls._to_messages(
+                identifier,
+                issuing_source,
+                session,
+                gloss_reference_id=gloss_reference_id
+            )
 
     @classmethod
-    def _to_messages(cls, identifier, issuing_source, session):
-        qry = cls.query_from_identifier(
-            identifier, issuing_source, session
-        ).all()
-        messages = []
+    def _to_messages(
+        cls, identifier, issuing_source, session, gloss_reference_id=None
+    ):
+        if gloss_reference_id is None:
+            qry = cls.query_from_identifier(
+                identifier, issuing_source, session
+            )
+        else:
+            qry = session.query(cls).filter(
+                cls.gloss_reference_id == gloss_reference_id
+            )
 
-        for subrecord in qry:
-            messages.append(subrecord.to_message(session))
-        return messages
+        return cls.subrecords_to_messages(qry.all(), session)
 
     @classmethod
     def from_messages(cls, message_container, session):
@@ -107,6 +158,10 @@ class Error(Base):
 class Patient(Base, GlossSubrecord):
     message_type = message_type.PatientMessage
 
+    # a patient only has one set of demographics, if they're merged into
+    # a patient who has their own we keep those
+    ONE_PER_GLOSS_REFERENCE = True
+
     surname = Column(String(250), nullable=False)
     first_name = Column(String(250), nullable=False)
     middle_name = Column(String(250))
@@ -133,24 +188,55 @@ class InpatientAdmission(Base, GlossSubrecord):
 
     datetime_of_admission = Column(DateTime, nullable=False)
     datetime_of_discharge = Column(DateTime)
-    external_identifier = Column(String(250), nullable=False)
+    external_identifier = Column(
+        String(250), nullable=False, index=True, unique=True
+    )
     admission_diagnosis = Column(String(250))
 
-    def to_message(self, session):
+    def to_message(self, session, location=NOT_GIVEN):
         """ inpatient admission is a composite model of inpatient admission and
-            location
+            location, pass in location if it's already been looked up, None
+            if the admission doesn't have one
         """
         kwargs = vars(self)
-        location = InpatientLocation.get_latest_location(self, session)
+
+        if location is NOT_GIVEN:
+            location = InpatientLocation.get_latest_location(self, session)
 
         if location:
             kwargs.update(vars(location))
         return self.message_type(**kwargs)
 
+    @classmethod
+    def subrecords_to_messages(cls, subrecords, session):
+        locations = InpatientLocation.get_latest_locations(
+            [i.id for i in subrecords], session
+        )
+        return [
+            i.to_message(session, location=locations.get(i.id))
+            for i in subrecords
+        ]
+
 
 class InpatientLocation(Base):
     PART_OF_BULK_DOWNLOAD = False
 
+    __table_args__ = (
+        Index(
+            "ix_inpatientlocation_inpatient_admission_id_datetime_of_transfer",
+            "inpatient_admission_id",
+            "datetime_of_transfer",
+        ),
+        # a patient can only be in one place at a time
+        Index(
+            "ix_inpatientlocation_current_location",
+            "inpatient_admission_id",
+            unique=True,
+            postgresql_where=text("datetime_of_transfer IS NULL"),
+            sqlite_where=text("datetime_of_transfer IS NULL"),
+        ),
+    )
+
     inpatient_admission_id = Column(Integer, ForeignKey('inpatientadmission.id'))
     inpatient_admission = relationship(
         "InpatientAdmission", foreign_keys=[inpatient_admission_id], cascade="all"
@@ -181,6 +267,31 @@ class InpatientLocation(Base):
             if q.count():
                 return q[0]
 
+    @classmethod
+    def get_latest_locations(cls, inpatient_admission_ids, session):
+        """ the latest location of each admission in one query, returned
+            as a dict of inpatient admission id to location, as with
+            get_latest_location that's where the patient is now if they're
+            still there, otherwise the last place they were transferred from
+        """
+        if not inpatient_admission_ids:
+            return {}
+
+        rank = func.row_number().over(
+            partition_by=cls.inpatient_admission_id,
+            order_by=(
+                case([(cls.datetime_of_transfer == None, 0)], else_=1),
+                cls.datetime_of_transfer.desc(),
+            )
+        ).label("rank")
+        ranked = session.query(cls.id, rank).filter(
+            cls.inpatient_admission_id.in_(inpatient_admission_ids)
+        ).subquery()
+        latest = session.query(cls).join(
+            ranked, cls.id == ranked.c.id
+        ).filter(ranked.c.rank == 1)
+        return {i.inpatient_admission_id: i for i in latest}
+
     @classmethod
     def get_location(cls, inpatient_admission, session):
         """
@@ -194,13 +305,23 @@ class InpatientLocation(Base):
 class PatientIdentifier(Base, GlossSubrecord):
     PART_OF_BULK_DOWNLOAD = False
 
+    # the old identifier has to stay with the old gloss reference so that
+    # we can tell people asking for it about the merge
+    REPOINT_ON_MERGE = False
+
+    __table_args__ = (
+        UniqueConstraint("issuing_source", "identifier"),
+    )
+
     identifier = Column(String(250))
     issuing_source = Column(String(250))
     active = Column(Boolean, default=True)
 
     @declared_attr
     def gloss_reference_id(cls):
-        return Column(Integer, ForeignKey('glossolaliareference.id'))
+        return Column(
+            Integer, ForeignKey('glossolaliareference.id'), index=True
+        )
 
     @declared_attr
     def gloss_reference(cls):
@@ -211,58 +332,227 @@ class PatientIdentifier(Base, GlossSubrecord):
 
 
 class Merge(Base, GlossSubrecord):
-    new_reference_id = Column(Integer, ForeignKey('glossolaliareference.id'))
+    ONE_PER_GLOSS_REFERENCE = True
+    REPOINT_ON_MERGE = False
+
+    new_reference_id = Column(
+        Integer, ForeignKey('glossolaliareference.id'), index=True
+    )
     new_reference = relationship(
         "GlossolaliaReference", foreign_keys=[new_reference_id]
     )
 
     @classmethod
-    def _to_messages(cls, identifier, issuing_source, session):
-        merge = cls.get_latest_merge(session, issuing_source, identifier)
-
-        if merge:
-            identifier = session.query(PatientIdentifier).filter(
-                PatientIdentifier.gloss_reference == merge.new_reference
-            ).filter(
-                PatientIdentifier.issuing_source == issuing_source
-            ).one_or_none()
+    def _to_messages(
+        cls, identifier, issuing_source, session, gloss_reference_id=None
+    ):
+        if gloss_reference_id is None:
+            gloss_reference = get_gloss_reference(
+                identifier, session, issuing_source=issuing_source
+            )
 
-            if not identifier:
-                err = "unable to find a patient identifier for gloss reference {}"
-                raise err.format(identifier)
-            return [message_type.PatientMergeMessage(
-                new_id=identifier.identifier
-            )]
+            if gloss_reference is None:
+                return []
 
-        return []
+            gloss_reference_id = gloss_reference.id
+
+        canonical_reference_id = CanonicalReference.get_canonical_reference_id(
+            gloss_reference_id, session
+        )
+
+        if canonical_reference_id == gloss_reference_id:
+            return []
+
+        identifier = session.query(PatientIdentifier).filter(
+            PatientIdentifier.gloss_reference_id == canonical_reference_id
+        ).filter(
+            PatientIdentifier.issuing_source == issuing_source
+        ).one_or_none()
+
+        if not identifier:
+            err = "unable to find a patient identifier for gloss reference {}"
+            raise ValueError(err.format(canonical_reference_id))
+
+        return [message_type.PatientMergeMessage(
+            new_id=identifier.identifier
+        )]
 
     @classmethod
-    def get_latest_merge(cls, session, issuing_source, identifier):
+    def get_latest_merge(
+        cls, session, issuing_source, identifier, gloss_reference_id=None
+    ):
         """ although an identifier can only have a single merge, that merge
             can have multiple merges, so lets only return the most recent merge
+
+            this follows the merges in the database with a recursive query
+            so can be used to check CanonicalReference
         """
-        merge = cls.query_from_identifier(
-            identifier, issuing_source, session
-        ).one_or_none()
+        if gloss_reference_id is None:
+            merge = cls.query_from_identifier(
+                identifier, issuing_source, session
+            ).one_or_none()
+
+            if merge is None:
+                return
+
+            gloss_reference_id = merge.gloss_reference_id
+
+        merge_table = cls.__table__
+        merges = select([
+            merge_table.c.id,
+            merge_table.c.new_reference_id,
+            literal_column("1").label("depth"),
+        ]).where(
+            merge_table.c.gloss_reference_id == gloss_reference_id
+        ).cte("merges", recursive=True)
+        merges = merges.union_all(select([
+            merge_table.c.id,
+            merge_table.c.new_reference_id,
+            merges.c.depth + 1,
+        ]).where(
+            merge_table.c.gloss_reference_id == merges.c.new_reference_id
+        ).where(
+            merges.c.depth <= MAX_MERGE_CHAIN
+        ))
+        latest = session.execute(
+            select([merges.c.id, merges.c.depth]).order_by(
+                merges.c.depth.desc()
+            ).limit(1)
+        ).first()
+
+        if latest is None:
+            return
+
+        if latest.depth > MAX_MERGE_CHAIN:
+            raise ValueError(
+                "merges for gloss reference {} form a cycle".format(
+                    gloss_reference_id
+                )
+            )
+
+        return session.query(cls).get(latest.id)
+
+
+class CanonicalReference(Base):
+    """ maps every gloss reference that has been merged to the gloss
+        reference at the end of its chain of merges, so resolving a merge
+        is a single read however many times a patient has been merged.
+
+        Rows are kept up to date from the Merge table whenever a session
+        that has changed a merge is flushed, see update_canonical_references
+    """
+    gloss_reference_id = Column(
+        Integer,
+        ForeignKey('glossolaliareference.id'),
+        nullable=False,
+        index=True,
+        unique=True
+    )
+    canonical_reference_id = Column(
+        Integer,
+        ForeignKey('glossolaliareference.id'),
+        nullable=False,
+        index=True
+    )
+
+    @classmethod
+    def get_canonical_reference_id(cls, gloss_reference_id, session):
+        """ the gloss reference id a gloss reference has been merged into,
+            or the gloss reference id if it hasn't been
+        """
+        canonical_reference_id = session.query(
+            cls.canonical_reference_id
+        ).filter(cls.gloss_reference_id == gloss_reference_id).scalar()
+
+        if canonical_reference_id is None:
+            return gloss_reference_id
+
+        return canonical_reference_id
+
+    @classmethod
+    def get_merged_into(cls, gloss_reference_id, connection):
+        """ the ids of a gloss reference and of everything that's been
+            merged into it directly or indirectly
+        """
+        reference_table = GlossolaliaReference.__table__
+        merge_table = Merge.__table__
+        merged = select([reference_table.c.id]).where(
+            reference_table.c.id == gloss_reference_id
+        ).cte("merged", recursive=True)
+        merged = merged.union(select([merge_table.c.gloss_reference_id]).where(
+            merge_table.c.new_reference_id == merged.c.id
+        ))
+        return set(
+            row[0] for row in connection.execute(select([merged.c.id]))
+        )
 
-        while merge:
-            if merge.gloss_reference == merge.new_reference:
+    @classmethod
+    def resolve(cls, gloss_reference_id, connection):
+        """ points a gloss reference and everything merged into it at the
+            end of the gloss reference's merges, raises a ValueError if the
+            merges form a cycle
+        """
+        table = cls.__table__
+        merge_table = Merge.__table__
+        new_reference_id = connection.execute(
+            select([merge_table.c.new_reference_id]).where(
+                merge_table.c.gloss_reference_id == gloss_reference_id
+            )
+        ).scalar()
+        merged_into = cls.get_merged_into(gloss_reference_id, connection)
+
+        if new_reference_id is None:
+            canonical_reference_id = gloss_reference_id
+        else:
+            if new_reference_id in merged_into:
                 raise ValueError(
-                    "incorrect merge {} points to itself".format(merge.id)
+                    "merging gloss reference {0} into {1} creates a cycle".format(
+                        gloss_reference_id, new_reference_id
+                    )
                 )
 
-            new_merge = session.query(cls).filter(
-                cls.gloss_reference == merge.new_reference
-            ).one_or_none()
+            canonical_reference_id = connection.execute(
+                select([table.c.canonical_reference_id]).where(
+                    table.c.gloss_reference_id == new_reference_id
+                )
+            ).scalar() or new_reference_id
+
+        connection.execute(table.delete().where(
+            table.c.gloss_reference_id.in_(merged_into)
+        ))
+        rows = [
+            dict(
+                gloss_reference_id=i,
+                canonical_reference_id=canonical_reference_id
+            )
+            for i in merged_into if i != canonical_reference_id
+        ]
+
+        if rows:
+            connection.execute(table.insert(), rows)
+
+
+def update_canonical_references(session, flush_context):
+    gloss_reference_ids = set(
+        i.gloss_reference_id for i in chain(
+            session.new, session.dirty, session.deleted
+        )
+        if isinstance(i, Merge) and i.gloss_reference_id is not None
+    )
+
+    if gloss_reference_ids:
+        connection = session.connection()
+
+        for gloss_reference_id in sorted(gloss_reference_ids):
+            CanonicalReference.resolve(gloss_reference_id, connection)
 
-            if not new_merge:
-                return merge
-            else:
-                merge = new_merge
+
+event.listen(orm_session.Session, "after_flush", update_canonical_references)
 
 
 class Subscription(Base, GlossSubrecord):
     PART_OF_BULK_DOWNLOAD = False
+    ONE_PER_GLOSS_REFERENCE = True
 
     system = Column(String(250))
     active = Column(Boolean, default=True)
@@ -272,6 +562,9 @@ class Subscription(Base, GlossSubrecord):
 class Allergy(Base, GlossSubrecord):
     message_type = message_type.AllergyMessage
 
+    # what identifies an allergy in an updated list, see save_allergies
+    MATCH_ON = ("allergen_reference", "allergy_reference_name",)
+
     # ask the docs which fields they'd want
     # for the moment, lets just save allergy reference name
     allergy_type_description = Column(String(250))
@@ -287,10 +580,26 @@ class Allergy(Base, GlossSubrecord):
     allergy_start_datetime = Column(DateTime)
     no_allergies = Column(Boolean, default=False)
 
+    def get_match_key(self):
+        return tuple(getattr(self, i) for i in self.MATCH_ON)
+
 
 class Result(Base, GlossSubrecord):
     message_type = message_type.ResultMessage
 
+    # a patient has one result per lab number and profile, see save_result
+    NATURAL_KEY = ("lab_number", "profile_code",)
+
+    __table_args__ = (
+        Index(
+            "ix_result_gloss_reference_id_lab_number_profile_code",
+            "gloss_reference_id",
+            "lab_number",
+            "profile_code",
+            unique=True
+        ),
+    )
+
     lab_number = Column(String(250))
     profile_code = Column(String(250))
     profile_description = Column(String(250))
@@ -298,6 +607,155 @@ class Result(Base, GlossSubrecord):
     observation_datetime = Column(DateTime)
     last_edited = Column(DateTime)
     result_status = Column(String(250))
+    observations = relationship(
+        "Observation",
+        order_by="Observation.position",
+        cascade="all, delete-orphan",
+        back_populates="result"
+    )
+
+    def to_message(self, session, observations=None):
+        """ a result is a composite of the result and its observations
+        """
+        if observations is None:
+            observations = self.observations
+
+        kwargs = vars(self).copy()
+        kwargs["observations"] = [i.to_dict() for i in observations]
+        return self.message_type(**kwargs)
+
+    @classmethod
+    def subrecords_to_messages(cls, subrecords, session):
+        observations = Observation.get_for_results(
+            [i.id for i in subrecords], session
+        )
+        return [
+            i.to_message(session, observations=observations.get(i.id, []))
+            for i in subrecords
+        ]
+
+
+class Observation(Base):
+    """ a test within a result, they're kept in their own table so we can
+        look up a patient's tests without reading all of their results
+    """
+    __table_args__ = (
+        Index(
+            "ix_observation_gloss_reference_id_test_code_observation_datetime",
+            "gloss_reference_id",
+            "test_code",
+            "observation_datetime",
+        ),
+    )
+
+    # the keys of an observation in a ResultMessage
+    FIELDS = (
+        "value_type",
+        "test_code",
+        "test_name",
+        "observation_value",
+        "units",
+        "reference_range",
+        "result_status",
+        "comments",
+    )
+
+    result_id = Column(
+        Integer, ForeignKey('result.id'), index=True, nullable=False
+    )
+    result = relationship("Result", back_populates="observations")
+
+    # copied from the result, see get_latest
+    gloss_reference_id = Column(Integer, ForeignKey('glossolaliareference.id'))
+    gloss_reference = relationship("GlossolaliaReference")
+    observation_datetime = Column(DateTime)
+
+    # where the observation comes in its result
+    position = Column(Integer, nullable=False)
+
+    value_type = Column(String(250))
+    test_code = Column(String(250))
+    test_name = Column(String(250))
+    observation_value = Column(Text)
+    units = Column(String(250))
+    reference_range = Column(String(250))
+    result_status = Column(String(250))
+    comments = Column(Text)
+
+    @classmethod
+    def from_dict(cls, observation, position):
+        return cls(
+            position=position,
+            **{i: observation.get(i) for i in cls.FIELDS}
+        )
+
+    def to_dict(self):
+        return {i: getattr(self, i) for i in self.FIELDS}
+
+    @classmethod
+    def get_for_results(cls, result_ids, session):
+        """ the observations of each result in one query, returned as a
+            dict of result id to observations in order
+        """
+        if not result_ids:
+            return {}
+
+        observations = defaultdict(list)
+        query = session.query(cls).filter(
+            cls.result_id.in_(result_ids)
+        ).order_by(cls.result_id, cls.position)
+
+        for observation in query:
+            observations[observation.result_id].append(observation)
+
+        return observations
+
+    @classmethod
+    def get_latest(cls, gloss_reference_id, session, test_codes=None, limit=1):
+        """ the latest limit observations of each test a patient has had,
+            returned as a dict of test code to observations, newest first.
+
+            Only the observations asked for are read, pass in test_codes to
+            restrict it to those tests
+        """
+        rank = func.row_number().over(
+            partition_by=cls.test_code,
+            order_by=(
+                cls.observation_datetime.desc().nullslast(), cls.id.desc()
+            )
+        ).label("rank")
+        ranked = session.query(cls.id, rank).filter(
+            cls.gloss_reference_id == gloss_reference_id
+        )
+
+        if test_codes is not None:
+            ranked = ranked.filter(cls.test_code.in_(test_codes))
+
+        ranked = ranked.subquery()
+        latest = session.query(cls).join(
+            ranked, cls.id == ranked.c.id
+        ).filter(ranked.c.rank <= limit).order_by(
+            cls.test_code, ranked.c.rank
+        )
+
+        observations = defaultdict(list)
+
+        for observation in latest:
+            observations[observation.test_code].append(observation)
+
+        return observations
+
+
+class ResultHistory(Base):
+    """ a version of a result that's been superseded, only kept if
+        settings.SAVE_RESULT_HISTORY is set
+    """
+    result_id = Column(
+        Integer, ForeignKey('result.id'), index=True, nullable=False
+    )
+    result = relationship("Result")
+    last_edited = Column(DateTime)
+    result_status = Column(String(250))
     observations = Column(Text)
 
 
@@ -305,6 +763,67 @@ class OutgoingMessage(Base):
     count = Column(BigInteger)
 
 
+class OutboxMessage(Base):
+    """ a serialised message container waiting to be sent to an end point,
+        see gloss.subscribers.outbox
+    """
+    __table_args__ = (
+        Index("ix_outboxmessage_end_point_dead_id", "end_point", "dead", "id"),
+        Index(
+            "ix_outboxmessage_issuing_source_hospital_number_id",
+            "issuing_source",
+            "hospital_number",
+            "id"
+        ),
+    )
+
+    end_point = Column(String(250), nullable=False)
+    hospital_number = Column(String(250))
+    issuing_source = Column(String(250))
+    payload = Column(Text, nullable=False)
+    attempts = Column(Integer, default=0, nullable=False)
+    next_attempt = Column(DateTime)
+    last_error = Column(Text)
+    dead = Column(Boolean, default=False, nullable=False)
+
+    @classmethod
+    def enqueue(cls, message_container, end_point, payload, session):
+        outbox_message = cls(
+            end_point=end_point,
+            hospital_number=message_container.hospital_number,
+            issuing_source=message_container.issuing_source,
+            payload=payload
+        )
+        session.add(outbox_message)
+        return outbox_message
+
+    @classmethod
+    def query_pending(cls, end_point, session):
+        return session.query(cls).filter(
+            cls.end_point == end_point, cls.dead == False
+        ).order_by(cls.id)
+
+    @classmethod
+    def query_due(cls, end_point, now, session):
+        """ the pending messages that are due and aren't waiting on an
+            earlier message for the same patient that isn't
+        """
+        earlier = aliased(cls)
+        waiting = session.query(earlier).filter(
+            earlier.end_point == end_point,
+            earlier.dead == False,
+            earlier.issuing_source == cls.issuing_source,
+            earlier.hospital_number == cls.hospital_number,
+            earlier.id < cls.id,
+            earlier.next_attempt > now
+        ).exists()
+
+        return cls.query_pending(end_point, session).filter(
+            or_(cls.next_attempt == None, cls.next_attempt <= now),
+            ~waiting
+        )
+
+
 class GlossolaliaReference(Base):
     pass
 
@@ -344,33 +863,283 @@ def atomic_method(some_fun):
     return wrap_method
 
 
-@atomic_method
-def get_next_message_id(session):
-    outgoing_message = session.query(OutgoingMessage).one_or_none()
+class MessageIdAllocator(object):
+    """ hands out outgoing message ids from blocks of block_size ids
+        reserved in the OutgoingMessage row, so we only go to the
+        database once per block rather than once per message.
 
-    if not outgoing_message:
-        message_id = 1
-        session.add(OutgoingMessage(count=message_id))
-    else:
-        message_id = outgoing_message.count + 1
-        outgoing_message.count = message_id
+        Ids are unique across processes but a process that stops
+        part way through a block leaves a gap.
+    """
+    def __init__(self, block_size):
+        self.block_size = block_size
+        self.lock = threading.Lock()
+        self.clear()
+
+    def reserve_block(self, session):
+        """ returns the first id of a new block
+        """
+        outgoing_message = session.query(
+            OutgoingMessage
+        ).with_for_update().one_or_none()
+
+        if not outgoing_message:
+            # always id 1 so that processes racing to create the row
+            # fail with an integrity error rather than sharing ids
+            outgoing_message = OutgoingMessage(id=1, count=0)
+
+        first_id = outgoing_message.count + 1
+        outgoing_message.count += self.block_size
         session.add(outgoing_message)
+        return first_id
+
+    def get_next(self):
+        with self.lock:
+            if self.next_id > self.last_id:
+                try:
+                    with session_scope() as session:
+                        first_id = self.reserve_block(session)
+                except IntegrityError:
+                    with session_scope() as session:
+                        first_id = self.reserve_block(session)
+
+                self.next_id = first_id
+                self.last_id = first_id + self.block_size - 1
+
+            message_id = self.next_id
+            self.next_id += 1
+            return message_id
+
+    def clear(self):
+        self.next_id = 1
+        self.last_id = 0
+
+
+message_id_allocator = MessageIdAllocator(settings.MESSAGE_ID_BLOCK_SIZE)
+
+
+def get_next_message_id():
+    return message_id_allocator.get_next()
+
+
+class IdentityCache(object):
+    """ an in process map of (issuing_source, hospital_number) to what we
+        know about that patient, e.g. their gloss reference id and
+        subscription state, so hot patients don't cost us a join per
+        message.
+
+        values are staged on the session and only shared with other
+        sessions once it commits. Anything that changes a patient's
+        subscriptions or identity should invalidate them.
+
+        Subscriptions are also changed by other processes, e.g. the api,
+        which can't invalidate our cache, so the EXPIRING answers are only
+        kept for ttl seconds.
+    """
+    EXPIRING = ("is_known", "is_subscribed",)
+
+    def __init__(self, max_size, ttl, timer=time.time):
+        self.cache = LRUCache(max_size)
+        self.expiring_cache = TTLCache(max_size, ttl, timer=timer)
+
+    def get_staged(self, session):
+        return session.info.setdefault("identity_cache", {})
+
+    def get_invalidated(self, session):
+        return session.info.setdefault("identity_cache_invalidated", set())
+
+    def get_shared(self, key, name):
+        if name in self.EXPIRING:
+            return self.expiring_cache.get((key, name,))
+
+        return self.cache.get(key, {}).get(name)
+
+    def get(self, session, issuing_source, hospital_number, name):
+        key = (issuing_source, hospital_number,)
+        staged = self.get_staged(session).get(key, {})
+
+        if name in staged:
+            return staged[name]
+
+        return self.get_shared(key, name)
+
+    def stage(self, session, issuing_source, hospital_number, **values):
+        key = (issuing_source, hospital_number,)
+        self.get_staged(session).setdefault(key, {}).update(values)
+
+    def pop(self, key):
+        self.cache.pop(key)
+
+        for name in self.EXPIRING:
+            self.expiring_cache.pop((key, name,))
+
+    def invalidate(self, session, issuing_source, hospital_number):
+        key = (issuing_source, hospital_number,)
+        self.pop(key)
+        self.get_staged(session).pop(key, None)
+        self.get_invalidated(session).add(key)
 
-    return message_id
+    def after_commit(self, session):
+        for key in self.get_invalidated(session):
+            self.pop(key)
+
+        for key, values in self.get_staged(session).items():
+            cached = dict(self.cache.get(key, {}))
+
+            for name, value in values.items():
+                if name in self.EXPIRING:
+                    self.expiring_cache.set((key, name,), value)
+                else:
+                    cached[name] = value
+
+            if cached:
+                self.cache.set(key, cached)
+
+    def after_transaction_end(self, session, transaction):
+        # the session only loses its transaction when the outermost ends
+        if session.transaction is None:
+            session.info.pop("identity_cache", None)
+            session.info.pop("identity_cache_invalidated", None)
+
+    def clear(self):
+        self.cache.clear()
+        self.expiring_cache.clear()
+
+
+identity_cache = IdentityCache(
+    settings.IDENTITY_CACHE_SIZE, settings.IDENTITY_CACHE_TTL
+)
+event.listen(orm_session.Session, "after_commit", identity_cache.after_commit)
+event.listen(
+    orm_session.Session,
+    "after_transaction_end",
+    identity_cache.after_transaction_end
+)
+
+
+class SubscribedPatients(object):
+    """ an in process set of the (issuing_source, hospital_number) pairs
+        that have an active subscription, so we can skip messages for
+        patients nobody is subscribed to without going to the database.
+
+        It's loaded the first time it's used. subscribe and unsubscribe
+        stage their changes on the session, they're applied once it
+        commits. A merge can move subscriptions between patients so it
+        has the set reloaded.
+
+        Other processes, e.g. the api, subscribe patients without telling
+        us, so if a patient isn't in the set and it was loaded more than
+        ttl seconds ago it's reloaded before we say they aren't subscribed.
+
+        It may hold patients who are no longer subscribed, e.g. the
+        other identifiers of a patient who's unsubscribed.
+    """
+    def __init__(self, ttl, timer=time.time):
+        self.ttl = ttl
+        self.timer = timer
+        self.patients = None
+        self.loaded = None
+
+    def load(self, session):
+        query = session.query(
+            PatientIdentifier.issuing_source, PatientIdentifier.identifier
+        ).join(
+            Subscription,
+            Subscription.gloss_reference_id == PatientIdentifier.gloss_reference_id
+        ).filter(Subscription.active == True)
+        self.loaded = self.timer()
+        self.patients = set(query)
+
+    def is_stale(self):
+        return self.patients is None or self.timer() - self.loaded >= self.ttl
+
+    def contains(self, issuing_source, hospital_number):
+        key = (issuing_source, hospital_number,)
+
+        if self.patients is None or (
+            key not in self.patients and self.is_stale()
+        ):
+            with session_scope() as session:
+                self.load(session)
+
+        return key in self.patients
+
+    def get_staged(self, session):
+        return session.info.setdefault("subscribed_patients", [])
+
+    def stage(self, session, issuing_source, hospital_number, subscribed):
+        self.get_staged(session).append(
+            ((issuing_source, hospital_number,), subscribed,)
+        )
+
+    def stage_reload(self, session):
+        session.info["subscribed_patients_reload"] = True
+
+    def after_commit(self, session):
+        if session.info.get("subscribed_patients_reload"):
+            self.patients = None
+
+        if self.patients is None:
+            return
+
+        for key, subscribed in self.get_staged(session):
+            if subscribed:
+                self.patients.add(key)
+            else:
+                self.patients.discard(key)
+
+    def after_transaction_end(self, session, transaction):
+        if session.transaction is None:
+            session.info.pop("subscribed_patients", None)
+            session.info.pop("subscribed_patients_reload", None)
+
+    def clear(self):
+        self.patients = None
+
+
+subscribed_patients = SubscribedPatients(settings.SUBSCRIBED_PATIENTS_TTL)
+event.listen(
+    orm_session.Session, "after_commit", subscribed_patients.after_commit
+)
+event.listen(
+    orm_session.Session,
+    "after_transaction_end",
+    subscribed_patients.after_transaction_end
+)
 
 
 # we need to get subscription from hospital number
 def is_subscribed(hospital_number, session=None, issuing_source="uclh"):
-    subscription = Subscription.query_from_identifier(
-        hospital_number, issuing_source, session
+    subscribed = identity_cache.get(
+        session, issuing_source, hospital_number, "is_subscribed"
     )
-    return subscription.filter(Subscription.active == True).count()
+
+    if subscribed is None:
+        subscription = Subscription.query_from_identifier(
+            hospital_number, issuing_source, session
+        )
+        subscribed = subscription.filter(Subscription.active == True).count()
+        identity_cache.stage(
+            session, issuing_source, hospital_number, is_subscribed=subscribed
+        )
+
+    return subscribed
 
 
 def is_known(hospital_number, session=None, issuing_source="uclh"):
-    return Subscription.query_from_identifier(
-        hospital_number, issuing_source, session
-    ).count()
+    known = identity_cache.get(
+        session, issuing_source, hospital_number, "is_known"
+    )
+
+    if known is None:
+        known = Subscription.query_from_identifier(
+            hospital_number, issuing_source, session
+        ).count()
+        identity_cache.stage(
+            session, issuing_source, hospital_number, is_known=known
+        )
+
+    return known
 
 
 def subscribe(hospital_number, end_point, session, issuing_source):
@@ -381,6 +1150,9 @@ def subscribe(hospital_number, end_point, session, issuing_source):
         hospital_number, issuing_source, session
     ).one_or_none()
 
+    identity_cache.invalidate(session, issuing_source, hospital_number)
+    subscribed_patients.stage(session, issuing_source, hospital_number, True)
+
     if subscription:
         if not subscription.active:
             subscription.active = True
@@ -403,12 +1175,240 @@ def unsubscribe(hospital_number, session, issuing_source):
         hospital_number, issuing_source, session
     ).one_or_none()
 
+    identity_cache.invalidate(session, issuing_source, hospital_number)
+    subscribed_patients.stage(session, issuing_source, hospital_number, False)
+
     if subscription:
         subscription.active = False
         session.add(subscription)
 
 
+def merge_patients(gloss_reference, new_reference, session):
+    """ records that the patient with gloss_reference is now the patient
+        with new_reference and moves everything we know about them over
+    """
+    # a patient can only be merged into one other patient
+    merge = session.query(Merge).filter(
+        Merge.gloss_reference == gloss_reference
+    ).one_or_none()
+
+    if merge:
+        merge.new_reference = new_reference
+    else:
+        merge = Merge(
+            new_reference=new_reference, gloss_reference=gloss_reference
+        )
+
+    session.add(merge)
+    repoint_subrecords(gloss_reference, new_reference, session)
+    subscribed_patients.stage_reload(session)
+    return merge
+
+
+def repoint_subrecords(gloss_reference, new_reference, session):
+    """ moves the subrecords of one gloss reference to another with an
+        update per table.
+
+        Things a patient can only have one of are only moved if the new
+        gloss reference doesn't have one already, likewise things with a
+        NATURAL_KEY the new gloss reference already has a match for
+    """
+    session.flush()
+
+    for subrecord in itersubclasses(GlossSubrecord):
+        if not subrecord.REPOINT_ON_MERGE:
+            continue
+
+        if subrecord.ONE_PER_GLOSS_REFERENCE:
+            already_has_one = session.query(
+                subrecord.query_by_gloss_id(new_reference, session).exists()
+            ).scalar()
+
+            if already_has_one:
+                continue
+
+        query = session.query(subrecord).filter(
+            subrecord.gloss_reference_id == gloss_reference.id
+        )
+        synchronize_session = "evaluate"
+
+        if subrecord.NATURAL_KEY:
+            # leave behind anything the new gloss reference already has
+            existing = aliased(subrecord)
+            query = query.filter(~session.query(existing).filter(
+                existing.gloss_reference_id == new_reference.id,
+                *[
+                    getattr(existing, i) == getattr(subrecord, i)
+                    for i in subrecord.NATURAL_KEY
+                ]
+            ).exists())
+            synchronize_session = "fetch"
+
+        query.update(
+            {subrecord.gloss_reference_id: new_reference.id},
+            synchronize_session=synchronize_session
+        )
+
+    # observations keep a copy of their result's gloss reference
+    moved_results = session.query(Result.id).filter(
+        Result.gloss_reference_id == new_reference.id
+    )
+    session.query(Observation).filter(
+        Observation.gloss_reference_id == gloss_reference.id,
+        Observation.result_id.in_(moved_results.subquery())
+    ).update(
+        {Observation.gloss_reference_id: new_reference.id},
+        synchronize_session="fetch"
+    )
+
+
+def save_result(message, gloss_reference, session):
+    """ creates or updates the result with the message's lab number and
+        profile code, returns the result and whether it was saved.
+
+        Messages last edited before the result we have are ignored, if
+        settings.SAVE_RESULT_HISTORY is set the version being replaced is
+        kept in ResultHistory
+    """
+    result = session.query(Result).filter(
+        Result.gloss_reference == gloss_reference,
+        Result.lab_number == message.lab_number,
+        Result.profile_code == message.profile_code
+    ).one_or_none()
+
+    if result is None:
+        result = Result(gloss_reference=gloss_reference)
+    else:
+        is_stale = message.last_edited and result.last_edited and (
+            message.last_edited < result.last_edited
+        )
+
+        if is_stale:
+            return result, False
+
+        if settings.SAVE_RESULT_HISTORY:
+            session.add(ResultHistory(
+                result=result,
+                last_edited=result.last_edited,
+                result_status=result.result_status,
+                observations=json.dumps(
+                    [i.to_dict() for i in result.observations]
+                )
+            ))
+
+    for field, value in message.field_values().items():
+        if field != "observations":
+            setattr(result, field, value)
+
+    result.observations = [
+        Observation.from_dict(observation, position)
+        for position, observation in enumerate(message.observations)
+    ]
+
+    for observation in result.observations:
+        observation.gloss_reference = gloss_reference
+        observation.observation_datetime = result.observation_datetime
+
+    session.add(result)
+    return result, True
+
+
+def update_patient(message, gloss_reference, session):
+    """ updates a patient's demographics with a message in one statement,
+        it only writes if the patient is known, i.e. has a subscription,
+        and one of their demographics differs from the message.
+
+        Returns whether the patient was updated
+    """
+    if gloss_reference.id is None:
+        # we've only just created them, so they can't be known
+        return False
+
+    values = message.field_values()
+    differs = []
+
+    for field, value in values.items():
+        column = getattr(Patient, field)
+
+        if value is None:
+            differs.append(column != None)
+        else:
+            differs.append(or_(column != value, column == None))
+
+    is_known = session.query(Subscription).filter(
+        Subscription.gloss_reference_id == gloss_reference.id
+    ).exists()
+    updated = session.query(Patient).filter(
+        Patient.gloss_reference_id == gloss_reference.id,
+        is_known,
+        or_(*differs)
+    ).update(values, synchronize_session=False)
+
+    if updated:
+        for instance in session.identity_map.values():
+            is_patient = isinstance(instance, Patient) and (
+                instance.gloss_reference_id == gloss_reference.id
+            )
+
+            if is_patient:
+                session.expire(instance)
+
+    return bool(updated)
+
+
+def save_allergies(messages, gloss_reference, session):
+    """ makes a patient's allergies match the messages, a patient's
+        allergies are always sent as a whole list.
+
+        Allergies are matched to messages by their Allergy.MATCH_ON fields,
+        only the ones that differ are updated and only the ones that
+        aren't in the messages are deleted. Returns whether anything
+        changed
+    """
+    existing = defaultdict(list)
+    changed = False
+    query = session.query(Allergy).filter(
+        Allergy.gloss_reference == gloss_reference
+    ).order_by(Allergy.id)
+
+    for allergy in query:
+        existing[allergy.get_match_key()].append(allergy)
+
+    for message in messages:
+        field_values = message.field_values()
+        match_key = tuple(field_values.get(i) for i in Allergy.MATCH_ON)
+        matches = existing.get(match_key)
+
+        if matches:
+            allergy = matches.pop(0)
+        else:
+            allergy = Allergy(gloss_reference=gloss_reference)
+            session.add(allergy)
+            changed = True
+
+        for field, value in field_values.items():
+            if getattr(allergy, field) != value:
+                setattr(allergy, field, value)
+                changed = True
+
+    for allergy in chain.from_iterable(existing.values()):
+        session.delete(allergy)
+        changed = True
+
+    return changed
+
+
 def get_gloss_reference(hospital_number, session, issuing_source="uclh"):
+    gloss_reference_id = identity_cache.get(
+        session, issuing_source, hospital_number, "gloss_reference_id"
+    )
+
+    if gloss_reference_id is not None:
+        # we know the row exists, so don't load it until someone needs it
+        gloss_reference = GlossolaliaReference(id=gloss_reference_id)
+        make_transient_to_detached(gloss_reference)
+        return session.merge(gloss_reference, load=False)
+
     gloss_information = session.query(GlossolaliaReference, PatientIdentifier).\
     filter(PatientIdentifier.gloss_reference_id == GlossolaliaReference.id).\
     filter(PatientIdentifier.issuing_source == issuing_source).\
@@ -416,6 +1416,12 @@ def get_gloss_reference(hospital_number, session, issuing_source="uclh"):
 
     # we should change this to only query for gloss id rather than all 3 columns
     if gloss_information:
+        identity_cache.stage(
+            session,
+            issuing_source,
+            hospital_number,
+            gloss_reference_id=gloss_information[0].id
+        )
         return gloss_information[0]
 
 def save_identifier(hospital_number, session, issuing_source="uclh"):
@@ -498,10 +1504,23 @@ def get_or_create_location(message, inpatient_admission, session):
 
 def patient_to_message_container(hospital_number, issuing_source, session):
     messages = []
+    gloss_reference = get_gloss_reference(
+        hospital_number, session, issuing_source=issuing_source
+    )
+
+    # settings.MOCK_API returns its data for patients we don't know
+    if gloss_reference is None and not getattr(settings, "MOCK_API", None):
+        return message_type.construct_message_container(
+            messages, hospital_number
+        )
+
     for subRecord in itersubclasses(GlossSubrecord):
         if subRecord.PART_OF_BULK_DOWNLOAD:
             messages.extend(subRecord.to_messages(
-                hospital_number, issuing_source, session
+                hospital_number,
+                issuing_source,
+                session,
+                gloss_reference_id=getattr(gloss_reference, "id", None)
             ))
 
     return message_type.construct_message_container(messages, hospital_number)
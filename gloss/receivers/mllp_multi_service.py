@@ -1,23 +1,93 @@
+from collections import Counter
+
 from twisted.internet import endpoints
 from twisted.application.service import MultiService
 from twisted.application import internet
 from twisted.logger import Logger
-from txHL7.receiver import AbstractHL7Receiver
+from txHL7.receiver import AbstractHL7Receiver, MessageContainer
 from twisted.internet import defer
 
+from gloss.conf import settings
+from gloss.importers.hl7_importer import (
+    any_subscribed, get_header_hospital_numbers, is_ignored
+)
+from gloss.translators.hl7.header import peek_header
+from gloss.translators.hl7.lazy_message import LazyMessage
+
 DEFAULT_SERVICES=""
 
 
+class LazyHL7MessageContainer(MessageContainer):
+    """ reads the header with peek_header, the message itself is a
+        LazyMessage that's only split up as it's read
+    """
+    def __init__(self, raw_message):
+        super(LazyHL7MessageContainer, self).__init__(raw_message)
+        self.header = peek_header(raw_message)
+        self._message = None
+
+    @property
+    def message(self):
+        if self._message is None:
+            self._message = LazyMessage(self.raw_message)
+        return self._message
+
+    def ack(self, ack_code='AA'):
+        return unicode(self.message.create_ack(ack_code))
+
+
 class OhcReceiver(AbstractHL7Receiver):
+    """ messages we know from their header we won't import are acked
+        and dropped without being parsed, dropped_counts is how many
+        of each message type have been.
+
+        if filter_unsubscribed is set, or settings.FILTER_UNSUBSCRIBED if
+        it isn't passed in, so are messages whose header says they're for
+        patients who aren't subscribed, skipped_counts is how many of
+        each message type have been
+    """
     log = Logger(namespace="receiver")
+    message_cls = LazyHL7MessageContainer
 
-    def __init__(self, gloss_service):
+    def __init__(self, gloss_service, filter_unsubscribed=None):
         self.gloss_service = gloss_service
+        self._filter_unsubscribed = filter_unsubscribed
+        self.dropped_counts = Counter()
+        self.skipped_counts = Counter()
+
+    @property
+    def filter_unsubscribed(self):
+        if self._filter_unsubscribed is None:
+            return settings.FILTER_UNSUBSCRIBED
+        return self._filter_unsubscribed
+
+    def is_unsubscribed(self, header):
+        if header is None or not self.filter_unsubscribed:
+            return False
+
+        return not any_subscribed(
+            get_header_hospital_numbers(header),
+            self.gloss_service.issuing_source
+        )
 
     def handleMessage(self, container):
-        message = container.message
-        self.log.info(str(message).replace("\r", "\n"))
-        self.gloss_service.importer(message, self.gloss_service)
+        self.log.info(container.raw_message.replace("\r", "\n"))
+        header = container.header
+
+        if header is None:
+            message_type = None
+        else:
+            message_type = u"{0}^{1}".format(
+                header.message_type, header.trigger_event
+            )
+
+        if header is not None and is_ignored(header):
+            self.dropped_counts[message_type] += 1
+        elif self.is_unsubscribed(header):
+            self.skipped_counts[message_type] += 1
+        else:
+            self.gloss_service.importer(container.message, self.gloss_service)
+
         # We succeeded, so ACK back (default is AA)
         return self.ack(container)
 
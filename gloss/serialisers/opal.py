@@ -1,8 +1,12 @@
 import json
+import time
 import datetime
 import requests
+from requests.adapters import HTTPAdapter
 from gloss.conf import settings
 from twisted.logger import Logger
+from twisted.internet import task, threads
+from twisted.python.threadpool import ThreadPool
 
 
 class OpalJSONSerialiser(json.JSONEncoder):
@@ -33,3 +37,141 @@ def send_to_opal(message_container, end_point):
         )
 
     return
+
+
+# data is posted already encoded with OpalJSONSerialiser
+JSON_HEADERS = {"Content-Type": "application/json"}
+
+
+class OpalSender(object):
+    """ Sends message containers to an opal application over a pool of
+        kept alive connections.
+
+        When the reactor is running the post happens in a bounded pool of
+        threads so that we can ack the sender without waiting for opal,
+        posts that fail with a requests.RequestException are retried with
+        an exponential backoff, anything else is logged. Otherwise,
+        e.g. when replaying files, it blocks until the message is sent
+    """
+    log = Logger(namespace="to_opal")
+
+    def __init__(
+        self, end_point, max_connections=None, timeout=None, retries=None,
+        backoff=None, reactor=None
+    ):
+        self.end_point = end_point
+        self.max_connections = max_connections or settings.OPAL_MAX_CONNECTIONS
+        self.timeout = timeout or settings.OPAL_TIMEOUT
+
+        if retries is None:
+            retries = settings.OPAL_RETRIES
+        self.retries = retries
+
+        if backoff is None:
+            backoff = settings.OPAL_RETRY_BACKOFF
+        self.backoff = backoff
+
+        self._reactor = reactor
+        self.threadpool = None
+        self.http = requests.Session()
+        adapter = HTTPAdapter(
+            pool_connections=1, pool_maxsize=self.max_connections
+        )
+        self.http.mount("http://", adapter)
+        self.http.mount("https://", adapter)
+
+    @property
+    def reactor(self):
+        if self._reactor is None:
+            from twisted.internet import reactor
+            self._reactor = reactor
+        return self._reactor
+
+    def get_threadpool(self):
+        if self.threadpool is None:
+            self.threadpool = ThreadPool(
+                minthreads=0, maxthreads=self.max_connections, name="to_opal"
+            )
+            self.threadpool.start()
+            self.reactor.addSystemEventTrigger(
+                "during", "shutdown", self.threadpool.stop
+            )
+        return self.threadpool
+
+    def defer_to_thread(self, some_fun, *args):
+        return threads.deferToThreadPool(
+            self.reactor, self.get_threadpool(), some_fun, *args
+        )
+
+    def get_delay(self, attempt):
+        return self.backoff * 2 ** attempt
+
+    def post(self, data):
+        """ posts to opal, raises for anything worth retrying
+        """
+        response = self.http.post(
+            self.end_point,
+            data=data,
+            headers=JSON_HEADERS,
+            timeout=self.timeout
+        )
+
+        if response.status_code >= 500:
+            response.raise_for_status()
+
+        if response.status_code > 300:
+            self.log.error(
+                "failed to send to elcid with {}".format(response.status_code)
+            )
+
+        return response
+
+    def give_up(self, e):
+        self.log.error(
+            "failed to send to {0} after {1} retries with {2}".format(
+                self.end_point, self.retries, e
+            )
+        )
+
+    def send(self, message_container):
+        """ returns a deferred that fires once the message has been
+            sent (or given up on) if the reactor is running
+        """
+        data = json.dumps(message_container.to_dict(), cls=OpalJSONSerialiser)
+
+        if self.reactor.running:
+            return self.deliver(data)
+        else:
+            self.deliver_blocking(data)
+
+    def deliver(self, data, attempt=0):
+        deferred = self.defer_to_thread(self.post, data)
+        deferred.addErrback(self.retry, data, attempt)
+        return deferred
+
+    def retry(self, failure, data, attempt):
+        if not failure.check(requests.RequestException):
+            self.log.failure(
+                "failed to send to {end_point}", failure,
+                end_point=self.end_point
+            )
+            return
+
+        if attempt >= self.retries:
+            self.give_up(failure.value)
+            return
+
+        return task.deferLater(
+            self.reactor, self.get_delay(attempt),
+            self.deliver, data, attempt + 1
+        )
+
+    def deliver_blocking(self, data):
+        for attempt in range(self.retries + 1):
+            try:
+                return self.post(data)
+            except requests.RequestException as e:
+                if attempt < self.retries:
+                    time.sleep(self.get_delay(attempt))
+
+        self.give_up(e)
@@ -0,0 +1,185 @@
+"""
+A durable outbox for sending messages to an opal application.
+
+QueueAllMessages saves every message container to the outbox table in the
+same transaction as everything else we do with a message, an
+OutboxDispatcher then drains the outbox in the background so that opal
+being down or slow doesn't lose messages or hold up the receivers.
+"""
+import datetime
+import json
+
+from twisted.application.internet import TimerService
+from twisted.internet import threads
+from twisted.logger import Logger
+
+from gloss.conf import settings
+from gloss.models import atomic_method, session_scope, OutboxMessage
+from gloss.serialisers.opal import OpalJSONSerialiser, OpalSender
+from gloss.subscribers.base_subscriber import BaseSubscriber
+
+
+class OutboxDeliveryError(Exception):
+    pass
+
+
+class QueueAllMessages(BaseSubscriber):
+    def __init__(self, *args, **kwargs):
+        self.end_point = kwargs.pop("end_point")
+        super(QueueAllMessages, self).__init__(*args, **kwargs)
+
+    @atomic_method
+    def notify(self, message_container, gloss_service, session):
+        if not message_container.changed:
+            return
+
+        payload = json.dumps(
+            message_container.to_dict(), cls=OpalJSONSerialiser
+        )
+        OutboxMessage.enqueue(
+            message_container, self.end_point, payload, session
+        )
+
+
+class OutboxDispatcher(object):
+    """
+    Sends the outbox for an end point a batch at a time.
+
+    If batch_size is more than 1 the end point is sent a json list of
+    message containers, otherwise the message container on its own as
+    SendAllMessages would.
+
+    Messages for a patient are always sent in the order they were queued,
+    if one fails the ones after it wait until it's been sent or given up
+    on. After max_attempts failures a message is dead lettered, it stays
+    in the outbox with dead set and its last error.
+    """
+    log = Logger(namespace="outbox")
+
+    def __init__(
+        self, end_point, batch_size=None, interval=None, max_attempts=None
+    ):
+        self.end_point = end_point
+        self.batch_size = batch_size or settings.OUTBOX_BATCH_SIZE
+        self.interval = interval or settings.OUTBOX_INTERVAL
+        self.max_attempts = max_attempts or settings.OUTBOX_MAX_ATTEMPTS
+        self.sender = OpalSender(end_point, retries=0)
+
+    def get_batch(self, session, now):
+        """ the next batch_size messages that are due and aren't waiting
+            on an earlier message for the same patient
+        """
+        return OutboxMessage.query_due(
+            self.end_point, now, session
+        ).limit(self.batch_size).all()
+
+    def get_delay(self, attempts):
+        return min(
+            settings.OPAL_RETRY_BACKOFF * 2 ** attempts,
+            settings.OUTBOX_MAX_BACKOFF
+        )
+
+    def post(self, batch):
+        if self.batch_size > 1:
+            data = "[{}]".format(",".join(i.payload for i in batch))
+        else:
+            data = batch[0].payload
+
+        response = self.sender.post(data)
+
+        if response.status_code > 300:
+            raise OutboxDeliveryError(
+                "{0} returned {1}".format(self.end_point, response.status_code)
+            )
+
+    def failed(self, outbox_message, e, now):
+        outbox_message.attempts += 1
+        outbox_message.last_error = str(e)
+        outbox_message.next_attempt = now + datetime.timedelta(
+            seconds=self.get_delay(outbox_message.attempts)
+        )
+
+        if outbox_message.attempts >= self.max_attempts:
+            outbox_message.dead = True
+            self.log.error(
+                "dead lettered outbox message {0} with {1}".format(
+                    outbox_message.id, e
+                )
+            )
+
+    def deliver(self, batch, session, now):
+        """ sends the batch in one go, if that fails falls back to
+            sending a message at a time, returns how many were sent
+        """
+        try:
+            self.post(batch)
+        except Exception as e:
+            if len(batch) == 1:
+                self.failed(batch[0], e, now)
+                return 0
+
+            self.log.error(
+                "failed to send a batch of {0} messages with {1}".format(
+                    len(batch), e
+                )
+            )
+        else:
+            for outbox_message in batch:
+                session.delete(outbox_message)
+            return len(batch)
+
+        sent = 0
+        blocked = set()
+
+        for outbox_message in batch:
+            patient = (
+                outbox_message.issuing_source, outbox_message.hospital_number,
+            )
+
+            if patient in blocked:
+                continue
+
+            try:
+                self.post([outbox_message])
+            except Exception as e:
+                blocked.add(patient)
+                self.failed(outbox_message, e, now)
+            else:
+                session.delete(outbox_message)
+                sent += 1
+
+        return sent
+
+    def dispatch(self):
+        """ drains the outbox until there's nothing left that's due or
+            nothing can be sent, returns how many messages were sent
+        """
+        total = 0
+
+        while True:
+            now = datetime.datetime.utcnow()
+
+            with session_scope() as session:
+                batch = self.get_batch(session, now)
+
+                if not batch:
+                    break
+
+                sent = self.deliver(batch, session, now)
+
+            total += sent
+
+            if not sent:
+                break
+
+        return total
+
+    def make_service(self, gloss_service):
+        """ a twisted service that dispatches every interval seconds
+            outside of the reactor thread
+        """
+        service = TimerService(
+            self.interval, threads.deferToThread, self.dispatch
+        )
+        service.setName(u"gloss-outbox-{0}".format(self.end_point))
+        return service
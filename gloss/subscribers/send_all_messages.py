@@ -1,5 +1,5 @@
 from gloss.subscribers.base_subscriber import BaseSubscriber
-from gloss.serialisers.opal import send_to_opal
+from gloss.serialisers.opal import OpalSender
 from gloss.models import atomic_method
 
 
@@ -7,7 +7,9 @@ class SendAllMessages(BaseSubscriber):
     def __init__(self, *args, **kwargs):
         self.end_point = kwargs.pop("end_point")
         super(SendAllMessages, self).__init__(*args, **kwargs)
+        self.sender = OpalSender(self.end_point)
 
     @atomic_method
     def notify(self, message_container, gloss_service, session):
-        send_to_opal(message_container, self.end_point)
+        if message_container.changed:
+            self.sender.send(message_container)
@@ -0,0 +1,70 @@
+"""
+Micro benchmark of LazyMessage against hl7.parse over the ORU fixtures
+in gloss.tests.test_messages, both on their own and when translated
+
+    GLOSS_APP=sites.uch.settings python gloss/tests/benchmark_lazy_message.py
+"""
+import argparse
+import sys
+import timeit
+
+sys.path.append(".")
+
+import hl7
+
+from gloss.tests.test_messages import MESSAGE_TYPES
+from gloss.translators.hl7.hl7_translator import HL7Translator
+from gloss.translators.hl7.lazy_message import LazyMessage
+
+ORU_MESSAGES = [
+    i for i in MESSAGE_TYPES.values() if hl7.parse(i).segment(
+        "MSH"
+    )[9][0][0][0] == "ORU"
+]
+
+
+def translate(message):
+    # some of the fixtures are examples of messages we can't translate
+    try:
+        HL7Translator.translate(message)
+    except ValueError:
+        pass
+
+
+def with_hl7_parse():
+    for raw_message in ORU_MESSAGES:
+        hl7.parse(raw_message)
+
+
+def with_lazy_message():
+    for raw_message in ORU_MESSAGES:
+        LazyMessage(raw_message)
+
+
+def with_hl7_parse_and_translate():
+    for raw_message in ORU_MESSAGES:
+        translate(hl7.parse(raw_message))
+
+
+def with_lazy_message_and_translate():
+    for raw_message in ORU_MESSAGES:
+        translate(LazyMessage(raw_message))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description='Benchmark LazyMessage against hl7.parse',
+    )
+    parser.add_argument('--number', type=int, default=1000)
+    args = parser.parse_args()
+
+    for benchmark in [
+        with_hl7_parse,
+        with_lazy_message,
+        with_hl7_parse_and_translate,
+        with_lazy_message_and_translate,
+    ]:
+        taken = timeit.timeit(benchmark, number=args.number)
+        print "{0}: {1:.3f}s for {2} messages".format(
+            benchmark.__name__, taken, args.number * len(ORU_MESSAGES)
+        )
@@ -0,0 +1,113 @@
+"""
+Micro benchmark of building and serialising message types, run over the
+messages in gloss.tests.test_messages
+
+    GLOSS_APP=sites.uch.settings python gloss/tests/benchmark_messages.py
+"""
+import argparse
+import sys
+import timeit
+
+sys.path.append(".")
+
+import mock
+
+from gloss.importers.hl7_importer import HL7Importer
+from gloss.message_type import MessageType, serialise_value
+from gloss.tests.test_messages import MESSAGE_TYPES, read_message
+
+GLOSS_SERVICE = mock.MagicMock(issuing_source="uclh")
+
+HL7_MESSAGES = []
+
+MESSAGES = []
+
+for raw_message in MESSAGE_TYPES.values():
+    hl7_message = read_message(raw_message)
+
+    # some of the fixtures are examples of messages we can't import
+    try:
+        message_container = HL7Importer().import_message(
+            hl7_message, GLOSS_SERVICE
+        )
+    except ValueError:
+        continue
+
+    if message_container:
+        HL7_MESSAGES.append(hl7_message)
+        MESSAGES.extend(message_container.messages)
+
+FIELD_VALUES = [(i.__class__, i.field_values()) for i in MESSAGES]
+
+
+def generic_to_dict(message):
+    """ to_dict as it was before the generated versions, by looking up
+        each field
+    """
+    if not isinstance(message, MessageType):
+        return message
+
+    result = {}
+
+    for key, value in message.field_values().iteritems():
+        if isinstance(value, dict):
+            result[key] = {i: generic_to_dict(v) for i, v in value.iteritems()}
+        elif hasattr(value, "__iter__"):
+            result[key] = [generic_to_dict(i) for i in value]
+        else:
+            result[key] = serialise_value(value)
+
+    return result
+
+
+def with_init():
+    for message_class, field_values in FIELD_VALUES:
+        message_class(**field_values)
+
+
+def with_generic_to_dict():
+    for message in MESSAGES:
+        generic_to_dict(message)
+
+
+def with_to_dict():
+    for message in MESSAGES:
+        message.to_dict()
+
+
+def with_import_and_to_dict():
+    for hl7_message in HL7_MESSAGES:
+        HL7Importer().import_message(hl7_message, GLOSS_SERVICE).to_dict()
+
+
+def get_size(message):
+    size = sys.getsizeof(message)
+
+    if hasattr(message, "__dict__"):
+        size += sys.getsizeof(message.__dict__)
+
+    return size
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description='Benchmark message types',
+    )
+    parser.add_argument('--number', type=int, default=1000)
+    args = parser.parse_args()
+
+    for benchmark in [
+        with_init, with_generic_to_dict, with_to_dict, with_import_and_to_dict
+    ]:
+        taken = timeit.timeit(benchmark, number=args.number)
+        print "{0}: {1:.3f}s for {2} messages".format(
+            benchmark.__name__, taken, args.number * len(MESSAGES)
+        )
+
+    sizes = {}
+
+    for message in MESSAGES:
+        sizes[message.__class__.__name__] = get_size(message)
+
+    for name, size in sorted(sizes.items()):
+        print "{0}: {1} bytes".format(name, size)
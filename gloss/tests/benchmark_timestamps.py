@@ -0,0 +1,52 @@
+"""
+Micro benchmark of the HL7 timestamp parser against strptime
+
+    python gloss/tests/benchmark_timestamps.py
+"""
+import argparse
+import sys
+import timeit
+from datetime import datetime
+
+sys.path.append(".")
+
+from gloss.translators.hl7.segments import (
+    DATETIME_FORMAT, parse_datetime
+)
+
+# a results message repeats the same observation datetime
+# across its OBRs, so most lookups are for a handful of values
+TIMESTAMPS = [
+    "201411121600", "201411121606", "201411121608", "201411121609"
+] * 25
+
+
+def with_strptime():
+    for timestamp in TIMESTAMPS:
+        datetime.strptime(timestamp, DATETIME_FORMAT)
+
+
+def with_parse_datetime():
+    for timestamp in TIMESTAMPS:
+        parse_datetime(timestamp)
+
+
+def with_parse_datetime_uncached():
+    for timestamp in TIMESTAMPS:
+        parse_datetime.__wrapped__(timestamp)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description='Benchmark HL7 timestamp parsing',
+    )
+    parser.add_argument('--number', type=int, default=1000)
+    args = parser.parse_args()
+
+    for benchmark in [
+        with_strptime, with_parse_datetime_uncached, with_parse_datetime
+    ]:
+        taken = timeit.timeit(benchmark, number=args.number)
+        print "{0}: {1:.3f}s for {2} timestamps".format(
+            benchmark.__name__, taken, args.number * len(TIMESTAMPS)
+        )
@@ -1,12 +1,14 @@
-import json
 from unittest import TestCase
 from gloss.models import (
     engine, GlossolaliaReference, PatientIdentifier, InpatientAdmission,
-    Subscription, Patient, Allergy, InpatientLocation, Base, Result
+    Subscription, Patient, Allergy, InpatientLocation, Base, Result,
+    Observation,
+    identity_cache, message_id_allocator, subscribed_patients
 )
 from sqlalchemy.orm import sessionmaker
 from datetime import datetime, date
 from gloss.conf import settings
+from gloss.information_source import not_found_cache
 from mock import patch, MagicMock
 
 
@@ -14,6 +16,11 @@ class GlossTestCase(TestCase):
     def setUp(self):
         Base.metadata.drop_all(engine)
         Base.metadata.create_all(engine)
+        identity_cache.clear()
+        message_id_allocator.clear()
+        not_found_cache.clear()
+        subscribed_patients.clear()
+        self.gloss_references = {}
         Session = sessionmaker(engine)
         self.session = Session()
         self.patch_session = patch(
@@ -24,6 +31,10 @@ class GlossTestCase(TestCase):
         self.patch_close.start()
         self.patch_requests_post = patch("requests.post")
         self.mock_requests_post = self.patch_requests_post.start()
+        self.patch_requests_session_post = patch(
+            "requests.Session.post", self.mock_requests_post
+        )
+        self.patch_requests_session_post.start()
         self.patch_socket = patch("socket.socket")
         self.mock_socket = self.patch_socket.start()
 
@@ -39,13 +50,20 @@ class GlossTestCase(TestCase):
         self.mock_mllp_client.return_value = self.mllp_api_client_instance
         self.mllp_api_client_instance.__enter__ = enter
 
+        self.patch_demographics_send = patch(
+            "gloss.external_api.send_message", self.mock_mllp_send
+        )
+        self.patch_demographics_send.start()
+
     def tearDown(self):
         self.patch_session.stop()
         self.patch_close.stop()
         self.patch_requests_post.stop()
+        self.patch_requests_session_post.stop()
         self.patch_socket.stop()
         self.session.close()
         self.patch_mllp_client.stop()
+        self.patch_demographics_send.stop()
         Base.metadata.drop_all(engine)
 
     def create_subrecord(self, some_class):
@@ -56,7 +74,14 @@ class GlossTestCase(TestCase):
     def create_subrecord_with_id(
         self, some_class, identifier, issuing_source="uclh", subscribed=True
     ):
+        # identifiers are unique, so subrecords for the same identifier
+        # share a gloss reference
+        key = (identifier, issuing_source,)
+        if key in self.gloss_references:
+            return some_class(gloss_reference=self.gloss_references[key])
+
         subrecord = self.create_subrecord(some_class)
+        self.gloss_references[key] = subrecord.gloss_reference
         hospital_identifier = PatientIdentifier(
             identifier=identifier,
             issuing_source=issuing_source,
@@ -149,7 +174,7 @@ class GlossTestCase(TestCase):
             "lab_number": None,
             "last_edited": None,
             "observation_datetime": None,
-            "observations": json.dumps(observations),
+            "observations": observations,
             "request_datetime": None
         }
 
@@ -158,8 +183,15 @@ class GlossTestCase(TestCase):
             Result, identifier, issuing_source
         )
         result_dict = self.get_result_dict()
+        observations = result_dict.pop("observations")
         for k, v in result_dict.iteritems():
             setattr(result, k, v)
+        result.observations = [
+            Observation.from_dict(observation, position)
+            for position, observation in enumerate(observations)
+        ]
+        for observation in result.observations:
+            observation.gloss_reference = result.gloss_reference
         return result
 
     def create_patient(self, identifier, issuing_source):
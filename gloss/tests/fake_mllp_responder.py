@@ -0,0 +1,84 @@
+"""
+A local MLLP server that answers queries with canned responses, so that
+MLLP clients can be tested offline. By default every message gets an AA
+acknowledgement, e.g.
+
+    python -m gloss.tests.fake_mllp_responder 8155
+"""
+import SocketServer
+import sys
+import threading
+
+from gloss.mllp_client import SB, EB, CR, get_control_id
+
+
+def acknowledge(message):
+    return "MSH|^~\\&|FAKE|FAKE|ELCID|UCLH|||ACK|1|P|2.4\rMSA|AA|{}".format(
+        get_control_id(message)
+    )
+
+
+class FakeMLLPHandler(SocketServer.BaseRequestHandler):
+    def handle(self):
+        self.server.connection_count += 1
+        buffer = b""
+
+        while True:
+            data = self.request.recv(4096)
+
+            if not data:
+                return
+
+            buffer += data
+
+            while EB in buffer:
+                frame, buffer = buffer.split(EB, 1)
+                buffer = buffer.lstrip(CR)
+                message = frame[frame.find(SB) + 1:].decode("utf-8")
+                self.server.received.append(message)
+                responses = self.server.respond(message)
+
+                if responses is None:
+                    return
+
+                if not isinstance(responses, list):
+                    responses = [responses]
+
+                self.request.sendall(b"".join(
+                    SB + i.encode("utf-8") + EB + CR for i in responses
+                ))
+
+
+class FakeMLLPResponder(SocketServer.ThreadingTCPServer):
+    """ respond takes the message we've received and returns a response,
+        a list of responses, or None to close the connection
+    """
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, port=0, respond=acknowledge):
+        SocketServer.ThreadingTCPServer.__init__(
+            self, ("127.0.0.1", port), FakeMLLPHandler
+        )
+        self.respond = respond
+        self.received = []
+        self.connection_count = 0
+
+    @property
+    def port(self):
+        return self.server_address[1]
+
+    def start(self):
+        thread = threading.Thread(
+            target=self.serve_forever, kwargs={"poll_interval": 0.05}
+        )
+        thread.daemon = True
+        thread.start()
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+if __name__ == "__main__":
+    FakeMLLPResponder(port=int(sys.argv[1])).serve_forever()
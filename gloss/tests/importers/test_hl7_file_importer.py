@@ -0,0 +1,168 @@
+import os
+import shutil
+import tempfile
+from StringIO import StringIO
+
+import mock
+
+from gloss.tests.core import GlossTestCase
+from gloss.tests import test_messages
+from gloss.gloss_service_base import GlossService
+from gloss.importers import hl7_file_importer
+from gloss.models import Error
+
+
+def mllp_frame(message):
+    return "\x0b{}\x1c\r".format(message.strip().replace("\n", "\r"))
+
+
+class ReadMessagesTestCase(GlossTestCase):
+    def test_mllp_framed(self):
+        some_file = StringIO("".join([
+            mllp_frame(test_messages.ALLERGY),
+            mllp_frame(test_messages.PATIENT_MERGE),
+        ]))
+        messages = list(hl7_file_importer.read_messages(some_file))
+        self.assertEqual(len(messages), 2)
+        self.assertTrue(messages[0].startswith("MSH|^~\\&|ePMA"))
+        self.assertTrue(messages[1].endswith("MRG|50028000^^^UCLH|"))
+        self.assertEqual(len(messages[1].split("\r")), 4)
+
+    def test_new_line_separated(self):
+        some_file = StringIO("\n".join([
+            test_messages.ALLERGY, test_messages.PATIENT_MERGE
+        ]))
+        messages = list(hl7_file_importer.read_messages(some_file))
+        self.assertEqual(len(messages), 2)
+        self.assertEqual(len(messages[0].split("\r")), 4)
+
+    def test_segments_split_across_chunks(self):
+        some_file = StringIO(mllp_frame(test_messages.PATIENT_MERGE))
+        segments = list(
+            hl7_file_importer.read_segments(some_file, chunk_size=7)
+        )
+        self.assertEqual(len(segments), 4)
+        self.assertEqual(segments[-1], "MRG|50028000^^^UCLH|")
+
+
+class HL7FileTypeTestCase(GlossTestCase):
+    def setUp(self):
+        super(HL7FileTypeTestCase, self).setUp()
+        self.directory = tempfile.mkdtemp()
+        self.file_path = os.path.join(self.directory, "traffic.hl7")
+
+        with open(self.file_path, "w") as some_file:
+            some_file.write("".join([
+                mllp_frame(test_messages.ALLERGY),
+                mllp_frame(test_messages.PATIENT_MERGE),
+                mllp_frame(test_messages.NO_ALLERGY),
+            ]))
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+        super(HL7FileTypeTestCase, self).tearDown()
+
+    def get_service(self, subscriber):
+        return GlossService(
+            receiver=None,
+            importer=None,
+            subscribers=[subscriber],
+            issuing_source="uclh"
+        )
+
+    def test_process_in_batches(self):
+        subscriber = mock.MagicMock()
+        hl7_file = hl7_file_importer.HL7FileType(
+            self.directory, batch_size=2
+        )
+        self.assertEqual(hl7_file.process(self.get_service(subscriber)), 3)
+        self.assertEqual(subscriber.call_count, 3)
+        hospital_numbers = [
+            i[0][0].hospital_number for i in subscriber.call_args_list
+        ]
+        self.assertEqual(hospital_numbers, ["97995111", "50028000", "97995000"])
+
+        for call in subscriber.call_args_list:
+            self.assertEqual(call[1]["session"], self.session)
+
+    @mock.patch("gloss.importers.hl7_file_importer.session_scope")
+    def test_one_transaction_per_batch(self, session_scope):
+        hl7_file = hl7_file_importer.HL7FileType(
+            self.file_path, batch_size=2
+        )
+        hl7_file.process(self.get_service(mock.MagicMock()))
+        self.assertEqual(session_scope.call_count, 2)
+
+    def test_failed_batch_is_replayed_one_at_a_time(self):
+        def subscriber(message_container, gloss_service, session):
+            if message_container.hospital_number == "50028000":
+                raise ValueError("broken")
+            session.add(Error(error="saved", message=""))
+
+        hl7_file = hl7_file_importer.HL7FileType(
+            self.file_path, batch_size=10
+        )
+        hl7_file.process(self.get_service(subscriber))
+        self.assertEqual(hl7_file.error_count, 1)
+        errors = self.session.query(Error).all()
+        self.assertEqual(
+            sorted(i.error for i in errors), ["broken", "saved", "saved"]
+        )
+
+    def test_untranslatable_message(self):
+        # an admission without its PID
+        broken = "\r".join(
+            i for i in test_messages.INPATIENT_ADMISSION.strip().split("\n")
+            if not i.startswith("PID")
+        )
+
+        with open(self.file_path, "a") as some_file:
+            some_file.write(mllp_frame(broken))
+
+        subscriber = mock.MagicMock()
+        hl7_file = hl7_file_importer.HL7FileType(self.file_path)
+        self.assertEqual(hl7_file.process(self.get_service(subscriber)), 4)
+        self.assertEqual(subscriber.call_count, 3)
+        self.assertEqual(hl7_file.error_count, 1)
+        self.assertEqual(self.session.query(Error).count(), 1)
+
+    def test_ignored_message(self):
+        with open(self.file_path, "a") as some_file:
+            some_file.write(mllp_frame("MSH|^~\\&|nonsense"))
+
+        subscriber = mock.MagicMock()
+        hl7_file = hl7_file_importer.HL7FileType(self.file_path)
+        self.assertEqual(hl7_file.process(self.get_service(subscriber)), 4)
+        self.assertEqual(subscriber.call_count, 3)
+        self.assertEqual(hl7_file.ignored_count, 1)
+        self.assertEqual(hl7_file.error_count, 0)
+
+    def test_unsubscribed_patients_are_skipped(self):
+        subscriber = mock.MagicMock()
+        hl7_file = hl7_file_importer.HL7FileType(self.file_path)
+        hl7_file.hl7_importer = hl7_file_importer.HL7Importer(
+            filter_unsubscribed=True
+        )
+        self.assertEqual(hl7_file.process(self.get_service(subscriber)), 3)
+        self.assertFalse(subscriber.called)
+        self.assertEqual(
+            sum(hl7_file.hl7_importer.skipped_counts.values()), 3
+        )
+
+    def test_reports_as_it_goes(self):
+        # none of these are imported, we still report on them
+        with open(self.file_path, "w") as some_file:
+            some_file.write(mllp_frame("MSH|^~\\&|nonsense") * 5)
+
+        hl7_file = hl7_file_importer.HL7FileType(
+            self.file_path, report_every=2
+        )
+
+        with mock.patch.object(hl7_file, "report") as report:
+            report.side_effect = lambda: setattr(
+                hl7_file, "reported_count", hl7_file.read_count
+            )
+            hl7_file.process(self.get_service(mock.MagicMock()))
+
+        # after 2 and 4 messages, then once at the end
+        self.assertEqual(report.call_count, 3)
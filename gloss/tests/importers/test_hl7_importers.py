@@ -3,6 +3,10 @@ from gloss.tests.core import GlossTestCase
 from gloss.tests import test_messages
 from gloss.importers import hl7_importer
 from gloss import message_type as messages
+from gloss.models import (
+    Allergy, Error, GlossolaliaReference, subscribe, subscribed_patients,
+    unsubscribe
+)
 
 
 class BasicImportTestCase(object):
@@ -76,3 +80,101 @@ class TestAllergy(BasicImportTestCase, GlossTestCase):
 class TestWinPathResults(BasicImportTestCase, GlossTestCase):
     hl7_message = test_messages.RESULTS_MESSAGE
     gloss_message = messages.ResultMessage
+
+
+class TestFilterUnsubscribed(GlossTestCase):
+    def setUp(self):
+        super(TestFilterUnsubscribed, self).setUp()
+        self.service = mock.MagicMock()
+        self.service.issuing_source = "uclh"
+        self.importer = hl7_importer.HL7Importer(filter_unsubscribed=True)
+
+    def import_and_notify(self, hl7_message):
+        self.importer.import_and_notify(
+            test_messages.read_message(hl7_message), self.service
+        )
+
+    def test_get_hospital_numbers(self):
+        msg = test_messages.read_message(test_messages.PATIENT_MERGE)
+        self.assertEqual(
+            hl7_importer.get_hospital_numbers(msg), ["MV 19823", "50028000"]
+        )
+
+    def test_unsubscribed_patients_are_skipped(self):
+        self.import_and_notify(test_messages.INPATIENT_ADMISSION)
+        self.assertFalse(self.service.notify_subscribers.called)
+        self.assertEqual(self.importer.skipped_counts["ADT^A01"], 1)
+        self.assertEqual(self.session.query(GlossolaliaReference).count(), 0)
+
+    def test_unsubscribed_results_are_skipped(self):
+        self.import_and_notify(test_messages.COMPLEX_WINPATH_RESULT)
+        self.assertFalse(self.service.notify_subscribers.called)
+        self.assertEqual(self.importer.skipped_counts["ORU^R01"], 1)
+
+    def test_subscribed_patients_are_imported(self):
+        self.session.add(self.create_subrecord_with_id(Allergy, "50099878"))
+        self.session.commit()
+        self.import_and_notify(test_messages.INPATIENT_ADMISSION)
+        self.assertTrue(self.service.notify_subscribers.called)
+        self.assertFalse(self.importer.skipped_counts)
+
+    def test_merges_into_subscribed_patients_are_imported(self):
+        self.session.add(self.create_subrecord_with_id(Allergy, "50028000"))
+        self.session.commit()
+        self.import_and_notify(test_messages.PATIENT_MERGE)
+        self.assertTrue(self.service.notify_subscribers.called)
+
+    def test_subscribe(self):
+        self.assertFalse(subscribed_patients.contains("uclh", "50099878"))
+        subscribe("50099878", "http://some_end_point/", self.session, "uclh")
+
+        # nothing changes until the subscription is committed
+        self.assertFalse(subscribed_patients.contains("uclh", "50099878"))
+        self.session.commit()
+        self.assertTrue(subscribed_patients.contains("uclh", "50099878"))
+
+        unsubscribe("50099878", self.session, "uclh")
+        self.session.commit()
+        self.assertFalse(subscribed_patients.contains("uclh", "50099878"))
+
+    def test_rolled_back_subscription(self):
+        self.assertFalse(subscribed_patients.contains("uclh", "50099878"))
+        subscribe("50099878", "http://some_end_point/", self.session, "uclh")
+        self.session.rollback()
+        self.session.commit()
+        self.assertFalse(subscribed_patients.contains("uclh", "50099878"))
+
+    def test_filter_off_by_default(self):
+        importer = hl7_importer.HL7Importer()
+        importer.import_and_notify(
+            test_messages.read_message(test_messages.INPATIENT_ADMISSION),
+            self.service
+        )
+        self.assertTrue(self.service.notify_subscribers.called)
+
+    def test_subscriptions_from_other_processes(self):
+        # e.g. the patient is subscribed to by the api process
+        now = [0]
+
+        with mock.patch.object(subscribed_patients, "timer", lambda: now[0]):
+            self.assertFalse(subscribed_patients.contains("uclh", "50099878"))
+            self.session.add(
+                self.create_subrecord_with_id(Allergy, "50099878")
+            )
+            self.session.commit()
+            self.assertFalse(subscribed_patients.contains("uclh", "50099878"))
+
+            now[0] = subscribed_patients.ttl
+            self.import_and_notify(test_messages.INPATIENT_ADMISSION)
+
+        self.assertTrue(self.service.notify_subscribers.called)
+        self.assertFalse(self.importer.skipped_counts)
+
+    def test_filter_errors_are_saved(self):
+        with mock.patch.object(
+            self.importer, "is_subscribed", side_effect=ValueError("broken")
+        ):
+            with self.assertRaises(ValueError):
+                self.import_and_notify(test_messages.INPATIENT_ADMISSION)
+
+        self.assertEqual(self.session.query(Error).count(), 1)
@@ -2,7 +2,9 @@
 Unittests for gloss.api
 """
 import json
+from datetime import datetime
 from mock import patch, MagicMock
+from werkzeug.datastructures import MultiDict
 
 from gloss import models
 from gloss.tests import test_messages
@@ -102,6 +104,55 @@ class PatientQueryTestCase(GlossTestCase):
         self.assertEqual(data["hospital_number"], '555-yeppers')
 
 
+@patch("gloss.api.request")
+class ObservationQueryTestCase(GlossTestCase):
+    def setUp(self):
+        super(ObservationQueryTestCase, self).setUp()
+
+        for day in [1, 2]:
+            result = self.get_result('555-yeppers', 'uclh')
+            result.lab_number = str(day)
+            result.observation_datetime = datetime(2014, 1, day, 17, 0)
+
+            for observation in result.observations:
+                observation.observation_datetime = result.observation_datetime
+                observation.observation_value = str(day)
+
+            self.session.add(result)
+
+    def test_latest(self, mock_request):
+        mock_request.values = MultiDict()
+        data = json.loads(api.observation_query('555-yeppers').data)
+        self.assertEqual(data["status"], "success")
+        self.assertEqual(sorted(data["observations"].keys()), ["K", "NA"])
+        sodium = data["observations"]["NA"]
+        self.assertEqual(len(sodium), 1)
+        self.assertEqual(sodium[0]["observation_value"], "2")
+        self.assertEqual(
+            sodium[0]["observation_datetime"], "02/01/2014 17:00:00"
+        )
+
+    def test_test_code_and_limit(self, mock_request):
+        mock_request.values = MultiDict([("test_code", "K"), ("limit", "5")])
+        data = json.loads(api.observation_query('555-yeppers').data)
+        self.assertEqual(data["observations"].keys(), ["K"])
+        self.assertEqual(
+            [i["observation_value"] for i in data["observations"]["K"]],
+            ["2", "1"]
+        )
+
+    def test_not_found(self, mock_request):
+        mock_request.values = MultiDict()
+        data = json.loads(api.observation_query('not-found').data)
+        self.assertEqual(data["status"], "error")
+
+    def test_bad_limit(self, mock_request):
+        for limit in ["0", "-1", "many"]:
+            mock_request.values = MultiDict([("limit", limit)])
+            data = json.loads(api.observation_query('555-yeppers').data)
+            self.assertEqual(data["status"], "error")
+
+
 class DemographicsCreateTestCase(GlossTestCase):
     def test_unimplemented(self):
         resp = api.demographics_create()
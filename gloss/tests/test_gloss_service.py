@@ -0,0 +1,101 @@
+"""
+Unittests for gloss.gloss_service_base
+"""
+from mock import MagicMock, patch
+
+from gloss.tests.core import GlossTestCase
+from gloss.gloss_service_base import GlossService
+from gloss.message_type import MessageContainer
+from gloss.models import Error
+
+
+class NotifySubscribersTestCase(GlossTestCase):
+    def setUp(self):
+        super(NotifySubscribersTestCase, self).setUp()
+        self.subscribers = [MagicMock(), MagicMock()]
+        self.message_container = MessageContainer(
+            messages=[],
+            hospital_number="12341234",
+            issuing_source="uclh"
+        )
+
+    def get_service(self, **kwargs):
+        return GlossService(
+            receiver=None,
+            importer=None,
+            subscribers=self.subscribers,
+            issuing_source="uclh",
+            **kwargs
+        )
+
+    @patch("gloss.gloss_service_base.session_scope")
+    def test_unit_of_work(self, session_scope):
+        session = session_scope.return_value.__enter__.return_value
+        service = self.get_service(unit_of_work=True)
+        service.notify_subscribers(self.message_container)
+        self.assertEqual(session_scope.call_count, 1)
+
+        for subscriber in self.subscribers:
+            subscriber.assert_called_once_with(
+                self.message_container, service, session=session
+            )
+
+    @patch("gloss.gloss_service_base.session_scope")
+    def test_per_subscriber_isolation(self, session_scope):
+        service = self.get_service(unit_of_work=False)
+        service.notify_subscribers(self.message_container)
+        self.assertFalse(session_scope.called)
+
+        for subscriber in self.subscribers:
+            subscriber.assert_called_once_with(self.message_container, service)
+
+    @patch("gloss.gloss_service_base.session_scope")
+    def test_with_session(self, session_scope):
+        service = self.get_service(unit_of_work=True)
+        service.notify_subscribers(self.message_container, session="session")
+        self.assertFalse(session_scope.called)
+
+        for subscriber in self.subscribers:
+            subscriber.assert_called_once_with(
+                self.message_container, service, session="session"
+            )
+
+    def test_unit_of_work_from_settings(self):
+        service = self.get_service()
+
+        with patch("gloss.gloss_service_base.settings") as settings:
+            settings.UNIT_OF_WORK = True
+            self.assertTrue(service.unit_of_work)
+
+    def test_no_unit_of_work_by_default(self):
+        self.assertFalse(self.get_service().unit_of_work)
+
+    def test_unit_of_work_rolls_back_all_subscribers(self):
+        def save_error(message_container, gloss_service, session):
+            session.add(Error(error="saved", message=""))
+
+        broken = MagicMock(side_effect=ValueError("broken"))
+        self.subscribers = [save_error, broken]
+        service = self.get_service(unit_of_work=True)
+
+        with self.assertRaises(ValueError):
+            service.notify_subscribers(self.message_container)
+
+        self.assertEqual(self.session.query(Error).count(), 0)
+
+
+class MakeServiceTestCase(GlossTestCase):
+    def test_make_service(self):
+        receiver_service = MagicMock()
+        worker_service = MagicMock()
+        service = GlossService(
+            receiver=MagicMock(return_value=receiver_service),
+            importer=None,
+            subscribers=[],
+            issuing_source="uclh",
+            workers=[MagicMock(return_value=worker_service)]
+        )
+        self.assertEqual(service.make_service(), receiver_service)
+        worker_service.setServiceParent.assert_called_once_with(
+            receiver_service
+        )
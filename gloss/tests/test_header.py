@@ -0,0 +1,56 @@
+from unittest import TestCase
+
+import hl7
+
+from gloss.tests import test_messages
+from gloss.translators.hl7.header import peek_header
+from gloss.translators.hl7.segments import MSH, InpatientPID
+
+
+class PeekHeaderTestCase(TestCase):
+    def test_matches_parsed_messages(self):
+        for name, raw_message in test_messages.MESSAGE_TYPES.items():
+            raw_message = raw_message.strip("\r")
+            header = peek_header(raw_message)
+            parsed = hl7.parse(raw_message)
+            msh = MSH(parsed.segment("MSH"))
+            hospital_number = InpatientPID.hospital_number.get_value(
+                parsed.segment("PID")
+            )
+            self.assertEqual(header.message_type, msh.message_type, name)
+            self.assertEqual(header.trigger_event, msh.trigger_event, name)
+            self.assertEqual(
+                header.sending_application, msh.sending_application, name
+            )
+            self.assertEqual(
+                header.control_id, parsed.segment("MSH")[10][0], name
+            )
+            self.assertEqual(header.hospital_number, hospital_number, name)
+
+    def test_header(self):
+        header = peek_header(
+            test_messages.INPATIENT_ADMISSION.strip().replace("\n", "\r")
+        )
+        self.assertEqual(header.message_type, "ADT")
+        self.assertEqual(header.trigger_event, "A01")
+        self.assertEqual(header.sending_application, "CARECAST")
+        self.assertEqual(header.control_id, "PLW21231462945754065")
+        self.assertEqual(header.hospital_number, "50099878")
+        self.assertIsNone(header.duplicate_hospital_number)
+        self.assertTrue(header.msh.startswith("MSH|"))
+        self.assertNotIn("\r", header.msh)
+
+    def test_merge(self):
+        header = peek_header(
+            test_messages.PATIENT_MERGE.strip().replace("\n", "\r")
+        )
+        self.assertEqual(header.hospital_number, "MV 19823")
+        self.assertEqual(header.duplicate_hospital_number, "50028000")
+
+    def test_without_pid(self):
+        header = peek_header(u"MSH|^~\\&|WINPATH|UCLH|||||ORU^R01|1|P|2.3")
+        self.assertEqual(header.message_type, "ORU")
+        self.assertIsNone(header.hospital_number)
+
+    def test_not_hl7(self):
+        self.assertIsNone(peek_header(u"not a message"))
@@ -42,3 +42,36 @@ class InformationSourceTestCase(GlossTestCase):
         result_messages = self.information_source.result_information('test', '555-yeppers')
         self.assertEqual(result_messages.hospital_number, '555-yeppers')
         self.assertFalse(post_message.called)
+
+    def test_not_found_is_cached(self, post_message):
+        post_message.side_effect = exceptions.UpstreamPatientNotFound(
+            "We can't find any patients with that identifier"
+        )
+
+        for i in range(2):
+            with self.assertRaises(exceptions.UpstreamPatientNotFound):
+                self.information_source.patient_information('test', 'nope')
+
+        self.assertEqual(post_message.call_count, 1)
+
+    def test_unreachable_is_not_cached(self, post_message):
+        post_message.side_effect = exceptions.APIError(
+            "Unable to reach the external system"
+        )
+
+        for i in range(2):
+            with self.assertRaises(exceptions.APIError):
+                self.information_source.patient_information('test', 'nope')
+
+        self.assertEqual(post_message.call_count, 2)
+
+    @patch("gloss.information_source.upstream_queries")
+    def test_upstream_queries_are_coalesced(self, upstream_queries, post_message):
+        patient = self.create_patient('555-yeppers', 'test')
+        upstream_queries.do.side_effect = lambda *args: self.session.add(
+            patient
+        )
+        self.information_source.patient_information('test', '555-yeppers')
+        upstream_queries.do.assert_called_once_with(
+            ('test', '555-yeppers',), post_message, '555-yeppers'
+        )
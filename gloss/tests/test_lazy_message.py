@@ -0,0 +1,97 @@
+from unittest import TestCase
+
+import hl7
+import mock
+
+from gloss.importers.hl7_importer import HL7Importer
+from gloss.tests import test_messages
+from gloss.translators.hl7.lazy_message import LazyMessage
+
+
+def to_lists(some_container):
+    if isinstance(some_container, basestring):
+        return some_container
+    return [to_lists(i) for i in some_container]
+
+
+class LazyMessageTestCase(TestCase):
+    def test_same_as_hl7_parse(self):
+        for name, raw_message in test_messages.MESSAGE_TYPES.items():
+            parsed = hl7.parse(raw_message)
+            lazy = LazyMessage(raw_message)
+            self.assertEqual(len(parsed), len(lazy), name)
+            self.assertEqual(to_lists(parsed), to_lists(lazy), name)
+            self.assertEqual(unicode(parsed), unicode(lazy), name)
+
+    def test_fields_are_hl7_containers(self):
+        raw_message = test_messages.INPATIENT_ADMISSION.replace("\n", "\r")
+        parsed = hl7.parse(raw_message).segment("PID")
+        lazy = LazyMessage(raw_message).segment("PID")
+
+        for index in [0, 3, 5, 8]:
+            self.assertIs(type(parsed[index]), type(lazy[index]))
+            self.assertEqual(parsed[index], lazy[index])
+
+        self.assertEqual(lazy[3][0][0][0], "50099878")
+
+    def test_msh(self):
+        raw_message = test_messages.INPATIENT_ADMISSION.replace("\n", "\r")
+        msh = LazyMessage(raw_message).segment("MSH")
+        self.assertEqual(msh[1][0], "|")
+        self.assertEqual(msh[2][0], "^~\\&")
+        self.assertEqual(msh[9][0][1][0], "A01")
+
+    def test_only_splits_what_is_read(self):
+        lazy = LazyMessage(
+            test_messages.COMPLEX_WINPATH_RESULT.replace("\n", "\r")
+        )
+        pid = lazy.segment("PID")
+        self.assertIsNone(pid.field_texts)
+        pid[3]
+        self.assertEqual(pid.fields.count(None), len(pid.fields) - 1)
+        self.assertEqual(len(lazy.segment_cache), 1)
+
+    def test_segments(self):
+        lazy = LazyMessage(
+            test_messages.COMPLEX_WINPATH_RESULT.replace("\n", "\r")
+        )
+        parsed = hl7.parse(
+            test_messages.COMPLEX_WINPATH_RESULT.replace("\n", "\r")
+        )
+        self.assertEqual(
+            to_lists(lazy.segments("OBX")), to_lists(parsed.segments("OBX"))
+        )
+
+        with self.assertRaises(KeyError):
+            lazy.segment("MRG")
+
+    def test_create_ack(self):
+        raw_message = test_messages.PATIENT_UPDATE.replace("\n", "\r")
+        ack = LazyMessage(raw_message).create_ack(application="ELCID")
+        self.assertEqual(ack.segment("MSH")[3][0], "ELCID")
+        self.assertEqual(
+            ack.segment("MSA")[2][0],
+            hl7.parse(raw_message).segment("MSH")[10][0]
+        )
+
+    def test_import(self):
+        service = mock.MagicMock()
+        service.issuing_source = "uclh"
+
+        for name, raw_message in test_messages.MESSAGE_TYPES.items():
+            try:
+                expected = HL7Importer().import_message(
+                    hl7.parse(raw_message), service
+                )
+            except ValueError:
+                # some fixtures are messages we can't import
+                continue
+
+            result = HL7Importer().import_message(
+                LazyMessage(raw_message), service
+            )
+
+            if expected is None:
+                self.assertIsNone(result, name)
+            else:
+                self.assertEqual(expected.to_dict(), result.to_dict(), name)
@@ -215,3 +215,70 @@ class ResultMessageTestCase(TestCase):
         )
         result = message.to_dict()
         self.assertEqual(result["external_identifier"], "555.BC")
+
+
+class GeneratedMessageTypeTestCase(TestCase):
+    def test_fields_are_slotted(self):
+        message = message_type.PatientMessage(surname="Smith")
+        self.assertFalse(hasattr(message, "__dict__"))
+
+        with self.assertRaises(AttributeError):
+            message.not_a_field = 1
+
+    def test_fields_in_declared_order(self):
+        self.assertEqual(
+            message_type.InpatientAdmissionTransferMessage._message_fields,
+            (
+                "ward_code", "room_code", "bed_code", "external_identifier",
+                "datetime_of_admission", "datetime_of_discharge",
+                "admission_diagnosis", "datetime_of_transfer",
+            )
+        )
+
+    def test_missing_required_fields(self):
+        with self.assertRaises(ValueError) as e:
+            message_type.ObservationMessage(test_code="WCC")
+
+        self.assertIn("external_identifier", str(e.exception))
+
+    def test_unknown_fields_are_ignored(self):
+        message = message_type.PatientMergeMessage(new_id="1", some="thing")
+        self.assertEqual(message.to_dict(), {"new_id": "1"})
+
+    def test_nested_to_dict(self):
+        observation = message_type.ObservationMessage(
+            external_identifier="1", test_code="WCC"
+        )
+        message = message_type.ResultMessage(
+            lab_number="555", profile_code="BC", observations=[observation]
+        )
+        result = message.to_dict()
+        self.assertEqual(result["observations"][0]["test_code"], "WCC")
+        self.assertEqual(result["external_identifier"], "555.BC")
+
+    def test_field_values(self):
+        message = message_type.PatientMergeMessage(new_id="1")
+        self.assertEqual(message.field_values(), {"new_id": "1"})
+
+    def test_no_allergies(self):
+        message = message_type.AllergyMessage(no_allergies=True)
+        self.assertTrue(message.no_allergies)
+        self.assertIsNone(message.allergy_description)
+
+    def test_no_allergies_to_dict(self):
+        message = message_type.AllergyMessage(no_allergies=True)
+        self.assertEqual(message.to_dict(), {"no_allergies": True})
+
+    def test_allergies_to_dict(self):
+        fields = {
+            i: "something" for i in message_type.AllergyMessage._message_fields
+        }
+        fields["no_allergies"] = False
+        message = message_type.AllergyMessage(**fields)
+        self.assertEqual(message.to_dict(), fields)
+
+    def test_allergy_fields_required_with_allergies(self):
+        with self.assertRaises(ValueError):
+            message_type.AllergyMessage(
+                no_allergies=False, allergy_description="Penicillin"
+            )
@@ -0,0 +1,107 @@
+"""
+Unittests for gloss.mllp_client, these talk to a fake MLLP server over
+real sockets so don't use GlossTestCase which patches them out
+"""
+import socket
+from unittest import TestCase
+
+from gloss.exceptions import MLLPError
+from gloss.mllp_client import (
+    MLLPConnectionPool, get_control_id, get_acknowledged_id
+)
+from gloss.tests.fake_mllp_responder import FakeMLLPResponder, acknowledge
+
+
+def query(control_id):
+    return "MSH|^~\\&|elcid|UCLH|Unicare|UCLH|||QRY^A19|{}|P|2.4".format(
+        control_id
+    )
+
+
+class MLLPConnectionPoolTestCase(TestCase):
+    def setUp(self):
+        self.responses = {}
+        self.close_once = set()
+        self.responder = FakeMLLPResponder(respond=self.respond)
+        self.responder.start()
+        self.pool = MLLPConnectionPool(
+            "127.0.0.1", self.responder.port, size=2, timeout=1
+        )
+
+    def tearDown(self):
+        self.pool.close()
+        self.responder.stop()
+
+    def respond(self, message):
+        control_id = get_control_id(message)
+
+        if control_id in self.close_once:
+            self.close_once.remove(control_id)
+            return None
+
+        return self.responses.get(control_id, acknowledge(message))
+
+    def test_control_ids(self):
+        self.assertEqual(get_control_id(query("ELC1")), "ELC1")
+        self.assertEqual(get_acknowledged_id(acknowledge(query("ELC1"))), "ELC1")
+
+    def test_reuses_connections(self):
+        for control_id in ["ELC1", "ELC2", "ELC3"]:
+            response = self.pool.send_message(query(control_id))
+            self.assertEqual(get_acknowledged_id(response), control_id)
+
+        self.assertEqual(self.responder.connection_count, 1)
+        self.assertEqual(len(self.responder.received), 3)
+
+    def test_skips_stale_responses(self):
+        self.responses["ELC2"] = [
+            acknowledge(query("ELC1")), acknowledge(query("ELC2"))
+        ]
+        response = self.pool.send_message(query("ELC2"))
+        self.assertEqual(get_acknowledged_id(response), "ELC2")
+
+    def test_reconnects_when_closed(self):
+        self.pool.send_message(query("ELC1"))
+
+        # the server closes the connection rather than answering
+        self.close_once.add("ELC2")
+        response = self.pool.send_message(query("ELC2"))
+        self.assertEqual(get_acknowledged_id(response), "ELC2")
+        self.assertEqual(self.responder.connection_count, 2)
+
+    def test_unhealthy_connections_are_replaced(self):
+        self.responses["ELC1"] = [
+            acknowledge(query("ELC1")), acknowledge(query("ELC0"))
+        ]
+        self.pool.send_message(query("ELC1"))
+        self.pool.send_message(query("ELC2"))
+        self.assertEqual(self.responder.connection_count, 2)
+
+    def test_timeout(self):
+        self.pool.timeout = 0.1
+        self.responses["ELC1"] = []
+
+        with self.assertRaises(socket.timeout):
+            self.pool.send_message(query("ELC1"))
+
+        # a request that's timed out isn't retried
+        self.assertEqual(self.responder.connection_count, 1)
+        self.assertEqual(len(self.responder.received), 1)
+        self.assertTrue(self.pool.idle.empty())
+
+    def test_bad_response(self):
+        # the response doesn't have an MSA segment
+        self.responses["ELC1"] = query("ELC1")
+
+        with self.assertRaises(KeyError):
+            self.pool.send_message(query("ELC1"))
+
+        self.assertTrue(self.pool.idle.empty())
+        self.pool.send_message(query("ELC2"))
+        self.assertEqual(self.responder.connection_count, 2)
+
+    def test_closed(self):
+        self.responses["ELC1"] = None
+
+        with self.assertRaises(MLLPError):
+            self.pool.send_message(query("ELC1"))
@@ -31,7 +31,7 @@ class TestMockPatient(GlossTestCase):
         self.assertIsNone(result[0].date_of_death)
         self.assertIsNone(result[0].death_indicator)
 
-        for k, v in vars(result[0]).iteritems():
+        for k, v in result[0].field_values().iteritems():
             if not k == "date_of_death" and not k == "death_indicator":
                 print "k %s v %s" % (k, v)
                 self.assertIsNotNone(getattr(result[0], k))
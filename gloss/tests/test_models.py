@@ -1,8 +1,11 @@
 """
 Unittests for gloss.models
 """
+from contextlib import contextmanager
 from mock import patch
-from datetime import datetime, timedelta
+from datetime import datetime, date, timedelta
+
+from sqlalchemy import event
 
 from gloss.tests.core import GlossTestCase
 from gloss import message_type
@@ -11,8 +14,27 @@ from gloss.models import (
     GlossolaliaReference, Subscription, PatientIdentifier,
     is_subscribed, get_gloss_reference, session_scope,
     OutgoingMessage, get_next_message_id, patient_to_message_container,
-    InpatientLocation, subscribe, Merge, Patient
+    InpatientLocation, subscribe, Merge, Patient, identity_cache, is_known,
+    unsubscribe, InpatientAdmission, MessageIdAllocator, engine,
+    CanonicalReference, merge_patients, Allergy, Result, GlossSubrecord,
+    ResultHistory, save_result, Observation, save_allergies, update_patient
 )
+from gloss.utils import itersubclasses
+
+
+@contextmanager
+def count_queries():
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, *args):
+        statements.append(statement)
+
+    event.listen(engine, "before_cursor_execute", before_cursor_execute)
+
+    try:
+        yield statements
+    finally:
+        event.remove(engine, "before_cursor_execute", before_cursor_execute)
 
 
 class SessionScopeTestCase(GlossTestCase):
@@ -87,6 +109,73 @@ class GetGlossIdTestCase(GlossTestCase):
         self.assertTrue(get_gloss_reference("2342334", self.session) is None)
 
 
+class IdentityCacheTestCase(GlossTestCase):
+    def setUp(self):
+        super(IdentityCacheTestCase, self).setUp()
+        self.patient = self.create_patient("12341234", "uclh")
+        self.session.add(self.patient)
+        self.session.commit()
+
+    def get_cached(self, name):
+        return identity_cache.get_shared(("uclh", "12341234"), name)
+
+    def test_only_shared_after_commit(self):
+        get_gloss_reference("12341234", self.session)
+        self.assertIsNone(self.get_cached("gloss_reference_id"))
+        self.session.commit()
+        self.assertEqual(
+            self.get_cached("gloss_reference_id"),
+            self.patient.gloss_reference.id
+        )
+
+    def test_discarded_on_rollback(self):
+        is_known("12341234", self.session)
+        self.session.rollback()
+        self.session.commit()
+        self.assertIsNone(self.get_cached("is_known"))
+
+    def test_get_gloss_reference_from_cache(self):
+        get_gloss_reference("12341234", self.session)
+        self.session.commit()
+
+        with patch.object(self.session, "query") as query:
+            gloss_reference = get_gloss_reference("12341234", self.session)
+
+        self.assertFalse(query.called)
+        self.assertEqual(gloss_reference, self.patient.gloss_reference)
+
+    def test_is_subscribed_from_cache(self):
+        self.assertTrue(is_subscribed("12341234", self.session))
+        self.session.commit()
+
+        with patch.object(self.session, "query") as query:
+            self.assertTrue(is_subscribed("12341234", self.session))
+
+        self.assertFalse(query.called)
+
+    def test_invalidated_by_unsubscribe(self):
+        self.assertTrue(is_subscribed("12341234", self.session))
+        self.session.commit()
+        unsubscribe("12341234", self.session, "uclh")
+        self.assertFalse(is_subscribed("12341234", self.session))
+        self.session.commit()
+        self.assertEqual(self.get_cached("is_subscribed"), 0)
+
+    def test_subscriptions_expire(self):
+        # e.g. the patient is subscribed to by the api process
+        now = [0]
+        expiring_cache = identity_cache.expiring_cache
+
+        with patch.object(expiring_cache, "timer", lambda: now[0]):
+            self.assertTrue(is_subscribed("12341234", self.session))
+            self.session.commit()
+            self.session.query(Subscription).update(dict(active=False))
+            self.assertTrue(is_subscribed("12341234", self.session))
+
+            now[0] = expiring_cache.ttl
+            self.assertFalse(is_subscribed("12341234", self.session))
+
+
 class GetOutgoingMessageIdTestCase(GlossTestCase):
     def test_creates_a_unique_id(self):
         self.assertEqual(self.session.query(OutgoingMessage).count(), 0)
@@ -95,6 +184,22 @@ class GetOutgoingMessageIdTestCase(GlossTestCase):
         self.assertEqual(get_next_message_id(), 2)
         self.assertEqual(self.session.query(OutgoingMessage).count(), 1)
 
+    def test_reserves_blocks(self):
+        allocator = MessageIdAllocator(3)
+        other_process = MessageIdAllocator(3)
+
+        with patch.object(
+            allocator, "reserve_block", wraps=allocator.reserve_block
+        ) as reserve_block:
+            self.assertEqual(
+                [allocator.get_next() for i in range(4)], [1, 2, 3, 4]
+            )
+            self.assertEqual(reserve_block.call_count, 2)
+
+        self.assertEqual(other_process.get_next(), 7)
+        self.assertEqual(allocator.get_next(), 5)
+        self.assertEqual(self.session.query(OutgoingMessage).one().count, 9)
+
 
 class InpatientLocationTestCase(GlossTestCase):
 
@@ -146,6 +251,109 @@ class InpatientLocationTestCase(GlossTestCase):
 
         self.assertEqual(found_location, location)
 
+    def test_get_latest_locations(self):
+        discharged = self.get_inpatient_admission("hospital_number", "asd")
+        discharged.external_identifier = "discharged"
+        self.session.add(discharged)
+
+        for days_ago in [3, 1, 2]:
+            location = self.get_inpatient_location(discharged)
+            location.bed_code = str(days_ago)
+            location.datetime_of_transfer = datetime.now() - timedelta(days_ago)
+            self.session.add(location)
+
+        transferred = self.get_inpatient_location(self.inpatient_admission)
+        transferred.datetime_of_transfer = datetime.now() - timedelta(4)
+        current = self.get_inpatient_location(self.inpatient_admission)
+        self.session.add_all([transferred, current])
+        self.session.flush()
+
+        locations = InpatientLocation.get_latest_locations(
+            [self.inpatient_admission.id, discharged.id], self.session
+        )
+        self.assertEqual(locations[self.inpatient_admission.id], current)
+        self.assertEqual(locations[discharged.id].bed_code, "1")
+        self.assertEqual(
+            InpatientLocation.get_latest_locations([], self.session), {}
+        )
+
+
+class IndexUsageTestCase(GlossTestCase):
+    """ checks the query plans of the lookups we make for every message
+        use an index rather than scanning the table
+    """
+    def get_query_plan(self, query):
+        statement = query.statement.compile(dialect=self.session.bind.dialect)
+        params = [statement.params[i] for i in statement.positiontup]
+        dbapi_connection = self.session.connection().connection
+        rows = dbapi_connection.execute(
+            "EXPLAIN QUERY PLAN {}".format(statement), params
+        ).fetchall()
+        return " ".join(row[-1] for row in rows)
+
+    def assertUsesIndex(self, query, index_name):
+        plan = self.get_query_plan(query)
+        self.assertIn(index_name, plan)
+        self.assertNotIn("SCAN TABLE", plan)
+
+    def test_patient_identifier_lookup(self):
+        query = self.session.query(PatientIdentifier).filter(
+            PatientIdentifier.issuing_source == "uclh",
+            PatientIdentifier.identifier == "12341234"
+        )
+        self.assertUsesIndex(query, "sqlite_autoindex_patientidentifier")
+
+    def test_gloss_reference_lookup(self):
+        query = self.session.query(Subscription).filter(
+            Subscription.gloss_reference_id == 1
+        )
+        self.assertUsesIndex(query, "ix_subscription_gloss_reference_id")
+
+        query = self.session.query(Merge).filter(
+            Merge.gloss_reference_id == 1
+        )
+        self.assertUsesIndex(query, "ix_merge_gloss_reference_id")
+
+        query = self.session.query(Merge).filter(
+            Merge.new_reference_id == 1
+        )
+        self.assertUsesIndex(query, "ix_merge_new_reference_id")
+
+    def test_external_identifier_lookup(self):
+        query = self.session.query(InpatientAdmission).filter(
+            InpatientAdmission.external_identifier == "asd"
+        )
+        self.assertUsesIndex(
+            query, "ix_inpatientadmission_external_identifier"
+        )
+
+    def test_current_location_lookup(self):
+        query = self.session.query(InpatientLocation).filter(
+            InpatientLocation.inpatient_admission_id == 1,
+            InpatientLocation.datetime_of_transfer == None
+        )
+        self.assertUsesIndex(query, "ix_inpatientlocation_")
+
+    def test_observation_lookup(self):
+        query = self.session.query(Observation).filter(
+            Observation.gloss_reference_id == 1,
+            Observation.test_code.in_(["CRP"])
+        )
+        self.assertUsesIndex(
+            query,
+            "ix_observation_gloss_reference_id_test_code_observation_datetime"
+        )
+
+    def test_result_lookup(self):
+        query = self.session.query(Result).filter(
+            Result.gloss_reference_id == 1,
+            Result.lab_number == "98U000057",
+            Result.profile_code == "FBCY"
+        )
+        self.assertUsesIndex(
+            query, "ix_result_gloss_reference_id_lab_number_profile_code"
+        )
+
 
 class PatientToMessageContainersTestCase(GlossTestCase):
 
@@ -205,6 +413,76 @@ class PatientToMessageContainersTestCase(GlossTestCase):
         self.assertEqual(found_admission.datetime_of_discharge, None)
         self.assertEqual(found_admission.admission_diagnosis, "vertigo")
 
+    def add_admissions(self, hospital_number, count, with_locations=True):
+        for i in range(count):
+            admission = self.get_inpatient_admission(hospital_number, "uclh")
+            admission.external_identifier = "{0}-{1}".format(
+                hospital_number, i
+            )
+
+            if not with_locations:
+                self.session.add(admission)
+                continue
+
+            old_location = self.get_inpatient_location(admission)
+            old_location.datetime_of_transfer = datetime.now() - timedelta(1)
+            self.session.add_all([
+                admission, old_location, self.get_inpatient_location(admission)
+            ])
+
+    def test_query_count_is_constant_in_admissions(self):
+        query_counts = []
+
+        for hospital_number, admission_count in [("1", 1), ("2", 10)]:
+            self.session.add(self.create_patient(hospital_number, "uclh"))
+            self.session.add(self.get_allergy(hospital_number, "uclh"))
+            self.add_admissions(hospital_number, admission_count)
+            self.session.flush()
+            identity_cache.clear()
+
+            with count_queries() as statements:
+                message_container = patient_to_message_container(
+                    hospital_number, "uclh", self.session
+                )
+
+            self.assertEqual(
+                len(message_container.messages), admission_count + 2
+            )
+            query_counts.append(len(statements))
+
+        self.assertEqual(query_counts[0], query_counts[1])
+
+    def test_query_count_is_constant_without_locations(self):
+        query_counts = []
+
+        for hospital_number, admission_count in [("1", 1), ("2", 10)]:
+            self.session.add(self.create_patient(hospital_number, "uclh"))
+            self.add_admissions(
+                hospital_number, admission_count, with_locations=False
+            )
+            self.session.flush()
+            identity_cache.clear()
+
+            with count_queries() as statements:
+                message_container = patient_to_message_container(
+                    hospital_number, "uclh", self.session
+                )
+
+            self.assertEqual(
+                len(message_container.messages), admission_count + 1
+            )
+            self.assertIsNone(message_container.messages[-1].ward_code)
+            query_counts.append(len(statements))
+
+        self.assertEqual(query_counts[0], query_counts[1])
+
+    def test_unknown_patient(self):
+        message_container = patient_to_message_container(
+            "unknown", "uclh", self.session
+        )
+        self.assertEqual(message_container.messages, [])
+        self.assertEqual(message_container.hospital_number, "unknown")
+
     def test_some_models_are_not_serialised(self):
         """ we don't want Merge, Subscription or PatientIdentifier to be
             serialised
@@ -297,10 +575,434 @@ class TestMergeToMessage(GlossTestCase):
         self.assertEqual(messages[0].new_id, "50092917")
 
 
+class CanonicalReferenceTestCase(GlossTestCase):
+    def setUp(self):
+        super(CanonicalReferenceTestCase, self).setUp()
+        self.references = [GlossolaliaReference() for i in range(5)]
+        self.session.add_all(self.references)
+        self.session.flush()
+        self.a, self.b, self.c, self.d, self.e = [
+            i.id for i in self.references
+        ]
+
+    def merge(self, gloss_reference_id, new_reference_id):
+        merge = self.session.query(Merge).filter(
+            Merge.gloss_reference_id == gloss_reference_id
+        ).one_or_none()
+
+        if merge is None:
+            merge = Merge(gloss_reference_id=gloss_reference_id)
+
+        merge.new_reference_id = new_reference_id
+        self.session.add(merge)
+        self.session.flush()
+        return merge
+
+    def get_canonical(self, gloss_reference_id):
+        return CanonicalReference.get_canonical_reference_id(
+            gloss_reference_id, self.session
+        )
+
+    def assertMatchesMerges(self, gloss_reference_id):
+        """ the canonical reference should match the end of the merges
+            we get from following them in the database
+        """
+        latest_merge = Merge.get_latest_merge(
+            self.session, None, None, gloss_reference_id=gloss_reference_id
+        )
+
+        if latest_merge:
+            expected = latest_merge.new_reference_id
+        else:
+            expected = gloss_reference_id
+
+        self.assertEqual(self.get_canonical(gloss_reference_id), expected)
+
+    def test_unmerged(self):
+        self.assertEqual(self.get_canonical(self.a), self.a)
+        self.assertEqual(self.session.query(CanonicalReference).count(), 0)
+
+    def test_chain(self):
+        self.merge(self.a, self.b)
+        self.merge(self.b, self.c)
+        self.merge(self.c, self.d)
+
+        for gloss_reference_id in [self.a, self.b, self.c]:
+            self.assertEqual(self.get_canonical(gloss_reference_id), self.d)
+            self.assertMatchesMerges(gloss_reference_id)
+
+        self.assertEqual(self.get_canonical(self.d), self.d)
+
+    def test_merged_into_a_merged_reference(self):
+        self.merge(self.b, self.c)
+        self.merge(self.a, self.b)
+        self.assertEqual(self.get_canonical(self.a), self.c)
+        self.assertMatchesMerges(self.a)
+
+    def test_remerge(self):
+        self.merge(self.a, self.b)
+        self.merge(self.c, self.b)
+        self.merge(self.d, self.a)
+        self.merge(self.a, self.e)
+
+        self.assertEqual(self.get_canonical(self.a), self.e)
+        self.assertEqual(self.get_canonical(self.d), self.e)
+        self.assertEqual(self.get_canonical(self.c), self.b)
+
+        for gloss_reference_id in [self.a, self.c, self.d]:
+            self.assertMatchesMerges(gloss_reference_id)
+
+    def test_unmerge(self):
+        self.merge(self.b, self.c)
+        self.merge(self.a, self.b)
+        self.session.delete(self.merge(self.b, self.c))
+        self.session.flush()
+        self.assertEqual(self.get_canonical(self.b), self.b)
+        self.assertEqual(self.get_canonical(self.a), self.b)
+
+    def test_cycle(self):
+        self.merge(self.a, self.b)
+        self.merge(self.b, self.c)
+
+        with self.assertRaises(ValueError):
+            self.merge(self.c, self.a)
+
+    def test_self_merge(self):
+        with self.assertRaises(ValueError):
+            self.merge(self.a, self.a)
+
+    def test_query_count_is_constant_in_merges(self):
+        self.session.add_all([
+            PatientIdentifier(
+                gloss_reference_id=i, identifier=str(i), issuing_source="uclh"
+            ) for i in [self.a, self.b, self.c, self.d, self.e]
+        ])
+        query_counts = []
+
+        for new_reference_id in [self.b, self.c, self.d, self.e]:
+            self.merge(new_reference_id - 1, new_reference_id)
+
+            with count_queries() as statements:
+                messages = Merge._to_messages(
+                    None, "uclh", self.session, gloss_reference_id=self.a
+                )
+
+            self.assertEqual(messages[0].new_id, str(new_reference_id))
+            query_counts.append(len(statements))
+
+        self.assertEqual(len(set(query_counts)), 1)
+
+
+class MergePatientsTestCase(GlossTestCase):
+    def setUp(self):
+        super(MergePatientsTestCase, self).setUp()
+        self.old_patient = self.create_patient("1", "uclh")
+        self.new_patient = self.create_patient("2", "uclh")
+        self.old_reference = self.old_patient.gloss_reference
+        self.new_reference = self.new_patient.gloss_reference
+        self.session.add_all([
+            self.old_patient,
+            self.new_patient,
+            self.get_allergy("1", "uclh"),
+            self.get_result("1", "uclh"),
+            self.get_inpatient_admission("1", "uclh"),
+        ])
+        self.session.flush()
+
+    def get_gloss_reference_ids(self, model):
+        return sorted(i.gloss_reference_id for i in self.session.query(model))
+
+    def test_moves_subrecords(self):
+        merge_patients(self.old_reference, self.new_reference, self.session)
+        new_id = self.new_reference.id
+
+        for model in [Allergy, Result, InpatientAdmission]:
+            self.assertEqual(self.get_gloss_reference_ids(model), [new_id])
+
+        self.assertEqual(
+            self.get_gloss_reference_ids(Observation), [new_id, new_id]
+        )
+
+        # the new patient keeps their own demographics
+        self.assertEqual(
+            self.get_gloss_reference_ids(Patient),
+            [self.old_reference.id, new_id]
+        )
+        merge = self.session.query(Merge).one()
+        self.assertEqual(merge.gloss_reference, self.old_reference)
+        self.assertEqual(merge.new_reference, self.new_reference)
+
+    def test_leaves_identifiers(self):
+        merge_patients(self.old_reference, self.new_reference, self.session)
+        self.assertEqual(
+            get_gloss_reference("1", self.session), self.old_reference
+        )
+        messages = patient_to_message_container(
+            "1", "uclh", self.session
+        ).messages
+        self.assertEqual(
+            [i.__class__ for i in messages],
+            [message_type.PatientMessage, message_type.PatientMergeMessage]
+        )
+        self.assertEqual(messages[1].new_id, "2")
+
+    def test_moves_demographics_if_new_patient_has_none(self):
+        self.session.delete(self.new_patient)
+        merge_patients(self.old_reference, self.new_reference, self.session)
+        self.assertEqual(
+            self.get_gloss_reference_ids(Patient), [self.new_reference.id]
+        )
+
+    def test_one_per_gloss_reference(self):
+        # both patients are subscribed so the new patient keeps theirs
+        merge_patients(self.old_reference, self.new_reference, self.session)
+        self.assertEqual(
+            self.get_gloss_reference_ids(Subscription),
+            [self.old_reference.id, self.new_reference.id]
+        )
+
+        # otherwise the old patient's subscription is moved
+        self.session.query(Subscription).filter(
+            Subscription.gloss_reference == self.new_reference
+        ).delete()
+        merge_patients(self.old_reference, self.new_reference, self.session)
+        self.assertEqual(
+            self.get_gloss_reference_ids(Subscription),
+            [self.new_reference.id]
+        )
+
+    def test_one_update_per_table(self):
+        repointed = [
+            i for i in itersubclasses(GlossSubrecord)
+            if i.REPOINT_ON_MERGE and not i.ONE_PER_GLOSS_REFERENCE
+        ]
+
+        with count_queries() as statements:
+            merge_patients(
+                self.old_reference, self.new_reference, self.session
+            )
+
+        # and one to move the observations of the results
+        updates = [i for i in statements if i.startswith("UPDATE")]
+        self.assertEqual(len(updates), len(repointed) + 1)
+
+    def test_natural_key(self):
+        # the new patient already has the old patient's result
+        self.session.add(self.get_result("2", "uclh"))
+
+        for result in self.session.query(Result):
+            result.lab_number = "98U000057"
+
+        merge_patients(self.old_reference, self.new_reference, self.session)
+        self.assertEqual(
+            self.get_gloss_reference_ids(Result),
+            [self.old_reference.id, self.new_reference.id]
+        )
+
+
+class SaveResultTestCase(GlossTestCase):
+    def setUp(self):
+        super(SaveResultTestCase, self).setUp()
+        self.gloss_reference = self.create_subrecord_with_id(
+            Allergy, "1"
+        ).gloss_reference
+        self.session.add(self.gloss_reference)
+
+    def get_message(self, result_status, last_edited):
+        return message_type.ResultMessage(
+            lab_number="98U000057",
+            profile_code="FBCY",
+            result_status=result_status,
+            last_edited=last_edited,
+            observations=[{"test_code": "WCC"}]
+        )
+
+    def save(self, result_status, last_edited):
+        message = self.get_message(result_status, last_edited)
+        return save_result(message, self.gloss_reference, self.session)
+
+    def test_creates(self):
+        result, saved = self.save("INTERIM", datetime(2014, 11, 12, 16, 8))
+        self.assertTrue(saved)
+        result = self.session.query(Result).one()
+        self.assertEqual(result.gloss_reference, self.gloss_reference)
+        self.assertEqual(result.result_status, "INTERIM")
+        self.assertEqual(
+            [i.test_code for i in result.observations], ["WCC"]
+        )
+
+    def test_updates(self):
+        self.save("INTERIM", datetime(2014, 11, 12, 16, 8))
+        result, saved = self.save("FINAL", datetime(2014, 11, 12, 16, 9))
+        self.assertTrue(saved)
+        result = self.session.query(Result).one()
+        self.assertEqual(result.result_status, "FINAL")
+        self.assertEqual(result.last_edited, datetime(2014, 11, 12, 16, 9))
+        self.assertEqual(self.session.query(ResultHistory).count(), 0)
+
+    def test_ignores_stale(self):
+        self.save("FINAL", datetime(2014, 11, 12, 16, 9))
+        result, saved = self.save("INTERIM", datetime(2014, 11, 12, 16, 8))
+        self.assertFalse(saved)
+        self.assertEqual(
+            self.session.query(Result).one().result_status, "FINAL"
+        )
+
+    @patch("gloss.models.settings")
+    def test_history(self, settings_mock):
+        settings_mock.SAVE_RESULT_HISTORY = True
+        self.save("INTERIM", datetime(2014, 11, 12, 16, 8))
+        self.save("FINAL", datetime(2014, 11, 12, 16, 9))
+        history = self.session.query(ResultHistory).one()
+        self.assertEqual(history.result, self.session.query(Result).one())
+        self.assertEqual(history.result_status, "INTERIM")
+        self.assertEqual(history.last_edited, datetime(2014, 11, 12, 16, 8))
+
+
 def get_messages(cls, identifier, issuing_source, session):
     pass
 
 
+class UpdatePatientTestCase(GlossTestCase):
+    def setUp(self):
+        super(UpdatePatientTestCase, self).setUp()
+        self.patient = self.create_patient("1", "uclh")
+        self.gloss_reference = self.patient.gloss_reference
+        self.session.add(self.patient)
+        self.session.flush()
+
+    def update(self, **kwargs):
+        fields = dict(
+            first_name="Jane",
+            surname="Smith",
+            title="Ms",
+            date_of_birth=date(1983, 12, 12),
+            death_indicator=False
+        )
+        fields.update(kwargs)
+        message = message_type.PatientMessage(**fields)
+
+        with count_queries() as statements:
+            updated = update_patient(
+                message, self.gloss_reference, self.session
+            )
+
+        self.assertEqual(len(statements), 1)
+        return updated
+
+    def test_updates(self):
+        self.assertTrue(self.update(first_name="Mary"))
+        self.assertEqual(self.patient.first_name, "Mary")
+
+    def test_unchanged(self):
+        self.assertFalse(self.update())
+        self.assertIsNone(self.patient.updated)
+
+    def test_unknown(self):
+        self.session.query(Subscription).delete()
+        self.assertFalse(self.update(first_name="Mary"))
+        self.assertEqual(self.patient.first_name, "Jane")
+
+
+class SaveAllergiesTestCase(GlossTestCase):
+    def setUp(self):
+        super(SaveAllergiesTestCase, self).setUp()
+        self.allergy = self.get_allergy("1", "uclh")
+        self.gloss_reference = self.allergy.gloss_reference
+        self.session.add(self.allergy)
+        self.session.flush()
+
+    def get_message(self, **kwargs):
+        fields = self.get_allergy_dict()
+        fields.update(no_allergies=False, **kwargs)
+        return message_type.AllergyMessage(**fields)
+
+    def save(self, *messages):
+        return save_allergies(messages, self.gloss_reference, self.session)
+
+    def get_allergies(self):
+        return self.session.query(Allergy).order_by(Allergy.id).all()
+
+    def test_unchanged(self):
+        with count_queries() as statements:
+            self.assertFalse(self.save(self.get_message()))
+            self.session.flush()
+
+        self.assertEqual(len(statements), 1)
+        self.assertEqual(self.get_allergies(), [self.allergy])
+
+    def test_updates(self):
+        self.assertTrue(self.save(self.get_message(status_id="2")))
+        self.assertEqual(self.get_allergies(), [self.allergy])
+        self.assertEqual(self.allergy.status_id, "2")
+
+    def test_adds_and_deletes(self):
+        self.assertTrue(self.save(
+            self.get_message(allergen_reference="other"),
+        ))
+        allergies = self.get_allergies()
+        self.assertEqual(len(allergies), 1)
+        self.assertNotEqual(allergies[0].id, self.allergy.id)
+        self.assertEqual(allergies[0].allergen_reference, "other")
+
+    def test_repeated_key(self):
+        self.assertTrue(self.save(self.get_message(), self.get_message()))
+        self.assertEqual(len(self.get_allergies()), 2)
+        self.assertTrue(self.save(self.get_message()))
+        self.assertEqual(self.get_allergies(), [self.allergy])
+
+
+class ObservationTestCase(GlossTestCase):
+    def setUp(self):
+        super(ObservationTestCase, self).setUp()
+        self.results = []
+
+        for day in [1, 2, 3]:
+            result = self.get_result("1", "uclh")
+            result.lab_number = str(day)
+
+            for observation in result.observations:
+                observation.observation_datetime = datetime(2014, 1, day)
+
+            self.results.append(result)
+
+        self.session.add_all(self.results)
+        self.session.flush()
+        self.gloss_reference_id = self.results[0].gloss_reference_id
+
+    def test_to_messages(self):
+        with count_queries() as statements:
+            messages = Result.to_messages(
+                "1", "uclh", self.session,
+                gloss_reference_id=self.gloss_reference_id
+            )
+
+        # one for the results, one for all of their observations
+        self.assertEqual(len(statements), 2)
+        self.assertEqual(len(messages), 3)
+        self.assertEqual(
+            messages[0].observations,
+            self.get_result_dict()["observations"]
+        )
+
+    def test_get_latest(self):
+        latest = Observation.get_latest(self.gloss_reference_id, self.session)
+        self.assertEqual(sorted(latest.keys()), ["K", "NA"])
+        self.assertEqual(
+            [i.result for i in latest["NA"]], [self.results[2]]
+        )
+
+    def test_get_latest_limit(self):
+        latest = Observation.get_latest(
+            self.gloss_reference_id, self.session, test_codes=["K"], limit=2
+        )
+        self.assertEqual(latest.keys(), ["K"])
+        self.assertEqual(
+            [i.observation_datetime for i in latest["K"]],
+            [datetime(2014, 1, 3), datetime(2014, 1, 2)]
+        )
+
+
 class TestGetMessagesOverride(GlossTestCase):
 
     @patch("gloss.models.settings")
@@ -313,3 +1015,16 @@ class TestGetMessagesOverride(GlossTestCase):
         messages_mock.assert_called_once_with(
             Patient, "123", "uclh", self.session
         )
+
+    @patch("gloss.models.settings")
+    def test_unknown_patient_override(self, settings_mock):
+        settings_mock.MOCK_API = "gloss.tests.test_models.get_messages"
+        mock_str = "gloss.tests.test_models.get_messages"
+        with patch(mock_str) as messages_mock:
+            messages_mock.return_value = ["some message"]
+            container = patient_to_message_container(
+                "123", "uclh", self.session
+            )
+
+        self.assertTrue(messages_mock.called)
+        self.assertIn("some message", container.messages)
@@ -1,7 +1,11 @@
 from gloss.tests.core import GlossTestCase
 from mock import patch, MagicMock
-from gloss.serialisers.opal import send_to_opal, OpalJSONSerialiser
+from gloss.serialisers.opal import (
+    send_to_opal, OpalJSONSerialiser, OpalSender
+)
 from datetime import datetime, date
+from requests import ConnectionError, HTTPError
+from twisted.internet import defer, task
 import json
 
 
@@ -33,3 +37,94 @@ class OpalTestCase(GlossTestCase):
         self.mock_requests_post.assert_called_once_with(
             "fake", json=json.dumps({"a": "dict"})
         )
+
+
+class OpalSenderTestCase(GlossTestCase):
+    def setUp(self):
+        super(OpalSenderTestCase, self).setUp()
+        self.message_container = MagicMock()
+        self.message_container.to_dict.return_value = {"a": "dict"}
+        self.response = MagicMock(status_code=200)
+        self.mock_requests_post.return_value = self.response
+        self.clock = task.Clock()
+        self.clock.running = False
+        self.sender = OpalSender(
+            "fake", timeout=5, retries=2, backoff=1, reactor=self.clock
+        )
+        self.sender.defer_to_thread = defer.maybeDeferred
+
+    def get_result(self, deferred):
+        results = []
+        deferred.addCallback(results.append)
+        self.assertEqual(len(results), 1)
+        return results[0]
+
+    @patch("gloss.serialisers.opal.time.sleep")
+    def test_blocking_send(self, sleep):
+        self.sender.send(self.message_container)
+        self.mock_requests_post.assert_called_once_with(
+            "fake",
+            data=json.dumps({"a": "dict"}),
+            headers={"Content-Type": "application/json"},
+            timeout=5
+        )
+        self.assertFalse(sleep.called)
+
+    @patch("gloss.serialisers.opal.time.sleep")
+    def test_blocking_retries(self, sleep):
+        self.mock_requests_post.side_effect = [
+            ConnectionError("refused"), self.response
+        ]
+        self.sender.send(self.message_container)
+        self.assertEqual(self.mock_requests_post.call_count, 2)
+        sleep.assert_called_once_with(1)
+
+    @patch("gloss.serialisers.opal.time.sleep")
+    def test_blocking_gives_up(self, sleep):
+        self.mock_requests_post.side_effect = ConnectionError("refused")
+
+        with patch.object(self.sender, "log") as log:
+            self.sender.send(self.message_container)
+
+        self.assertEqual(self.mock_requests_post.call_count, 3)
+        self.assertEqual([i[0][0] for i in sleep.call_args_list], [1, 2])
+        self.assertTrue(log.error.called)
+
+    def test_retries_server_errors(self):
+        self.clock.running = True
+        broken = MagicMock(status_code=503)
+        broken.raise_for_status.side_effect = HTTPError("unavailable")
+        self.mock_requests_post.side_effect = [broken, self.response]
+        result = self.sender.send(self.message_container)
+        self.assertEqual(self.mock_requests_post.call_count, 1)
+        self.clock.advance(1)
+        self.assertEqual(self.mock_requests_post.call_count, 2)
+        self.assertEqual(self.get_result(result), self.response)
+
+    def test_async_backoff(self):
+        self.clock.running = True
+        self.mock_requests_post.side_effect = ConnectionError("refused")
+
+        with patch.object(self.sender, "log") as log:
+            result = self.sender.send(self.message_container)
+            self.clock.advance(1)
+            self.assertEqual(self.mock_requests_post.call_count, 2)
+            self.clock.advance(1)
+            self.assertEqual(self.mock_requests_post.call_count, 2)
+            self.clock.advance(1)
+            self.assertEqual(self.mock_requests_post.call_count, 3)
+
+        self.assertIsNone(self.get_result(result))
+        self.assertTrue(log.error.called)
+
+    def test_async_doesnt_retry_other_errors(self):
+        self.clock.running = True
+        self.mock_requests_post.side_effect = TypeError("broken")
+
+        with patch.object(self.sender, "log") as log:
+            result = self.sender.send(self.message_container)
+            self.clock.advance(10)
+
+        self.assertEqual(self.mock_requests_post.call_count, 1)
+        self.assertIsNone(self.get_result(result))
+        self.assertTrue(log.failure.called)
@@ -0,0 +1,177 @@
+"""
+Unittests for gloss.subscribers.outbox
+"""
+import datetime
+import json
+
+from mock import MagicMock, patch
+from requests import ConnectionError
+
+from gloss.tests.core import GlossTestCase
+from gloss.message_type import MessageContainer, PatientMergeMessage
+from gloss.models import OutboxMessage
+from gloss.subscribers.outbox import QueueAllMessages, OutboxDispatcher
+
+
+class OutboxTestCase(GlossTestCase):
+    def setUp(self):
+        super(OutboxTestCase, self).setUp()
+        self.subscriber = QueueAllMessages(end_point="http://opal/")
+        self.dispatcher = OutboxDispatcher(
+            "http://opal/", batch_size=2, max_attempts=2
+        )
+        self.response = MagicMock(status_code=200)
+        self.mock_requests_post.return_value = self.response
+
+    def queue(self, hospital_number, new_id="1"):
+        message_container = MessageContainer(
+            messages=[PatientMergeMessage(new_id=new_id)],
+            hospital_number=hospital_number,
+            issuing_source="uclh"
+        )
+        self.subscriber.notify(
+            message_container, None, session=self.session
+        )
+
+    def get_posted(self):
+        return [
+            [i["hospital_number"] for i in json.loads(c[1]["data"])]
+            for c in self.mock_requests_post.call_args_list
+        ]
+
+
+class QueueAllMessagesTestCase(OutboxTestCase):
+    def test_notify(self):
+        self.queue("1")
+        outbox_message = self.session.query(OutboxMessage).one()
+        self.assertEqual(outbox_message.end_point, "http://opal/")
+        self.assertEqual(outbox_message.hospital_number, "1")
+        self.assertEqual(outbox_message.issuing_source, "uclh")
+        self.assertEqual(outbox_message.attempts, 0)
+        self.assertFalse(outbox_message.dead)
+        self.assertEqual(
+            json.loads(outbox_message.payload)["messages"]["duplicate_patient"],
+            [{"new_id": "1"}]
+        )
+        self.assertFalse(self.mock_requests_post.called)
+
+    def test_unchanged(self):
+        message_container = MessageContainer(
+            messages=[PatientMergeMessage(new_id="1")],
+            hospital_number="1",
+            issuing_source="uclh"
+        )
+        message_container.changed = False
+        self.subscriber.notify(message_container, None, session=self.session)
+        self.assertEqual(self.session.query(OutboxMessage).count(), 0)
+
+
+class OutboxDispatcherTestCase(OutboxTestCase):
+    def test_dispatch_in_batches(self):
+        for hospital_number in ["1", "2", "3"]:
+            self.queue(hospital_number)
+
+        self.assertEqual(self.dispatcher.dispatch(), 3)
+        self.assertEqual(self.get_posted(), [["1", "2"], ["3"]])
+        self.assertEqual(self.session.query(OutboxMessage).count(), 0)
+
+    def test_single_message_batches(self):
+        dispatcher = OutboxDispatcher("http://opal/", batch_size=1)
+        self.queue("1")
+        self.assertEqual(dispatcher.dispatch(), 1)
+        posted = json.loads(self.mock_requests_post.call_args[1]["data"])
+        self.assertEqual(posted["hospital_number"], "1")
+
+    def test_only_dispatches_its_end_point(self):
+        QueueAllMessages(end_point="http://elsewhere/").notify(
+            MessageContainer([], "1", "uclh"), None, session=self.session
+        )
+        self.assertEqual(self.dispatcher.dispatch(), 0)
+        self.assertEqual(self.session.query(OutboxMessage).count(), 1)
+
+    def test_failed_batch_is_sent_one_at_a_time(self):
+        broken = MagicMock(status_code=500)
+        broken.raise_for_status.side_effect = ConnectionError("broken")
+        self.mock_requests_post.side_effect = [
+            broken, self.response, broken
+        ]
+        self.queue("1")
+        self.queue("2")
+
+        with patch.object(self.dispatcher, "log"):
+            self.assertEqual(self.dispatcher.dispatch(), 1)
+
+        self.assertEqual(self.get_posted(), [["1", "2"], ["1"], ["2"]])
+        outbox_message = self.session.query(OutboxMessage).one()
+        self.assertEqual(outbox_message.hospital_number, "2")
+        self.assertEqual(outbox_message.attempts, 1)
+        self.assertEqual(outbox_message.last_error, "broken")
+        self.assertIsNotNone(outbox_message.next_attempt)
+
+    def test_keeps_patient_order(self):
+        self.mock_requests_post.side_effect = ConnectionError("broken")
+        self.queue("1", new_id="a")
+
+        with patch.object(self.dispatcher, "log"):
+            self.assertEqual(self.dispatcher.dispatch(), 0)
+
+        self.mock_requests_post.side_effect = None
+        self.queue("1", new_id="b")
+        self.queue("2")
+
+        # the first message for patient 1 isn't due yet so the second
+        # waits for it, patient 2 is unaffected
+        self.assertEqual(self.dispatcher.dispatch(), 1)
+        self.assertEqual(self.get_posted()[-1], ["2"])
+
+        later = datetime.datetime.utcnow() + datetime.timedelta(hours=1)
+        batch = self.dispatcher.get_batch(self.session, later)
+        self.assertEqual(
+            [json.loads(i.payload)["messages"]["duplicate_patient"][0]["new_id"]
+             for i in batch],
+            ["a", "b"]
+        )
+
+    def test_waiting_patients_dont_starve_others(self):
+        dispatcher = OutboxDispatcher("http://opal/", batch_size=1)
+        now = datetime.datetime.utcnow()
+        later = now + datetime.timedelta(hours=1)
+
+        # more waiting retries than a batch, for the same and other patients
+        for hospital_number in ["1", "1", "2", "3"]:
+            self.queue(hospital_number)
+
+        for outbox_message in self.session.query(OutboxMessage).filter(
+            OutboxMessage.hospital_number != "1"
+        ):
+            outbox_message.next_attempt = later
+
+        self.queue("4")
+        batch = dispatcher.get_batch(self.session, now)
+        self.assertEqual([i.hospital_number for i in batch], ["1"])
+
+        self.session.query(OutboxMessage).filter(
+            OutboxMessage.hospital_number == "1"
+        ).update(dict(next_attempt=later))
+        batch = dispatcher.get_batch(self.session, now)
+        self.assertEqual([i.hospital_number for i in batch], ["4"])
+
+    def test_dead_letter(self):
+        self.mock_requests_post.return_value = MagicMock(status_code=400)
+        self.queue("1")
+        later = datetime.datetime.utcnow() + datetime.timedelta(hours=1)
+
+        with patch.object(self.dispatcher, "log") as log:
+            for now in [datetime.datetime.utcnow(), later]:
+                batch = self.dispatcher.get_batch(self.session, now)
+                self.dispatcher.deliver(batch, self.session, now)
+
+        outbox_message = self.session.query(OutboxMessage).one()
+        self.assertTrue(outbox_message.dead)
+        self.assertEqual(outbox_message.attempts, 2)
+        self.assertTrue(log.error.called)
+        self.assertEqual(self.dispatcher.dispatch(), 0)
+
+    def test_make_service(self):
+        service = self.dispatcher.make_service(None)
+        self.assertEqual(service.name, u"gloss-outbox-http://opal/")
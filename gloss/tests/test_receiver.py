@@ -1,17 +1,21 @@
 import hl7
 import mock
 
+from gloss.models import Allergy
 from gloss.receivers.mllp_multi_service import OhcReceiver
 from gloss.tests.core import GlossTestCase
 from gloss.translators.hl7.segments import MSH
-from test_messages import PATIENT_UPDATE, read_message
-from txHL7.receiver import HL7MessageContainer
+from test_messages import (
+    PATIENT_UPDATE, ORDER_MESSAGE, PATIENT_MERGE, read_message
+)
 
 class TestOhcReceiverTestCase(GlossTestCase):
     def test_ack_message(self):
-        container = HL7MessageContainer(PATIENT_UPDATE.replace("\n", "\r"))
         service = mock.MagicMock()
         ohc_receiver = OhcReceiver(service)
+        container = ohc_receiver.parseMessage(
+            PATIENT_UPDATE.replace("\n", "\r")
+        )
         ack = ohc_receiver.handleMessage(container).result
         msh = MSH(hl7.parse(ack).segment("MSH"))
         self.assertEqual(msh.sending_application, "ELCID")
@@ -20,3 +24,55 @@ class TestOhcReceiverTestCase(GlossTestCase):
 
     def test_get_codec(self):
         self.assertEqual('cp1252', OhcReceiver(mock.MagicMock()).getCodec())
+
+    def test_ignored_messages_are_dropped(self):
+        service = mock.MagicMock()
+        ohc_receiver = OhcReceiver(service)
+        container = ohc_receiver.parseMessage(
+            ORDER_MESSAGE.replace("\n", "\r")
+        )
+        ack = ohc_receiver.handleMessage(container).result
+        self.assertFalse(service.importer.called)
+        self.assertEqual(ohc_receiver.dropped_counts["ORM^O01"], 1)
+
+        # the ack was made without splitting up the message
+        self.assertEqual(container.message.segment_cache, {})
+        msa = hl7.parse(ack).segment("MSA")
+        self.assertEqual(msa[1][0], "AA")
+
+    def test_unknown_messages_are_dropped(self):
+        service = mock.MagicMock()
+        ohc_receiver = OhcReceiver(service)
+        container = ohc_receiver.parseMessage(
+            PATIENT_UPDATE.replace("\n", "\r").replace("ADT^A31", "ADT^Z99")
+        )
+        ohc_receiver.handleMessage(container)
+        self.assertFalse(service.importer.called)
+        self.assertEqual(ohc_receiver.dropped_counts["ADT^Z99"], 1)
+
+    def test_unsubscribed_patients_are_skipped(self):
+        service = mock.MagicMock()
+        service.issuing_source = "uclh"
+        ohc_receiver = OhcReceiver(service, filter_unsubscribed=True)
+        container = ohc_receiver.parseMessage(
+            PATIENT_UPDATE.replace("\n", "\r")
+        )
+        ack = ohc_receiver.handleMessage(container).result
+        self.assertFalse(service.importer.called)
+        self.assertEqual(ohc_receiver.skipped_counts["ADT^A31"], 1)
+        self.assertEqual(container.message.segment_cache, {})
+        msa = hl7.parse(ack).segment("MSA")
+        self.assertEqual(msa[1][0], "AA")
+
+    def test_merges_into_subscribed_patients_are_imported(self):
+        self.session.add(self.create_subrecord_with_id(Allergy, "50028000"))
+        self.session.commit()
+        service = mock.MagicMock()
+        service.issuing_source = "uclh"
+        ohc_receiver = OhcReceiver(service, filter_unsubscribed=True)
+        container = ohc_receiver.parseMessage(
+            PATIENT_MERGE.replace("\n", "\r")
+        )
+        ohc_receiver.handleMessage(container)
+        self.assertTrue(service.importer.called)
+        self.assertFalse(ohc_receiver.skipped_counts)
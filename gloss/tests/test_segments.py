@@ -2,12 +2,14 @@ from gloss.message_segments import *
 from unittest import TestCase
 from gloss.tests.test_messages import (
     FULL_BLOOD_COUNT, read_message, CYTOPATHOLOGY_RESULTS_MESSAGE,
-    ALLERGY, PATIENT_QUERY_RESPONSE, PATIENT_NOT_FOUND
+    ALLERGY, PATIENT_QUERY_RESPONSE, PATIENT_NOT_FOUND, PATIENT_UPDATE
 )
+from datetime import datetime, date
 from gloss.translators.hl7.hl7_translator import HL7Translator
 from gloss.translators.hl7.segments import (
-    MSH, ResultsPID, ResultsPV1, ORC, OBR, OBX, NTE, RepeatingField,
-    AllergiesPID, PV2, MSA
+    DATETIME_FORMAT, MSH, ResultsPID, ResultsPV1, ORC, OBR, OBX, NTE, RepeatingField,
+    AllergiesPID, PV2, MSA, SegmentCursor, InpatientPID, parse_datetime,
+    parse_date
 )
 from gloss.exceptions import TranslatorError
 
@@ -33,6 +35,123 @@ class TestSegments(TestCase):
         self.assertEqual(len(msg.results), 2)
 
 
+class TestSegmentCursor(TestCase):
+    def test_find_and_consume(self):
+        cursor = SegmentCursor(read_message(FULL_BLOOD_COUNT))
+        self.assertEqual(cursor.peek(), "MSH")
+        first_obx = cursor.find("OBX")
+        obx = cursor.consume(first_obx)
+        self.assertEqual(obx[0][0], "OBX")
+        self.assertEqual(cursor.position, first_obx + 1)
+        self.assertTrue(cursor.find("OBX") > first_obx)
+
+    def test_find_nothing_left(self):
+        cursor = SegmentCursor(read_message(FULL_BLOOD_COUNT))
+        cursor.consume(cursor.find("MSH"))
+
+        with self.assertRaises(KeyError):
+            cursor.find("MSH")
+
+    def test_large_repeating_message(self):
+        obxs = [
+            i for i in FULL_BLOOD_COUNT.strip().split("\n") if i.startswith("OBX")
+        ]
+        many_obxs = FULL_BLOOD_COUNT.strip() + "\n" + "\n".join(obxs * 100)
+        msg = WinPathResults(read_message(many_obxs))
+        self.assertEqual(
+            sum(len(i.obxs) for i in msg.results), len(obxs) * 101
+        )
+
+
+class TestHl7Fields(TestCase):
+    def setUp(self):
+        self.msh = MSH(read_message(FULL_BLOOD_COUNT).segment("MSH"))
+
+    def test_fields_are_memoized(self):
+        self.assertNotIn("message_datetime", vars(self.msh))
+        message_datetime = self.msh.message_datetime
+        self.assertEqual(message_datetime, datetime(2014, 11, 26, 15, 46))
+        self.assertIs(vars(self.msh)["message_datetime"], message_datetime)
+        self.assertIs(self.msh.message_datetime, message_datetime)
+
+    def test_fields_are_compiled_in_order(self):
+        self.assertEqual(MSH._fields, (
+            "trigger_event", "message_type", "message_datetime",
+            "sending_application", "sending_facility",
+        ))
+
+    def test_to_tuple(self):
+        self.assertEqual(self.msh.to_tuple(), (
+            "R01", "ORU", datetime(2014, 11, 26, 15, 46), "Corepoint", "TDL"
+        ))
+
+    def test_to_dict(self):
+        pid = InpatientPID(read_message(PATIENT_UPDATE).segment("PID"))
+        as_dict = pid.to_dict()
+        self.assertEqual(as_dict["hospital_number"], "50092915")
+        self.assertEqual(as_dict["surname"], "TESTING MEDCHART")
+        self.assertEqual(as_dict["sex"], "Male")
+        self.assertIsNone(as_dict["date_of_death"])
+        self.assertNotIn("segment", as_dict)
+
+
+class TestParseTimestamps(TestCase):
+    def test_parse_datetime(self):
+        self.assertEqual(
+            parse_datetime("201411261546"), datetime(2014, 11, 26, 15, 46)
+        )
+
+    def test_parse_datetime_with_seconds(self):
+        self.assertEqual(
+            parse_datetime("20141126154612"),
+            datetime(2014, 11, 26, 15, 46, 12)
+        )
+        self.assertEqual(
+            parse_datetime("20141126154612.25"),
+            datetime(2014, 11, 26, 15, 46, 12, 250000)
+        )
+
+    def test_parse_datetime_with_timezone(self):
+        self.assertEqual(
+            parse_datetime("20141126154612+0100"),
+            datetime(2014, 11, 26, 15, 46, 12)
+        )
+        self.assertEqual(
+            parse_datetime("201411261546-0500"),
+            datetime(2014, 11, 26, 15, 46)
+        )
+
+    def test_parse_datetime_same_as_strptime(self):
+        self.assertEqual(
+            parse_datetime("201602291200"),
+            datetime.strptime("201602291200", DATETIME_FORMAT)
+        )
+
+    def test_parse_datetime_invalid(self):
+        for invalid in [
+            "", "20141126", "2014112615461", "201411261546.5",
+            "201413261546", "2014112615AB", "201511190916043"
+        ]:
+            with self.assertRaises(ValueError):
+                parse_datetime(invalid)
+
+    def test_parse_datetime_is_cached(self):
+        parse_datetime.cache.clear()
+        parsed = parse_datetime("201411261546")
+        self.assertIn("201411261546", parse_datetime.cache)
+        self.assertIs(parse_datetime("201411261546"), parsed)
+
+    def test_parse_date(self):
+        self.assertEqual(parse_date("19870612"), date(1987, 6, 12))
+        self.assertEqual(parse_date("198706120000"), date(1987, 6, 12))
+        self.assertEqual(parse_date("19870612+0100"), date(1987, 6, 12))
+
+    def test_parse_date_invalid(self):
+        for invalid in ["", "1987061", "19871312", "1987O612"]:
+            with self.assertRaises(ValueError):
+                parse_date(invalid)
+
+
 class TestWithWrongMessage(TestCase):
     def test_with_wrong_message(self):
         class SomeMsg(HL7Translator):
@@ -1,5 +1,10 @@
 from unittest import TestCase
-from gloss.utils import itersubclasses, AbstractClass
+import threading
+import six
+from gloss.utils import (
+    itersubclasses, AbstractClass, RegistryMeta, get_subclass_registry,
+    LRUCache, lru_cache, TTLCache, SingleFlight
+)
 
 
 class UtilsTest(TestCase):
@@ -18,3 +23,162 @@ class UtilsTest(TestCase):
 
         results = {i for i in itersubclasses(A)}
         self.assertEqual(results, set([B, D]))
+
+    def test_subclass_registry(self):
+        class A(six.with_metaclass(RegistryMeta)):
+            pass
+
+        class B(A):
+            key = "b"
+
+        class C(B):
+            key = "c"
+
+        class D(A):
+            key = "b"
+
+        get_keys = lambda sub: [sub.key]
+        self.assertEqual(
+            get_subclass_registry(A, get_keys), {"b": B, "c": C}
+        )
+
+        class E(A):
+            key = "e"
+
+        # defining a new subclass invalidates the registry
+        self.assertEqual(
+            get_subclass_registry(A, get_keys), {"b": B, "c": C, "e": E}
+        )
+
+
+class LRUCacheTest(TestCase):
+    def test_evicts_least_recently_used(self):
+        cache = LRUCache(2)
+        cache.set("a", 1)
+        cache.set("b", 2)
+        self.assertEqual(cache.get("a"), 1)
+        cache.set("c", 3)
+        self.assertIn("a", cache)
+        self.assertNotIn("b", cache)
+        self.assertIn("c", cache)
+        self.assertEqual(len(cache), 2)
+
+    def test_get_default(self):
+        cache = LRUCache(2)
+        self.assertIsNone(cache.get("a"))
+        self.assertEqual(cache.get("a", 1), 1)
+
+    def test_lru_cache(self):
+        calls = []
+
+        @lru_cache(2)
+        def double(x):
+            calls.append(x)
+            return x * 2
+
+        self.assertEqual(double(1), 2)
+        self.assertEqual(double(1), 2)
+        self.assertEqual(calls, [1])
+        double(2)
+        double(3)
+        double(1)
+        self.assertEqual(calls, [1, 2, 3, 1])
+
+
+class TTLCacheTest(TestCase):
+    def setUp(self):
+        self.now = 100
+        self.cache = TTLCache(2, 10, timer=lambda: self.now)
+
+    def test_expires(self):
+        self.cache.set("a", 1)
+        self.now = 109
+        self.assertEqual(self.cache.get("a"), 1)
+        self.assertIn("a", self.cache)
+        self.now = 110
+        self.assertIsNone(self.cache.get("a"))
+        self.assertNotIn("a", self.cache)
+        self.assertEqual(len(self.cache), 0)
+
+    def test_max_size(self):
+        for key in ["a", "b", "c"]:
+            self.cache.set(key, key)
+
+        self.assertNotIn("a", self.cache)
+        self.assertEqual(self.cache.get("c"), "c")
+
+
+class WatchedEvent(object):
+    """ an Event that tells us when someone starts waiting on it
+    """
+    def __init__(self, waiting):
+        self.event = threading.Event()
+        self.waiting = waiting
+
+    def wait(self, timeout=None):
+        self.waiting.set()
+        return self.event.wait(timeout)
+
+    def set(self):
+        self.event.set()
+
+
+class SingleFlightTest(TestCase):
+    def setUp(self):
+        self.single_flight = SingleFlight()
+        self.started = threading.Event()
+        self.follower_waiting = threading.Event()
+        self.finish = threading.Event()
+        self.calls = []
+
+    def slow(self, result):
+        self.calls.append(result)
+        self.started.set()
+        self.finish.wait(5)
+
+        if isinstance(result, Exception):
+            raise result
+
+        return result
+
+    def run_concurrently(self, result):
+        results = []
+
+        def call():
+            try:
+                results.append(self.single_flight.do("key", self.slow, result))
+            except Exception as e:
+                results.append(e)
+
+        leader = threading.Thread(target=call)
+        leader.start()
+        self.started.wait(5)
+
+        # the leader's call is in flight, watch for the follower waiting
+        # on it before letting it finish
+        self.single_flight.calls["key"]["done"] = WatchedEvent(
+            self.follower_waiting
+        )
+        follower = threading.Thread(target=call)
+        follower.start()
+        self.follower_waiting.wait(5)
+        self.finish.set()
+        leader.join(5)
+        follower.join(5)
+        return results
+
+    def test_coalesces(self):
+        self.assertEqual(self.run_concurrently("a"), ["a", "a"])
+        self.assertEqual(self.calls, ["a"])
+        self.assertEqual(self.single_flight.calls, {})
+
+    def test_shares_errors(self):
+        error = ValueError("broken")
+        self.assertEqual(self.run_concurrently(error), [error, error])
+        self.assertEqual(len(self.calls), 1)
+
+    def test_calls_again_once_finished(self):
+        self.finish.set()
+        self.single_flight.do("key", self.slow, "a")
+        self.single_flight.do("key", self.slow, "b")
+        self.assertEqual(self.calls, ["a", "b"])
@@ -0,0 +1,115 @@
+"""
+Reads the handful of fields we route on straight from a raw HL7 message,
+without parsing the rest of it.
+
+The field numbers match those of the MSH, PID and MRG segments in
+gloss.translators.hl7.segments, e.g. MSH-9 for the message type.
+"""
+from collections import namedtuple
+
+MessageHeader = namedtuple("MessageHeader", [
+    "message_type",
+    "trigger_event",
+    "sending_application",
+    "control_id",
+    "hospital_number",
+    "duplicate_hospital_number",
+    "msh",
+])
+
+SEGMENT_SEPARATOR = u"\r"
+
+
+def get_field(fields, index):
+    if len(fields) > index:
+        return fields[index]
+    return u""
+
+
+def get_component(field, separator, index=0):
+    components = field.split(separator, index + 1)
+
+    if len(components) > index:
+        return components[index]
+    return u""
+
+
+def find_segment(raw_message, name, field_separator):
+    """ the first segment called name, or None, only the segment itself
+        is copied out of the message
+    """
+    start = raw_message.find(SEGMENT_SEPARATOR + name + field_separator)
+
+    if start == -1:
+        return None
+
+    start += 1
+    end = raw_message.find(SEGMENT_SEPARATOR, start)
+
+    if end == -1:
+        return raw_message[start:]
+    return raw_message[start:end]
+
+
+def get_identifier(raw_message, name, index, separators):
+    """ the first component of the first repetition of field index of
+        segment name, e.g. PID-3, or None
+    """
+    field_separator, component_separator, repetition_separator, \
+        subcomponent_separator = separators
+    segment = find_segment(raw_message, name, field_separator)
+
+    if segment is None:
+        return None
+
+    field = get_field(segment.split(field_separator, index + 1), index)
+    return get_component(
+        get_component(
+            get_component(field, repetition_separator),
+            component_separator
+        ),
+        subcomponent_separator
+    ) or None
+
+
+def peek_header(raw_message):
+    """ returns the MessageHeader for a raw message, or None if it
+        doesn't start with an MSH segment
+    """
+    raw_message = raw_message.lstrip(SEGMENT_SEPARATOR)
+
+    if not raw_message.startswith(u"MSH") or len(raw_message) < 8:
+        return None
+
+    field_separator = raw_message[3]
+    component_separator = raw_message[4]
+    repetition_separator = raw_message[5]
+    subcomponent_separator = raw_message[7]
+    separators = (
+        field_separator,
+        component_separator,
+        repetition_separator,
+        subcomponent_separator,
+    )
+
+    end = raw_message.find(SEGMENT_SEPARATOR)
+    msh = raw_message if end == -1 else raw_message[:end]
+
+    # MSH-1 is the field separator itself, so MSH-n is at n - 1
+    msh_fields = msh.split(field_separator, 10)
+    message_type = get_field(msh_fields, 8)
+    sending_application = get_field(msh_fields, 2)
+
+    return MessageHeader(
+        message_type=get_component(message_type, component_separator, 0),
+        trigger_event=get_component(message_type, component_separator, 1),
+        sending_application=get_component(
+            sending_application, repetition_separator
+        ),
+        control_id=get_field(msh_fields, 9),
+        hospital_number=get_identifier(raw_message, u"PID", 3, separators),
+        duplicate_hospital_number=get_identifier(
+            raw_message, u"MRG", 1, separators
+        ),
+        msh=msh,
+    )
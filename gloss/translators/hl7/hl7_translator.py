@@ -1,5 +1,6 @@
+import six
 from gloss.translators.hl7.segments import *
-from gloss.utils import itersubclasses
+from gloss.utils import RegistryMeta, get_subclass_registry
 from gloss.exceptions import TranslatorError
 
 # HL7 messages are defined as single or repeating segments
@@ -8,33 +9,62 @@ from gloss.exceptions import TranslatorError
 # inherit from theHL7Translator
 
 
-class HL7Translator(HL7Base):
+class HL7Translator(six.with_metaclass(RegistryMeta, HL7Base)):
     def __init__(self, raw_message):
-        message = copy(raw_message)
+        cursor = SegmentCursor(raw_message)
 
         for field in self.segments:
             if field.__class__ == RepeatingField:
-                found_repeaters, message = field.get(message)
-                setattr(self, field.section_name, found_repeaters)
+                setattr(self, field.section_name, field.get(cursor))
             else:
                 mthd = self.get_method_for_field(field.name())
                 try:
-                    setattr(self, field.name().lower(), mthd(message.segment(field.name())))
+                    segment = cursor.consume(cursor.find(field.name()))
+                    setattr(self, field.name().lower(), mthd(segment))
                 except KeyError:
                     raise TranslatorError("unable to find {0} for {1}".format(field.name(), raw_message))
-                message = clean_until(message, field.name())
+
+    @classmethod
+    def get_dispatch_keys(cls):
+        """ translators are looked up by message type, trigger event
+            and sending application, translators that don't declare a
+            sending application are registered under None
+        """
+        if not hasattr(cls, "message_type"):
+            return []
+
+        return [(
+            cls.message_type,
+            cls.trigger_event,
+            getattr(cls, "sending_application", None),
+        )]
+
+    @classmethod
+    def get_translator(cls, message_type, trigger_event, sending_application):
+        """ the translator for a message, falling back to one that
+            doesn't care about the sending application
+        """
+        registry = get_subclass_registry(
+            cls, lambda sub: sub.get_dispatch_keys()
+        )
+        translator = registry.get(
+            (message_type, trigger_event, sending_application,)
+        )
+
+        if translator is None:
+            translator = registry.get((message_type, trigger_event, None,))
+
+        return translator
 
     @classmethod
     def translate(cls, msg):
         msh = cls.get_msh(msg)
-        for message_type in itersubclasses(cls):
-            if msh.message_type == message_type.message_type:
-                if msh.trigger_event == message_type.trigger_event:
-                    if hasattr(message_type, "sending_application"):
-                        if(message_type.sending_application == msh.sending_application):
-                            return message_type(msg)
-                    else:
-                        return message_type(msg)
+        message_type = cls.get_translator(
+            msh.message_type, msh.trigger_event, msh.sending_application
+        )
+
+        if message_type:
+            return message_type(msg)
 
     @classmethod
     def get_msh(self, msg):
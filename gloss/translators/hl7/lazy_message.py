@@ -0,0 +1,175 @@
+"""
+A read only HL7 message that keeps the raw message and only splits it
+up as it's read.
+
+hl7.parse builds a container for every segment, field, repetition and
+component up front, most of which our segments never look at. A
+LazyMessage finds where each segment starts when it's created, a
+segment is split into fields the first time it's read and a field is
+only parsed when it's indexed.
+
+Parsed fields are the same hl7.containers that hl7.parse would have
+built, so anything that walks a message by index, e.g. Hl7Field and
+SegmentCursor, works on either.
+"""
+import hl7
+import six
+from hl7.parser import create_parse_plan, _split
+
+from gloss.translators.hl7.header import SEGMENT_SEPARATOR
+
+
+@six.python_2_unicode_compatible
+class LazySegment(object):
+    """ plan is hl7.parse's plan for splitting a segment into fields and
+        field_plan its plan for splitting a field
+    """
+    __slots__ = ("text", "plan", "field_plan", "field_texts", "fields")
+
+    def __init__(self, text, plan, field_plan):
+        self.text = text
+        self.plan = plan
+        self.field_plan = field_plan
+        self.field_texts = None
+        self.fields = None
+
+    def split(self):
+        if self.field_texts is None:
+            field_separator = self.plan.separator
+            field_texts = self.text.split(field_separator)
+
+            # like hl7.parse MSH-1 is the field separator and MSH-2 the
+            # encoding characters, neither are split any further
+            if field_texts[0] in ("MSH", "FHS"):
+                field_texts.insert(1, field_separator)
+
+            self.field_texts = field_texts
+            self.fields = [None] * len(field_texts)
+
+        return self.field_texts
+
+    def get_field(self, index):
+        field = self.fields[index]
+
+        if field is None:
+            text = self.field_texts[index]
+
+            if index in (1, 2) and self.field_texts[0] in ("MSH", "FHS"):
+                field = self.plan.factory.create_field(
+                    "" if index == 1 else self.plan.separator, [text]
+                )
+            else:
+                field = _split(text, self.field_plan)
+
+            self.fields[index] = field
+
+        return field
+
+    def __len__(self):
+        return len(self.split())
+
+    def __getitem__(self, index):
+        length = len(self.split())
+
+        if isinstance(index, slice):
+            return [self.get_field(i) for i in range(*index.indices(length))]
+
+        if index < 0:
+            index += length
+
+        if not 0 <= index < length:
+            raise IndexError("segment index out of range")
+
+        return self.get_field(index)
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield self.get_field(index)
+
+    def __str__(self):
+        return self.text
+
+
+@six.python_2_unicode_compatible
+class LazyMessage(object):
+    """ indexed like an hl7.Message, with segment and segments to find
+        segments by name
+    """
+    def __init__(self, raw_message):
+        if isinstance(raw_message, six.binary_type):
+            raw_message = raw_message.decode("utf-8")
+
+        self.raw_message = raw_message.strip()
+
+        # hl7.parse's plans for splitting segments and then fields
+        self.plan = create_parse_plan(self.raw_message).next()
+        self.field_plan = self.plan.next()
+        self.offsets = []
+        self.names = []
+        self.segment_cache = {}
+
+        field_separator = self.plan.separator
+        length = len(self.raw_message)
+        start = 0
+
+        while start <= length:
+            end = self.raw_message.find(SEGMENT_SEPARATOR, start)
+
+            if end == -1:
+                end = length
+
+            name_end = self.raw_message.find(field_separator, start, end)
+
+            if name_end == -1:
+                name_end = end
+
+            self.offsets.append((start, end,))
+            self.names.append(self.raw_message[start:name_end])
+            start = end + 1
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += len(self.offsets)
+
+        segment = self.segment_cache.get(index)
+
+        if segment is None:
+            start, end = self.offsets[index]
+            segment = LazySegment(
+                self.raw_message[start:end], self.plan, self.field_plan
+            )
+            self.segment_cache[index] = segment
+
+        return segment
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield self[index]
+
+    def segments(self, segment_id):
+        matches = [
+            self[index] for index, name in enumerate(self.names)
+            if name == segment_id
+        ]
+
+        if not matches:
+            raise KeyError('No %s segments' % segment_id)
+
+        return matches
+
+    def segment(self, segment_id):
+        return self.segments(segment_id)[0]
+
+    def create_ack(self, *args, **kwargs):
+        """ an ack only needs the MSH segment, so that's all we parse
+        """
+        start, end = self.offsets[0]
+        return hl7.parse(self.raw_message[start:end]).create_ack(
+            *args, **kwargs
+        )
+
+    def __str__(self):
+        return self.raw_message
@@ -1,71 +1,250 @@
-from datetime import datetime
-from collections import namedtuple
+from bisect import bisect_left
+import six
+from datetime import datetime, date
+from collections import namedtuple, defaultdict
 from gloss.translators.hl7.coded_values import (
     RELIGION_MAPPINGS, SEX_MAPPING, MARITAL_STATUSES_MAPPING,
     TEST_STATUS_MAPPING, ADMISSION_TYPES, OBX_STATUSES,
     ETHNICITY_MAPPING,
 )
-from copy import copy
+from gloss.utils import lru_cache
 
 DATETIME_FORMAT = "%Y%m%d%H%M"
 DATE_FORMAT = "%Y%m%d"
 
+# results feeds repeat the same timestamps across segments and messages
+TIMESTAMP_CACHE_SIZE = 4096
+
+
+def strip_timezone(value):
+    for sign in "+-":
+        index = value.find(sign)
+
+        if index != -1:
+            return value[:index]
+
+    return value
+
+
+@lru_cache(TIMESTAMP_CACHE_SIZE)
+def parse_datetime(value):
+    """
+        parses HL7 timestamps, YYYYMMDDHHMM[SS[.S[S[S[S]]]]][+/-ZZZZ]
+        by slicing rather than with strptime.
+
+        the timezone offset is dropped, like every other datetime we
+        store they're treated as local time
+    """
+    digits = strip_timezone(value)
+    fraction = ""
+
+    if "." in digits:
+        digits, fraction = digits.split(".", 1)
+
+    valid = digits.isdigit() and (
+        len(digits) == 12 and not fraction or
+        len(digits) == 14 and (not fraction or fraction.isdigit())
+    )
+
+    if not valid:
+        raise ValueError("unable to parse {} as a datetime".format(value))
+
+    return datetime(
+        int(digits[:4]),
+        int(digits[4:6]),
+        int(digits[6:8]),
+        int(digits[8:10]),
+        int(digits[10:12]),
+        int(digits[12:14] or 0),
+        int(fraction[:6].ljust(6, "0")),
+    )
+
+
+@lru_cache(TIMESTAMP_CACHE_SIZE)
+def parse_date(value):
+    """
+        parses HL7 dates, YYYYMMDD, if we're sent a full timestamp
+        we just use the date portion
+    """
+    digits = strip_timezone(value)
+
+    if len(digits) > 8:
+        return parse_datetime(value).date()
+
+    if len(digits) < 8 or not digits.isdigit():
+        raise ValueError("unable to parse {} as a date".format(value))
+
+    return date(int(digits[:4]), int(digits[4:6]), int(digits[6:8]))
+
 
 def get_field_name(message_row):
     return message_row[0][0].upper()
 
 
-def clean_until(message, field):
-    for index, row in enumerate(message):
-        if get_field_name(row) == field:
-            return message[index+1:]
+class SegmentCursor(object):
+    """
+        walks through the segments of a message by position rather
+        than copying and slicing the message as segments are consumed.
 
+        segment names are indexed once when the cursor is created, so
+        finding the next segment with a given name is a bisect over
+        the positions of the segments with that name
+    """
+    def __init__(self, message):
+        self.message = message
+        self.position = 0
+        self.names = []
+        self.positions = defaultdict(list)
 
-class Segment(object):
-    @classmethod
-    def name(cls):
-        return cls.__name__.upper()
+        for index, row in enumerate(message):
+            name = get_field_name(row)
+            self.names.append(name)
+            self.positions[name].append(index)
 
-    def __init__(self, segment):
-        self.segment = segment
+    def __len__(self):
+        return len(self.names) - self.position
+
+    def peek(self):
+        """ returns the name of the segment at the cursor
+        """
+        if self.position < len(self.names):
+            return self.names[self.position]
+
+    def find(self, name):
+        """ returns the position of the next segment called name, raises
+            a KeyError if there are none left
+        """
+        positions = self.positions.get(name, [])
+        index = bisect_left(positions, self.position)
+
+        if index == len(positions):
+            raise KeyError("No {} segments".format(name))
+
+        return positions[index]
+
+    def consume(self, position):
+        """ returns the segment at position and moves the cursor past it
+        """
+        self.position = position + 1
+        return self.message[position]
 
 
 class Hl7Field(object):
+    """
+        a field on a segment, found by walking the indexes into the
+        parsed segment.
+
+        the value is converted on first access and then stored on the
+        segment instance, so each field is parsed at most once per segment
+    """
+    creation_counter = 0
+
     def __init__(self, *indexes, **kwargs):
         self.indexes = indexes
         self.required = kwargs.pop("required", True)
 
-    def __get__(self, obj, cls):
-        result = obj.segment
+        # set by the SegmentMeta of the segment that declares the field
+        self.field_name = None
+        self.creation_counter = Hl7Field.creation_counter
+        Hl7Field.creation_counter += 1
+
+    def get_value(self, segment):
+        result = segment
+
+        if self.required:
+            for i in self.indexes:
+                result = result[i]
+            return result
 
         for i in self.indexes:
-            if not self.required:
-                if len(result) <= i or not result[i]:
-                    return None
+            if len(result) <= i or not result[i]:
+                return None
 
             result = result[i]
 
         return result
 
+    def convert(self, value):
+        return value
 
-class DateTimeHl7Field(Hl7Field):
-    def __get__(self, *args):
-        result = super(DateTimeHl7Field, self).__get__(*args)
+    def __get__(self, obj, cls):
+        if obj is None:
+            return self
+
+        result = self.convert(self.get_value(obj.segment))
+
+        # we're a non data descriptor so from now on the instance
+        # attribute is found before we are
+        obj.__dict__[self.field_name] = result
+        return result
 
-        if not self.required and not result:
-            return result
 
-        return datetime.strptime(result, DATETIME_FORMAT)
+class DateTimeHl7Field(Hl7Field):
+    def convert(self, value):
+        if not self.required and not value:
+            return value
+
+        return parse_datetime(value)
 
 
 class DateHl7Field(Hl7Field):
-    def __get__(self, *args):
-        result = super(DateHl7Field, self).__get__(*args)
+    def convert(self, value):
+        if not self.required and not value:
+            return value
 
-        if not self.required and not result:
-            return result
+        return parse_date(value)
+
+
+class SegmentMeta(type):
+    """
+        compiles the Hl7Fields declared on a segment and its parents
+        into _fields, a tuple of field names in the order they were
+        declared, and tells each field the name it lives under
+    """
+    def __new__(mcs, name, bases, attrs):
+        declared = []
 
-        return datetime.strptime(result, DATE_FORMAT).date()
+        for field_name, val in attrs.items():
+            if isinstance(val, Hl7Field):
+                val.field_name = field_name
+                declared.append(val)
+
+        declared.sort(key=lambda x: x.creation_counter)
+        fields = []
+
+        for base in bases:
+            for field_name in getattr(base, "_fields", ()):
+                if field_name not in attrs and field_name not in fields:
+                    fields.append(field_name)
+
+        fields.extend(i.field_name for i in declared)
+        attrs["_fields"] = tuple(fields)
+        return super(SegmentMeta, mcs).__new__(mcs, name, bases, attrs)
+
+
+class Segment(six.with_metaclass(SegmentMeta)):
+    @classmethod
+    def name(cls):
+        return cls.__name__.upper()
+
+    def __init__(self, segment):
+        self.segment = segment
+
+    def to_tuple(self):
+        """ returns the values of all declared fields in the
+            order they're declared in
+        """
+        return tuple(getattr(self, i) for i in self._fields)
+
+    def to_dict(self):
+        """ returns all declared fields and any values set when
+            the segment was constructed as a plain dict
+        """
+        result = {i: getattr(self, i) for i in self._fields}
+        result.update(
+            (k, v) for k, v in vars(self).iteritems() if not k == "segment"
+        )
+        return result
 
 
 class MSH(Segment):
@@ -77,12 +256,11 @@ class MSH(Segment):
 
 
 class MsaField(Hl7Field):
-    def __get__(self, *args):
-        result = super(MsaField, self).__get__(*args)
-        if result == "Call Successful":
+    def convert(self, value):
+        if value == "Call Successful":
             return None
         else:
-            return result
+            return value
 
 
 class MSA(Segment):
@@ -321,27 +499,26 @@ class RepeatingField(HL7Base):
                 result.append(segment.name().lower())
         return result
 
-    def get(self, passed_message):
+    def get(self, cursor):
+        """ consumes the repeated segments from a SegmentCursor
+            and returns them, if nothing is found the cursor is
+            left where it was
+        """
         found_repeaters = []
         kwargs = {}
-        message = copy(passed_message)
+        start = cursor.position
         found = True
 
-        while len(message) and found:
+        while len(cursor) and found:
             for index, segment in enumerate(self.segments):
                 if segment.__class__.__name__ == "RepeatingField":
-                    repeated_fields, stripped_message = segment.get(
-                        message
-                    )
-
-                    message = stripped_message
-                    kwargs[segment.section_name] = repeated_fields
+                    kwargs[segment.section_name] = segment.get(cursor)
                 else:
-                    msg_segment = message[0]
-                    if get_field_name(msg_segment) == segment.name():
+                    if cursor.peek() == segment.name():
                         mthd = self.get_method_for_field(segment.name())
-                        kwargs[segment.name().lower()] = mthd(msg_segment)
-                        message = clean_until(message, segment.name())
+                        kwargs[segment.name().lower()] = mthd(
+                            cursor.consume(cursor.position)
+                        )
 
                 if index == len(self.segments) - 1:
                     # we haven't found the response if we can't fulfill
@@ -354,7 +531,7 @@ class RepeatingField(HL7Base):
                     else:
                         found = False
 
-        if found_repeaters:
-            return (found_repeaters, message,)
-        else:
-            return (found_repeaters, passed_message,)
+        if not found_repeaters:
+            cursor.position = start
+
+        return found_repeaters
@@ -1,7 +1,11 @@
 """
 Generic Gloss Utilities
 """
+from collections import OrderedDict
+import functools
 import importlib
+import threading
+import time
 
 class AbstractClass(object):
     pass
@@ -29,6 +33,183 @@ def itersubclasses(cls, _seen=None):
                     yield sub
 
 
+class RegistryMeta(type):
+    """
+    Metaclass for classes that dispatch to their subclasses.
+
+    Defining a new class with this metaclass bumps the generation,
+    which invalidates any tables built by get_subclass_registry
+    """
+    generation = 0
+
+    def __init__(cls, name, bases, attrs):
+        super(RegistryMeta, cls).__init__(name, bases, attrs)
+        RegistryMeta.generation += 1
+
+
+_subclass_registries = {}
+
+
+def get_subclass_registry(cls, get_keys):
+    """
+    Returns a dict of key to subclass for every subclass of cls
+
+    get_keys is called with each subclass and returns the keys it
+    should be found under. If more than one subclass claims a key the
+    first one found by itersubclasses wins.
+
+    The table is built once and reused until a new subclass is defined
+    """
+    generation, registry = _subclass_registries.get(cls, (None, None,))
+
+    if generation != RegistryMeta.generation:
+        registry = {}
+        for sub in itersubclasses(cls):
+            for key in get_keys(sub):
+                registry.setdefault(key, sub)
+        _subclass_registries[cls] = (RegistryMeta.generation, registry,)
+
+    return registry
+
+
+class LRUCache(object):
+    """
+    A dict like cache that holds at most max_size items, when full the
+    least recently used item is evicted
+    """
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self.items = OrderedDict()
+
+    def __len__(self):
+        return len(self.items)
+
+    def __contains__(self, key):
+        return key in self.items
+
+    def get(self, key, default=None):
+        try:
+            value = self.items.pop(key)
+        except KeyError:
+            return default
+
+        self.items[key] = value
+        return value
+
+    def set(self, key, value):
+        self.items.pop(key, None)
+        self.items[key] = value
+
+        if len(self.items) > self.max_size:
+            self.items.popitem(last=False)
+
+    def pop(self, key, default=None):
+        return self.items.pop(key, default)
+
+    def clear(self):
+        self.items.clear()
+
+
+class TTLCache(LRUCache):
+    """
+    An LRUCache whose items expire ttl seconds after they're set
+    """
+    def __init__(self, max_size, ttl, timer=time.time):
+        super(TTLCache, self).__init__(max_size)
+        self.ttl = ttl
+        self.timer = timer
+
+    def __contains__(self, key):
+        missing = object()
+        return self.get(key, missing) is not missing
+
+    def get(self, key, default=None):
+        missing = object()
+        item = super(TTLCache, self).get(key, missing)
+
+        if item is missing:
+            return default
+
+        expires, value = item
+
+        if expires <= self.timer():
+            self.pop(key)
+            return default
+
+        return value
+
+    def set(self, key, value):
+        super(TTLCache, self).set(key, (self.timer() + self.ttl, value,))
+
+
+class SingleFlight(object):
+    """
+    Coalesces concurrent calls by key, while a call for a key is in flight
+    other callers with the same key wait for it and get its result, or
+    exception, rather than making the call again.
+
+    Only calls made by threads of the same process are coalesced
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.calls = {}
+
+    def do(self, key, some_fun, *args, **kwargs):
+        with self.lock:
+            call = self.calls.get(key)
+            in_flight = call is not None
+
+            if not in_flight:
+                call = self.calls[key] = {"done": threading.Event()}
+
+        if in_flight:
+            call["done"].wait()
+
+            if "error" in call:
+                raise call["error"]
+
+            return call["result"]
+
+        try:
+            call["result"] = some_fun(*args, **kwargs)
+        except Exception as e:
+            call["error"] = e
+            raise
+        finally:
+            with self.lock:
+                del self.calls[key]
+
+            call["done"].set()
+
+        return call["result"]
+
+
+def lru_cache(max_size):
+    """
+    Caches the results of a single argument function in an LRUCache,
+    exceptions are not cached
+    """
+    def wrapper(some_fun):
+        cache = LRUCache(max_size)
+        missing = object()
+
+        @functools.wraps(some_fun)
+        def cached(arg):
+            result = cache.get(arg, missing)
+
+            if result is missing:
+                result = some_fun(arg)
+                cache.set(arg, result)
+
+            return result
+
+        cached.cache = cache
+        cached.__wrapped__ = some_fun
+        return cached
+
+    return wrapper
+
+
 def import_from_string(some_str):
     module, func = some_str.rsplit(".", 1)
     imported_module = importlib.import_module(module)
@@ -1,15 +1,16 @@
 """
 Subscriptions for production deployment
 """
+from collections import Counter, defaultdict
+
 from gloss.models import (
-    atomic_method, get_or_create_identifier
+    atomic_method, get_or_create_identifier, identity_cache, merge_patients,
+    save_result, save_allergies, update_patient
 )
 from gloss.serialisers.opal import send_to_opal
 from gloss.conf import settings
 from twisted.logger import Logger
 from gloss.utils import AbstractClass
-import json
-from copy import copy
 from gloss.subscribers.base_subscriber import BaseSubscriber
 from gloss.message_type import (
     AllergyMessage, InpatientAdmissionMessage, PatientMergeMessage,
@@ -17,8 +18,8 @@ from gloss.message_type import (
     InpatientAdmissionTransferMessage
 )
 from gloss.models import (
-    InpatientAdmission, Merge, Allergy, Result, is_known, Patient,
-    create_or_update_inpatient_admission, create_or_update_inpatient_location,
+    InpatientAdmission, create_or_update_inpatient_admission,
+    create_or_update_inpatient_location,
     get_or_create_admission, get_or_create_location, get_or_create_identifier
 )
 from gloss.utils import itersubclasses
@@ -44,17 +45,69 @@ def db_message_processor(some_fun):
 class NotifyOpalWhenSubscribed(BaseSubscriber):
     """ checks whether we're subscribed, sends a message to an opal
         application if so
+
+        The subscriptions are subclasses with the message_types they
+        handle. They're instantiated once, when we are, along with a
+        table of which handle each message class. route_counts is how
+        many message containers each has been sent, containers nothing
+        handles are counted under None.
+
+        A handler's notify returns False if the messages didn't change
+        anything, if all of them do the container is marked as unchanged
+        so later subscribers needn't send it on.
     """
-    def notify(self, message_container, gloss_service):
-        sub_classes = itersubclasses(self.__class__)
-        message_classes = set(i.__class__ for i in message_container.messages)
+    def __init__(self):
+        self.handlers = []
+        self.routes = defaultdict(list)
+        self.route_counts = Counter()
 
-        for sub_class in sub_classes:
+        for sub_class in itersubclasses(self.__class__):
             cares_about = getattr(sub_class, "message_types", [])
-            relevent = message_classes.intersection(set(cares_about))
-            if relevent:
-                sc = sub_class()
-                sc.notify(message_container, gloss_service)
+
+            if cares_about:
+                handler = sub_class()
+                self.handlers.append(handler)
+
+                for message_class in set(cares_about):
+                    self.routes[message_class].append(handler)
+
+    def get_handlers(self, message_classes):
+        """ the handlers for the message classes in the order they'd
+            have been found by itersubclasses
+        """
+        if len(message_classes) == 1:
+            return self.routes.get(next(iter(message_classes)), [])
+
+        handlers = set()
+
+        for message_class in message_classes:
+            handlers.update(self.routes.get(message_class, []))
+
+        return [i for i in self.handlers if i in handlers]
+
+    def notify(self, message_container, gloss_service, session=None):
+        message_classes = set(i.__class__ for i in message_container.messages)
+        handlers = self.get_handlers(message_classes)
+
+        if not handlers:
+            self.route_counts[None] += 1
+
+        changed = []
+
+        for handler in handlers:
+            self.route_counts[handler.__class__.__name__] += 1
+
+            if session is None:
+                result = handler.notify(message_container, gloss_service)
+            else:
+                result = handler.notify(
+                    message_container, gloss_service, session=session
+                )
+
+            changed.append(result)
+
+        if changed and all(i is False for i in changed):
+            message_container.changed = False
 
 
 class UclhAllergySubscription(NotifyOpalWhenSubscribed):
@@ -62,21 +115,10 @@ class UclhAllergySubscription(NotifyOpalWhenSubscribed):
 
     @db_message_processor
     def notify(self, message_container, gloss_service, session=None, gloss_ref=None):
-        messages = message_container.messages
-        session.query(Allergy).filter(
-            Allergy.gloss_reference == gloss_ref
-        ).delete()
-
-        if messages:
-            for message in messages:
-                kwargs = vars(message)
-                allergy = Allergy(**kwargs)
-                allergy.gloss_reference = gloss_ref
-                session.add(allergy)
+        return save_allergies(message_container.messages, gloss_ref, session)
 
 
 class UclhMergeSubscription(NotifyOpalWhenSubscribed):
-    # TODO we should repoint all gloss subrecords
     message_types = [PatientMergeMessage]
 
     @db_message_processor
@@ -88,17 +130,20 @@ class UclhMergeSubscription(NotifyOpalWhenSubscribed):
         # we can't be sure about the consistency of when something is merged
         # accross all systems
         messages = message_container.messages
+        identity_cache.invalidate(
+            session,
+            message_container.issuing_source,
+            message_container.hospital_number
+        )
         for message in messages:
+            identity_cache.invalidate(session, "uclh", message.new_id)
             new_gloss_ref = get_or_create_identifier(
                 message.new_id,
                 session=session,
                 issuing_source="uclh"
             )
 
-            mrg = Merge(
-                new_reference=new_gloss_ref, gloss_reference=gloss_ref
-            )
-            session.add(mrg)
+            merge_patients(gloss_ref, new_gloss_ref, session)
 
 
 class UclhInpatientAdmissionSubscription(NotifyOpalWhenSubscribed):
@@ -182,35 +227,38 @@ class UclhWinPathResultSubscription(NotifyOpalWhenSubscribed):
 
     @db_message_processor
     def notify(self, message_container, gloss_service, session=None, gloss_ref=None):
-        messages = message_container.messages
-        for message in messages:
-            model_kwargs = copy(vars(message))
-            model_kwargs["observations"] = json.dumps(message.observations)
-            result = Result(**model_kwargs)
-            result.gloss_reference = gloss_ref
-            session.add(result)
+        # resends of results we already have a later version of don't
+        # change anything
+        saved = []
+
+        for message in message_container.messages:
+            _, result_saved = save_result(message, gloss_ref, session)
+            saved.append(result_saved)
+
+        return any(saved)
 
 
 class UclhPatientUpdateSubscription(NotifyOpalWhenSubscribed):
+    """ update_counts is how many messages changed a patient's
+        demographics and how many didn't
+    """
     message_types = [PatientMessage]
 
+    def __init__(self):
+        super(UclhPatientUpdateSubscription, self).__init__()
+        self.update_counts = Counter()
+
     @db_message_processor
     def notify(self, message_container, gloss_service, session=None, gloss_ref=None):
-        # theoretically we don't have to query for known here, if we don't know
-        # them, they won't be there so the update won't do anything
-        # let's be explicit for now
-        known = is_known(
-            message_container.hospital_number,
-            session,
-            message_container.issuing_source
-        )
-
-        if known:
-            for message in message_container.messages:
-                kwargs = vars(message)
-                q = session.query(Patient).filter_by(
-                    gloss_reference=gloss_ref
-                )
-                q.update(
-                    kwargs
-                )
+        # we only update patients we know about, update_patient checks
+        # that as part of the update
+        changed = False
+
+        for message in message_container.messages:
+            if update_patient(message, gloss_ref, session):
+                self.update_counts["updated"] += 1
+                changed = True
+            else:
+                self.update_counts["unchanged"] += 1
+
+        return changed
@@ -22,8 +22,12 @@ from gloss.models import (
     InpatientLocation, Allergy, Result, Patient, Subscription,
     PatientIdentifier
 )
-from gloss.message_type import PatientMessage, MessageContainer
-from sites.uch.subscribe.production import UclhPatientUpdateSubscription
+from gloss.message_type import (
+    PatientMessage, MessageContainer, InpatientAdmissionTransferMessage
+)
+from sites.uch.subscribe.production import (
+    UclhPatientUpdateSubscription, UclhInpatientTransferSubscription
+)
 from gloss.subscribers.send_all_messages import SendAllMessages
 
 
@@ -86,7 +90,7 @@ class TestInpatientAdmissionFlow(AbstractUCHFlowTestCase):
             }
         }
 
-        found = json.loads(self.mock_requests_post.call_args[1]["json"])
+        found = json.loads(self.mock_requests_post.call_args[1]["data"])
         self.assertEqual(expected, found)
         self.assertEqual(
             self.mock_requests_post.call_args[0][0], 'http://some_end_point/'
@@ -376,6 +380,20 @@ class TestMergeFlow(AbstractUCHFlowTestCase):
         ).count()
         self.assertEqual(exists, 1)
 
+    def test_repeated_merge(self):
+        self.import_message(self.raw_hl7)
+        self.import_message(self.raw_hl7)
+        self.assertEqual(self.session.query(Merge).count(), 1)
+
+    def test_subrecords_are_moved(self):
+        self.session.add(self.get_allergy("50028000", issuing_source="uclh"))
+        self.import_message(self.raw_hl7)
+        new_gloss_reference = get_gloss_reference(
+            "MV 19823", session=self.session, issuing_source="uclh"
+        )
+        allergy = self.session.query(Allergy).one()
+        self.assertEqual(allergy.gloss_reference_id, new_gloss_reference.id)
+
 
 class TestAllergyFlow(AbstractUCHFlowTestCase):
 
@@ -411,6 +429,25 @@ class TestAllergyFlow(AbstractUCHFlowTestCase):
         )
         self.assertEqual(gloss_ref, found_allergy.gloss_reference)
 
+    def test_unchanged_allergies(self):
+        self.import_message(MULTIPLE_ALLERGIES)
+        allergies = [
+            (i.id, i.created) for i in self.session.query(Allergy).order_by(
+                Allergy.id
+            )
+        ]
+        self.assertEqual(self.mock_requests_post.call_count, 1)
+
+        self.import_message(MULTIPLE_ALLERGIES)
+        self.assertEqual(allergies, [
+            (i.id, i.created) for i in self.session.query(Allergy).order_by(
+                Allergy.id
+            )
+        ])
+
+        # nothing changed so nothing's sent on
+        self.assertEqual(self.mock_requests_post.call_count, 1)
+
     def test_with_multiple_allergies(self):
         self.import_message(MULTIPLE_ALLERGIES)
         allergies = self.session.query(Allergy).all()
@@ -520,7 +557,7 @@ class TestResultsFlow(AbstractUCHFlowTestCase):
             }
         ]
         self.assertEqual(
-            expected_observations, json.loads(result.observations)
+            expected_observations, [i.to_dict() for i in result.observations]
         )
 
         self.assertEqual(
@@ -535,7 +572,7 @@ class TestResultsFlow(AbstractUCHFlowTestCase):
         self.assertEqual('RENAL PROFILE', result.profile_description)
         self.assertEqual('FINAL', result.result_status)
         downstream = json.loads(
-            self.mock_requests_post.call_args[1]["json"],
+            self.mock_requests_post.call_args[1]["data"],
         )
         downstream = downstream["messages"]["result"][0]
 
@@ -547,6 +584,20 @@ class TestResultsFlow(AbstractUCHFlowTestCase):
         self.assertEqual('RENAL PROFILE', downstream["profile_description"])
         self.assertEqual('FINAL', downstream["result_status"])
 
+    def test_stale_resends_are_not_sent(self):
+        self.import_message(RESULTS_MESSAGE)
+        self.assertEqual(self.mock_requests_post.call_count, 1)
+
+        # the same result last edited before the version we have
+        stale = RESULTS_MESSAGE.replace(
+            "||201401172258||CC|F", "||201401172200||CC|F"
+        )
+        self.assertNotEqual(stale, RESULTS_MESSAGE)
+        self.import_message(stale)
+        self.assertEqual(self.mock_requests_post.call_count, 1)
+        result = self.session.query(Result).one()
+        self.assertEqual(datetime(2014, 1, 17, 22, 58), result.last_edited)
+
     def test_complex_message(self):
         self.import_message(COMPLEX_WINPATH_RESULT)
         results = self.session.query(Result).all()
@@ -657,7 +708,7 @@ class TestResultsFlow(AbstractUCHFlowTestCase):
         ]
 
         self.assertEqual(
-            expected_observations_1, json.loads(result_1.observations)
+            expected_observations_1, [i.to_dict() for i in result_1.observations]
         )
 
         self.assertEqual('98U000057', result_1.lab_number)
@@ -727,7 +778,7 @@ class TestResultsFlow(AbstractUCHFlowTestCase):
         ]
 
         self.assertEqual(
-            expected_observations_2, json.loads(result_2.observations)
+            expected_observations_2, [i.to_dict() for i in result_2.observations]
         )
 
         self.assertEqual('98U000057', result_2.lab_number)
@@ -742,6 +793,12 @@ class TestResultsFlow(AbstractUCHFlowTestCase):
         self.assertEqual("DIFFERENTIAL", result_2.profile_description)
 
 
+    def test_resent_results_are_updated(self):
+        self.import_message(COMPLEX_WINPATH_RESULT)
+        self.import_message(COMPLEX_WINPATH_RESULT)
+        self.assertEqual(2, self.session.query(Result).count())
+
+
 class TestPatientUpdate(AbstractUCHFlowTestCase):
     def setUp(self):
         super(TestPatientUpdate, self).setUp()
@@ -760,6 +817,34 @@ class TestPatientUpdate(AbstractUCHFlowTestCase):
         self.assertEqual("British", patient.ethnicity)
         self.assertIsNone(patient.date_of_death)
 
+    def test_unchanged_patient_update(self):
+        self.import_message(PATIENT_UPDATE)
+        self.assertEqual(self.mock_requests_post.call_count, 1)
+        self.import_message(PATIENT_UPDATE)
+
+        # nothing changed so nothing's sent on
+        self.assertEqual(self.mock_requests_post.call_count, 1)
+
+    def test_update_counts(self):
+        notify_opal = NotifyOpalWhenSubscribed()
+        handler = notify_opal.routes[PatientMessage][0]
+        container = MessageContainer(
+            messages=[PatientMessage(
+                first_name="Mary",
+                surname="Smith",
+                date_of_birth=date(1983, 12, 12),
+                title="Ms"
+            )],
+            hospital_number="50092915",
+            issuing_source="uclh"
+        )
+        notify_opal.notify(container, self.service)
+        self.assertTrue(container.changed)
+        notify_opal.notify(container, self.service)
+        self.assertFalse(container.changed)
+        self.assertEqual(handler.update_counts["updated"], 1)
+        self.assertEqual(handler.update_counts["unchanged"], 1)
+
     def test_patient_death(self):
         self.import_message(PATIENT_DEATH)
         patient = self.session.query(Patient).one()
@@ -801,3 +886,50 @@ class TestPatientUpdate(AbstractUCHFlowTestCase):
         self.assertEqual(None, patient.middle_name)
         self.assertEqual("Ms", patient.title)
         self.assertEqual(date(1983, 12, 12), patient.date_of_birth)
+
+
+class TestRouting(AbstractUCHFlowTestCase):
+    def setUp(self):
+        super(TestRouting, self).setUp()
+        self.notify_opal = NotifyOpalWhenSubscribed()
+
+    def test_routes_built_once(self):
+        self.assertEqual(
+            [i.__class__ for i in self.notify_opal.routes[
+                InpatientAdmissionTransferMessage
+            ]],
+            [UclhInpatientTransferSubscription]
+        )
+        handler = self.notify_opal.routes[PatientMessage][0]
+        self.assertIsInstance(handler, UclhPatientUpdateSubscription)
+        self.assertIs(
+            self.notify_opal.get_handlers(set([PatientMessage]))[0], handler
+        )
+
+    def test_mixed_message_classes(self):
+        handlers = self.notify_opal.get_handlers(
+            set([PatientMessage, InpatientAdmissionTransferMessage])
+        )
+        self.assertEqual(
+            set(i.__class__ for i in handlers),
+            set([
+                UclhPatientUpdateSubscription,
+                UclhInpatientTransferSubscription
+            ])
+        )
+
+    def test_route_counts(self):
+        container = MessageContainer(
+            messages=[PatientMessage(surname="Smith")],
+            hospital_number="50092915",
+            issuing_source="uclh"
+        )
+        self.notify_opal.notify(container, self.service)
+        self.notify_opal.notify(container, self.service)
+        self.assertEqual(
+            self.notify_opal.route_counts["UclhPatientUpdateSubscription"], 2
+        )
+
+        container.messages = []
+        self.notify_opal.notify(container, self.service)
+        self.assertEqual(self.notify_opal.route_counts[None], 1)
@@ -29,7 +29,7 @@ class GlossServiceMaker(object):
             manage many services
         """
         gloss_service = reflect.namedObject(options['service'])
-        return gloss_service.receiver(gloss_service)
+        return gloss_service.make_service()
 
 
 serviceMaker = GlossServiceMaker()